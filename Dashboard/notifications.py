@@ -0,0 +1,118 @@
+"""
+Notification feed.
+
+The stock and finance notifications of a branch in one feed, oldest first. Both tables keep the branch
+that sees a notification, and a partial index on (branch, id) over the active rows answers every read.
+Clients poll with the cursor of their last page and only rows created since are read, so a poll costs the
+same however much history the tables hold. A notification is never reactivated, one raised again is a new
+row and always lands past the cursor. The cursor is the last stock and finance ids seen,
+``<stock id>.<finance id>``.
+
+The unread counters of a branch, its active notifications, are cached with the context values and dropped
+by the notification signals. ``compact`` keeps the tables small: cleared notifications are deleted after
+``RETENTION``, stock notifications whose inventory row and transfer are both gone are deleted at once.
+"""
+import time
+import datetime
+from django.db.models import F, Q
+from django.utils import timezone
+
+from finance.models import FinanceNotifications
+from inventory.models import StockNotifications
+from utils.context_cache import cached_value
+
+import logging
+logger = logging.getLogger(__name__)
+
+LIMIT = 50
+RETENTION = datetime.timedelta(days=90)
+CHUNK_SIZE = 1000
+
+COLUMNS = ('id', 'notification', 'created_at')
+# source: (model, its own fields in an item, renamed fields in an item)
+SOURCES = {
+    'stock': (StockNotifications, ('type', 'inventory_id'), {'stock_transfer_id': F('transfer_id')}),
+    'finance': (FinanceNotifications, ('transfer_id', 'expense_id', 'invoice_id'), {'type': F('notification_type')}),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_cursor(cursor):
+    """ {source: last id seen} of ``cursor``, None for no cursor. """
+    if not cursor:
+        return None
+    try:
+        ids = [int(part) for part in cursor.split('.')]
+    except ValueError:
+        ids = []
+    if len(ids) != len(SOURCES) or min(ids) < 0:
+        raise InvalidCursor(f'Invalid cursor {cursor!r}')
+    return dict(zip(SOURCES, ids))
+
+
+def format_cursor(last):
+    return '.'.join(str(last[source]) for source in SOURCES)
+
+
+def feed(branch_id, since=None, limit=LIMIT):
+    """
+    The active notifications of the branch created after the ``since`` cursor, at most ``limit`` of each
+    source, and the cursor to poll with next. Without a cursor, the latest ``limit`` of each source.
+    ``has_more`` is set when a source filled its page, the next poll picks up where it stopped.
+    """
+    cursor = parse_cursor(since)
+    items, last, has_more = [], {}, False
+    for source, (model, fields, renamed) in SOURCES.items():
+        active = model.objects.filter(branch_id=branch_id, status=True).values(*COLUMNS, *fields, **renamed)
+        if cursor is None:
+            rows = list(active.order_by('-id')[:limit])[::-1]
+            last[source] = rows[-1]['id'] if rows else 0
+        else:
+            rows = list(active.filter(id__gt=cursor[source]).order_by('id')[:limit])
+            last[source] = rows[-1]['id'] if rows else cursor[source]
+            has_more = has_more or len(rows) == limit
+        items.extend({'source': source, **row} for row in rows)
+
+    items.sort(key=lambda item: item['created_at'])
+    return {'items': items, 'cursor': format_cursor(last), 'has_more': has_more}
+
+
+def count_unread(branch_id):
+    counters = {
+        source: model.objects.filter(branch_id=branch_id, status=True).count()
+        for source, (model, *_) in SOURCES.items()
+    }
+    counters['total'] = sum(counters.values())
+    return counters
+
+
+def unread(branch_id):
+    """ {source: active notifications, 'total': all of them} for the branch, from the cache. """
+    return cached_value('unread_notifications', lambda: count_unread(branch_id), branch_id)
+
+
+def compact(now=None):
+    """ Deletes the cleared notifications older than ``RETENTION`` and the orphaned stock ones, in chunks. """
+    started = time.monotonic()
+    cutoff = (now or timezone.now()) - RETENTION
+    stale = {
+        'stock': Q(status=False, created_at__lt=cutoff) | Q(inventory__isnull=True, transfer__isnull=True),
+        'finance': Q(status=False, created_at__lt=cutoff),
+    }
+
+    deleted = {}
+    for source, (model, *_) in SOURCES.items():
+        deleted[source] = 0
+        while True:
+            ids = list(model.objects.filter(stale[source]).order_by('id').values_list('id', flat=True)[:CHUNK_SIZE])
+            if not ids:
+                break
+            deleted[source] += model.objects.filter(id__in=ids).delete()[0]
+
+    seconds = time.monotonic() - started
+    if any(deleted.values()):
+        logger.info(f'[Notifications] {deleted["stock"]} stock and {deleted["finance"]} finance notifications deleted in {seconds:.2f}s')
+    return {**deleted, 'seconds': seconds}
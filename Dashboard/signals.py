@@ -0,0 +1,71 @@
+from collections import Counter
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from finance.models import Customer, Invoice
+from finance.recurring import invoices_issued
+from inventory.models import Inventory
+from inventory.stock import stock_adjusted
+from . import summary
+
+
+@receiver(post_save, sender=Invoice)
+def invoice_counters(sender, instance, created, **kwargs):
+    if not created:
+        # status and payment status can change, neither is known from before
+        summary.drop(instance.branch_id, 'invoices', 'partial_invoices')
+        return
+    summary.add(
+        instance.branch_id,
+        invoices=1 if instance.status else 0,
+        invoices_today=1 if timezone.localdate(instance.issue_date) == timezone.localdate() else 0,
+        partial_invoices=1 if instance.payment_status == Invoice.PaymentStatus.PARTIAL else 0,
+    )
+
+
+@receiver(invoices_issued, sender=Invoice)
+def issued_invoice_counters(sender, invoices, **kwargs):
+    today = timezone.localdate()
+    counters = {}
+    for invoice in invoices:
+        branch = counters.setdefault(invoice.branch_id, Counter())
+        branch['invoices'] += 1 if invoice.status else 0
+        branch['invoices_today'] += 1 if timezone.localdate(invoice.issue_date) == today else 0
+        branch['partial_invoices'] += 1 if invoice.payment_status == Invoice.PaymentStatus.PARTIAL else 0
+    for branch_id, deltas in counters.items():
+        summary.add(branch_id, **deltas)
+
+
+@receiver(post_delete, sender=Invoice)
+def invoice_counters_removed(sender, instance, **kwargs):
+    summary.drop(instance.branch_id, 'invoices', 'invoices_today', 'partial_invoices')
+
+
+@receiver(post_save, sender=Customer)
+def customer_counters(sender, instance, created, **kwargs):
+    if created:
+        summary.add(instance.branch_id, customers=1, customers_today=1)
+
+
+@receiver(post_delete, sender=Customer)
+def customer_counters_removed(sender, instance, **kwargs):
+    summary.drop(instance.branch_id, 'customers', 'customers_today')
+
+
+@receiver(post_save, sender=Inventory)
+def inventory_counters(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        summary.add(instance.branch_id, stock_units=instance.quantity if instance.status else 0)
+    elif update_fields is None or {'quantity', 'status'} & set(update_fields):
+        summary.drop(instance.branch_id, 'stock_units')
+
+
+@receiver(post_delete, sender=Inventory)
+def inventory_counters_removed(sender, instance, **kwargs):
+    summary.drop(instance.branch_id, 'stock_units')
+
+
+@receiver(stock_adjusted, sender=Inventory)
+def adjusted_stock_counters(sender, branch_id, deltas, **kwargs):
+    summary.add(branch_id, stock_units=sum(deltas.values()))
@@ -0,0 +1,88 @@
+"""
+Dashboard counters.
+
+Each dashboard counter of a branch is cached under its own key for ``TIMEOUT``: invoices, today's
+invoices, open partial invoices, customers, today's customers and stock units. A missing counter is
+computed again with the others in three aggregate queries.
+
+Changes with a known effect are added to the cached counters with ``cache.incr`` once their transaction
+commits: a new invoice or customer, or a stock movement through ``inventory.stock``. Changes that cannot
+be added up are dropped for the next read to compute, such as an invoice changing status or an inventory
+row edited by hand. The short timeout bounds how long a counter can drift.
+"""
+import datetime
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from finance.models import Customer, Invoice
+from inventory.models import Inventory
+
+TIMEOUT = 5 * 60
+COUNTERS = ('invoices', 'invoices_today', 'partial_invoices', 'customers', 'customers_today', 'stock_units')
+# counted per day, the key carries the date
+DAILY = ('invoices_today', 'customers_today')
+
+
+def counter_key(branch_id, name, day):
+    if name in DAILY:
+        return f'dashboard:{branch_id}:{name}:{day}'
+    return f'dashboard:{branch_id}:{name}'
+
+
+def compute(branch_id, day):
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    end = start + datetime.timedelta(days=1)
+
+    counters = Invoice.objects.filter(branch_id=branch_id).aggregate(
+        invoices=Count('id', filter=Q(status=True)),
+        invoices_today=Count('id', filter=Q(issue_date__gte=start, issue_date__lt=end)),
+        partial_invoices=Count('id', filter=Q(payment_status=Invoice.PaymentStatus.PARTIAL)),
+    )
+    counters.update(Customer.objects.filter(branch_id=branch_id).aggregate(
+        customers=Count('id'),
+        customers_today=Count('id', filter=Q(date=day)),
+    ))
+    counters.update(Inventory.objects.filter(branch_id=branch_id, status=True).aggregate(
+        stock_units=Sum('quantity', default=0),
+    ))
+    return counters
+
+
+def summary(branch_id):
+    """ The dashboard counters of the branch, from the cache unless one of them is missing. """
+    day = timezone.localdate()
+    keys = {name: counter_key(branch_id, name, day) for name in COUNTERS}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        return {name: cached[key] for name, key in keys.items()}
+
+    counters = compute(branch_id, day)
+    cache.set_many({keys[name]: counters[name] for name in COUNTERS}, TIMEOUT)
+    return counters
+
+
+def add(branch_id, **deltas):
+    """ Adds ``deltas`` to the cached counters of the branch once the current transaction commits. """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if branch_id and deltas:
+        transaction.on_commit(lambda: _incr(branch_id, deltas))
+
+
+def _incr(branch_id, deltas):
+    day = timezone.localdate()
+    for name, delta in deltas.items():
+        try:
+            cache.incr(counter_key(branch_id, name, day), delta)
+        except ValueError:
+            # not cached, the next read computes it
+            pass
+
+
+def drop(branch_id, *names):
+    """ Drops cached counters of the branch, all by default, once the current transaction commits. """
+    if branch_id:
+        day = timezone.localdate()
+        keys = [counter_key(branch_id, name, day) for name in names or COUNTERS]
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,9 @@
+from celery import shared_task
+
+
+@shared_task
+def compact_notifications():
+    """ Deletes the stale stock and finance notifications, see ``Dashboard.notifications``. """
+    from .notifications import compact
+
+    return compact()
@@ -1,3 +1,150 @@
+from decimal import Decimal
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from . import summary
+
+
+class DashboardSummaryTest(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+        from finance.models import Currency, Customer
+        from inventory.models import Product, Inventory
+        from inventory import stock_push
+
+        cache.clear()
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.customer = Customer.objects.create(name='Walk in', address='-', id_number='-', branch=self.branch)
+        self.inventory = Inventory.objects.create(
+            branch=self.branch,
+            product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+            cost=Decimal('4.00'),
+            price=Decimal('10.00'),
+            quantity=10,
+            stock_level_threshold=0,
+        )
+
+    def test_counters_follow_commits_without_a_recompute(self):
+        from finance.models import Invoice
+        from inventory import stock
+
+        self.assertEqual(summary.summary(self.branch.id), {
+            'invoices': 0, 'invoices_today': 0, 'partial_invoices': 0, 'customers': 1, 'customers_today': 1, 'stock_units': 10,
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Invoice.objects.create(
+                invoice_number='INVH-0001',
+                customer=self.customer,
+                issue_date=timezone.now(),
+                branch=self.branch,
+                user=self.user,
+                currency=self.currency,
+                amount=Decimal('30.00'),
+                amount_paid=Decimal('10.00'),
+                amount_due=Decimal('20.00'),
+                payment_status=Invoice.PaymentStatus.PARTIAL,
+                products_purchased='-',
+                payment_terms='cash',
+            )
+            stock.adjust({self.inventory.id: -3})
+
+        with self.assertNumQueries(0):
+            counters = summary.summary(self.branch.id)
+        self.assertEqual((counters['invoices'], counters['invoices_today'], counters['partial_invoices']), (1, 1, 1))
+        self.assertEqual(counters['stock_units'], 7)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('dashboard:summary')).json(), counters)
+
+    def test_inactive_stock_is_not_counted(self):
+        from inventory.models import Inventory
+        from inventory import stock
+
+        Inventory.objects.filter(id=self.inventory.id).update(status=False)
+        self.assertEqual(summary.summary(self.branch.id)['stock_units'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.adjust({self.inventory.id: -3})
+        with self.assertNumQueries(0):
+            self.assertEqual(summary.summary(self.branch.id)['stock_units'], 0)
+
+
+class NotificationFeedTest(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+        from inventory.models import Product, Inventory
+
+        cache.clear()
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.other = Branch.objects.create(company=company, name='Bulawayo')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.inventory = Inventory.objects.create(
+            branch=self.branch,
+            product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+            cost=Decimal('4.00'),
+            price=Decimal('10.00'),
+            quantity=10,
+            stock_level_threshold=0,
+        )
+        self.client.force_login(self.user)
+
+    def notify(self, branch, text, status=True):
+        from finance.models import FinanceNotifications
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return FinanceNotifications.objects.create(branch=branch, notification=text, status=status, notification_type='Invoice')
+
+    def test_polls_return_what_is_new_since_the_cursor(self):
+        from inventory.models import StockNotifications
+        from . import notifications
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockNotifications.objects.create(inventory=self.inventory, notification='Charger is low', status=True, type='stock level')
+        self.notify(self.branch, 'Invoice INV-1')
+        self.notify(self.branch, 'Invoice INV-0', status=False)
+        self.notify(self.other, 'Invoice INV-2')
+
+        page = self.client.get(reverse('dashboard:notifications')).json()
+        self.assertEqual([item['notification'] for item in page['items']], ['Charger is low', 'Invoice INV-1'])
+        self.assertEqual(page['items'][0]['type'], 'stock level')
+        self.assertEqual(page['unread'], {'stock': 1, 'finance': 1, 'total': 2})
+        with self.assertNumQueries(0):
+            notifications.unread(self.branch.id)
+
+        self.assertEqual(self.client.get(reverse('dashboard:notifications'), {'since': page['cursor']}).json()['items'], [])
+        self.notify(self.branch, 'Invoice INV-3')
+        page = self.client.get(reverse('dashboard:notifications'), {'since': page['cursor']}).json()
+        self.assertEqual([item['notification'] for item in page['items']], ['Invoice INV-3'])
+        self.assertEqual(page['unread']['total'], 3)
+
+        self.assertEqual(self.client.get(reverse('dashboard:notifications'), {'since': 'x'}).status_code, 400)
+
+    def test_compact_deletes_stale_notifications(self):
+        from finance.models import FinanceNotifications
+        from inventory.models import StockNotifications
+        from . import notifications
+
+        old = timezone.now() - notifications.RETENTION - timezone.timedelta(days=1)
+        cleared = self.notify(self.branch, 'Invoice INV-1', status=False)
+        recent = self.notify(self.branch, 'Invoice INV-2', status=False)
+        active = self.notify(self.branch, 'Invoice INV-3')
+        FinanceNotifications.objects.filter(id__in=[cleared.id, active.id]).update(created_at=old)
+        orphan = StockNotifications.objects.create(branch=self.branch, notification='Cable is low', status=True, type='stock level')
+
+        result = notifications.compact()
+        self.assertEqual((result['stock'], result['finance']), (1, 1))
+        self.assertEqual(set(FinanceNotifications.objects.values_list('id', flat=True)), {recent.id, active.id})
+        self.assertFalse(StockNotifications.objects.filter(id=orphan.id).exists())
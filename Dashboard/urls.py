@@ -5,5 +5,7 @@ app_name='dashboard'
 
 urlpatterns = [
     path('', dashboard, name='dashboard'),
+    path('summary/', dashboard_summary, name='summary'),
+    path('notifications/', notifications_feed, name='notifications'),
     path('get_partial_invoice_details/<int:invoice_id>/', get_partial_invoice_details, name='get_partial_invoice_details')
 ]
@@ -1,10 +1,9 @@
-import datetime
 from finance.models import *
 from inventory.models import *
-from django.db.models import Sum
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
+from . import summary, notifications
 
 # from permissions.permissions import allowed_users
 
@@ -12,27 +11,46 @@ from django.contrib.auth.decorators import login_required
 @login_required
 def dashboard(request):
     sales = Sale.objects.filter(transaction__branch=request.user.branch).order_by('-date')[:5]
-    customers = Customer.objects.all().order_by('-date')[:5]
+    customers = Customer.objects.filter(branch=request.user.branch).order_by('-date')[:5]
     transfers = Transfer.objects.filter(branch = request.user.branch).order_by('-date')[:5]
     qoutations = Qoutation.objects.filter(branch=request.user.branch)
     
     invoices = Invoice.objects.filter(payment_status='Partial', branch=request.user.branch).order_by('-issue_date')[:5]
+    counters = summary.summary(request.user.branch.id)
 
     return render(request, 'dashboard/dashboard.html', {
         'sales':sales,
         'transfers':transfers,
         'qoutations':qoutations,
-        'products_count': Inventory.objects.filter(branch=request.user.branch, status=True).aggregate(total_products=Sum('quantity'))['total_products'] or 0,
+        'products_count': counters['stock_units'],
         
         'customers':customers,
-        'customers_count': Customer.objects.all().count(),
-        'customers_today_count': Customer.objects.filter(date=datetime.date.today()).count(),
+        'customers_count': counters['customers'],
+        'customers_today_count': counters['customers_today'],
         
         'partial_invoices':invoices,
-        'invoice_count': Invoice.objects.filter(branch=request.user.branch, status=True).count(),
-        'invoice_today_count': Invoice.objects.filter(branch=request.user.branch, issue_date=datetime.date.today()).count(),
+        'invoice_count': counters['invoices'],
+        'invoice_today_count': counters['invoices_today'],
     })
-    
+
+
+@login_required
+def dashboard_summary(request):
+    """ The dashboard counters of the branch, for the page to refresh its widgets. """
+    return JsonResponse(summary.summary(request.user.branch.id))
+
+
+@login_required
+def notifications_feed(request):
+    """ The branch's notifications since the ``since`` cursor and its unread counters, for the pages to poll. """
+    try:
+        page = notifications.feed(request.user.branch_id, request.GET.get('since'))
+    except notifications.InvalidCursor as e:
+        return JsonResponse({'message': str(e)}, status=400)
+    page['unread'] = notifications.unread(request.user.branch_id)
+    return JsonResponse(page)
+
+
 @login_required
 def get_partial_invoice_details(request, invoice_id):
     invoices = Invoice.objects.filter(payment_status='Partial', id=invoice_id, branch=request.user.branch).order_by('-issue_date').values()
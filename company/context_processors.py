@@ -1,5 +1,6 @@
+from utils.context_cache import lazy_value
 from . models import Branch
 
 def branch_list(request):
-    return{'branches':Branch.objects.all()}
-    
\ No newline at end of file
+    return{'branches':lazy_value('branches', lambda: list(Branch.objects.all()))}
+
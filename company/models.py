@@ -63,3 +63,22 @@ class Branch(models.Model):
 
     def __str__(self) -> str:
         return self.name
+
+
+class DocumentSequence(models.Model):
+    """
+    Counter used to hand out document numbers (invoices, transfers, quotations, purchase orders).
+
+    Rows are managed by utils.sequences which reserves numbers in blocks. The key is the document type and
+    the prefix printed on the number, not the branch: branches whose names start with the same letter print
+    the same prefix and share one counter, so their numbers never collide.
+
+    Attributes:
+        key (str): Document type and printed prefix the counter belongs to e.g. ``invoice:INVH``.
+        last_value (int): The highest number handed out so far.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.key} ({self.last_value})'
@@ -0,0 +1,10 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from utils.context_cache import invalidate
+from .models import Branch
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def branch_changed(sender, instance, **kwargs):
+    invalidate('branches')
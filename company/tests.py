@@ -1,3 +1,94 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from utils import sequences
+from .models import Company, Branch, DocumentSequence
 
-# Create your tests here.
+
+class DocumentSequenceConcurrencyTests(TransactionTestCase):
+
+    def setUp(self):
+        sequences.reset()
+
+    def tearDown(self):
+        sequences.reset()
+        sequences.release()
+
+    def test_parallel_allocations_are_unique(self):
+        workers = 50
+        barrier = Barrier(workers)
+
+        def allocate(_):
+            barrier.wait()
+            try:
+                return [sequences.next_number('test:parallel', block_size=5) for _ in range(3)]
+            finally:
+                sequences.release()
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            numbers = [number for numbers in executor.map(allocate, range(workers)) for number in numbers]
+
+        # blocks reserved side by side can leave numbers unused, never hand one out twice
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(min(numbers), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'blocks are reserved on PostgreSQL only')
+    def test_parallel_block_reservations_do_not_overlap(self):
+        # every thread reserves on its own connection, as separate worker processes would
+        workers = 20
+        barrier = Barrier(workers)
+
+        def reserve(_):
+            barrier.wait()
+            try:
+                return sequences._reserve_block('test:reserve', None, 5)
+            finally:
+                sequences.release()
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            last_values = list(executor.map(reserve, range(workers)))
+
+        self.assertEqual(sorted(last_values), list(range(5, 5 * workers + 1, 5)))
+        self.assertEqual(DocumentSequence.objects.get(key='test:reserve').last_value, 5 * workers)
+
+    def test_reserved_blocks_are_not_reused_by_another_process(self):
+        first = sequences.next_number('test:blocks', block_size=10)
+        # a new process starts without any reserved numbers
+        sequences.reset()
+        second = sequences.next_number('test:blocks', block_size=10)
+
+        self.assertEqual(first, 1)
+        self.assertGreater(second, first)
+        self.assertEqual(DocumentSequence.objects.get(key='test:blocks').last_value, second + 9 if connection.vendor == 'postgresql' else second)
+
+
+class DocumentNumberTests(TestCase):
+
+    def setUp(self):
+        sequences.reset()
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Zvishavane')
+
+    def tearDown(self):
+        sequences.release()
+
+    def test_invoice_number_carries_on_from_existing_invoices(self):
+        from finance.models import Invoice, Customer
+        from django.utils import timezone
+
+        customer = Customer.objects.create(name='Walk in', address='-', id_number='-', branch=self.branch)
+        Invoice.objects.create(
+            invoice_number='INVZ-0041',
+            customer=customer,
+            issue_date=timezone.now(),
+            branch=self.branch,
+            products_purchased='-',
+            payment_terms='cash',
+        )
+
+        self.assertEqual(Invoice.generate_invoice_number(self.branch.name), 'INVZ-0042')
+        self.assertEqual(Invoice.generate_invoice_number(self.branch.name), 'INVZ-0043')
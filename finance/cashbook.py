@@ -0,0 +1,118 @@
+"""
+Daily cashbook balances.
+
+``CashbookBalance`` keeps, per branch, currency and day, the debit and credit totals of the cashbook and
+the closing balance carried forward from all the days before. Saving, cancelling, back-dating or deleting
+a Cashbook entry moves the day of the entry and the closing balance of every later day by the difference,
+once the change commits. The balance brought forward into a report is then one row per currency, no
+matter how much history there is. ``rebuild_cashbook_balances`` rebuilds the table from the entries.
+"""
+from decimal import Decimal
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F, Sum, Case, When, Value, OuterRef, Subquery, DecimalField
+
+from .models import Cashbook, CashbookBalance, Currency
+
+ZERO = Decimal('0')
+
+
+def balance_key(entry):
+    """ (branch, currency, day, debit, credit) the entry adds to the balances, None when it adds nothing. """
+    values = entry.__dict__
+    if values.get('cancelled') or not values.get('amount'):
+        return None
+    if not (values.get('debit') or values.get('credit')):
+        return None
+
+    amount = Decimal(values['amount'])
+    return (
+        values.get('branch_id'),
+        values.get('currency_id'),
+        values.get('issue_date'),
+        amount if values['debit'] else ZERO,
+        amount if not values['debit'] else ZERO,
+    )
+
+
+def entry_changed(old_key, new_key):
+    """ Moves the balances from ``old_key`` to ``new_key`` after the current transaction commits. """
+    if old_key == new_key:
+        return
+
+    changes = defaultdict(lambda: [ZERO, ZERO])
+    for key, sign in ((old_key, -1), (new_key, 1)):
+        if key is None:
+            continue
+        branch_id, currency_id, day, debit, credit = key
+        changes[(branch_id, currency_id, day)][0] += sign * debit
+        changes[(branch_id, currency_id, day)][1] += sign * credit
+
+    for (branch_id, currency_id, day), (debit, credit) in changes.items():
+        if debit or credit:
+            transaction.on_commit(lambda args=(branch_id, currency_id, day, debit, credit): apply_change(*args))
+
+
+def apply_change(branch_id, currency_id, day, debit, credit):
+    from company.models import Branch
+
+    with transaction.atomic():
+        # one writer per branch at a time, so a new day always starts from the right closing balance
+        Branch.objects.select_for_update(no_key=True).filter(id=branch_id).values_list('id', flat=True).first()
+
+        balances = CashbookBalance.objects.filter(branch_id=branch_id, currency_id=currency_id)
+        if not balances.filter(date=day).exists():
+            previous = balances.filter(date__lt=day).order_by('-date').values_list('balance', flat=True).first()
+            balances.create(branch_id=branch_id, currency_id=currency_id, date=day, balance=previous or ZERO)
+
+        balances.filter(date=day).update(debit=F('debit') + debit, credit=F('credit') + credit)
+        balances.filter(date__gte=day).update(balance=F('balance') + (debit - credit))
+
+
+def balances_brought_forward(branch_id, day):
+    """ Closing balance per currency at the end of the day before ``day``. """
+    latest = CashbookBalance.objects.filter(
+        branch_id=branch_id,
+        currency_id=OuterRef('pk'),
+        date__lt=day,
+    ).order_by('-date').values('balance')[:1]
+
+    rows = Currency.objects.annotate(balance=Subquery(latest, output_field=DecimalField())).values_list('id', 'balance')
+    return {currency_id: balance for currency_id, balance in rows if balance is not None}
+
+
+def balance_brought_forward(branch_id, day):
+    return sum(balances_brought_forward(branch_id, day).values(), ZERO)
+
+
+def rebuild_balances(branch_id=None):
+    """ Recomputes the daily balances from the cashbook entries, for one branch or all of them. """
+    entries = Cashbook.objects.filter(cancelled=False)
+    balances = CashbookBalance.objects.all()
+    if branch_id:
+        entries = entries.filter(branch_id=branch_id)
+        balances = balances.filter(branch_id=branch_id)
+
+    days = entries.values('branch_id', 'currency_id', 'issue_date').annotate(
+        debit_total=Sum(Case(When(debit=True, then=F('amount')), default=Value(ZERO))),
+        credit_total=Sum(Case(When(debit=False, credit=True, then=F('amount')), default=Value(ZERO))),
+    ).order_by('branch_id', 'currency_id', 'issue_date')
+
+    rows = []
+    running = defaultdict(lambda: ZERO)
+    for day in days.iterator():
+        key = (day['branch_id'], day['currency_id'])
+        running[key] += day['debit_total'] - day['credit_total']
+        rows.append(CashbookBalance(
+            branch_id=day['branch_id'],
+            currency_id=day['currency_id'],
+            date=day['issue_date'],
+            debit=day['debit_total'],
+            credit=day['credit_total'],
+            balance=running[key],
+        ))
+
+    with transaction.atomic():
+        balances.delete()
+        CashbookBalance.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,238 @@
+"""
+End of day.
+
+``stock_take`` lists the products a branch sold today, each with its opening stock, the quantity sold and
+the quantity left. The day's sales are summed per product in one grouped query. They are matched to the
+branch inventory rows through a product id dict and to the opening stock from ``inventory.snapshots``, so
+the cost grows with the rows, not with sold rows times inventory rows.
+
+``close`` takes the physical counts and writes them in one bulk update. It then freezes the day into a
+``DayClosing`` with its ``DayClosingItem`` lines: totals, variances, invoice and expense lines and
+account balances. A day closes once per branch. Its Z-report is rendered from the stored closing, so a
+past report costs one read however much happened since and always shows the day as it was closed.
+"""
+import datetime
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from company.models import Branch
+from inventory import snapshots
+from inventory.models import Inventory
+from .models import (
+    AccountBalance, CashWithdraw, DayClosing, DayClosingItem, Expense, Invoice, StockTransaction
+)
+
+
+class AlreadyClosed(Exception):
+    def __init__(self, closing):
+        self.closing = closing
+        super().__init__(f'{closing.branch} is already closed for {closing.date}')
+
+
+def day_range(day):
+    """ Start and end of ``day`` in the current time zone, for the invoice issue dates. """
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, start + datetime.timedelta(days=1)
+
+
+def sold_quantities(branch_id, day):
+    """ {product id: quantity sold} by the branch on ``day``. """
+    return dict(
+        StockTransaction.objects.filter(
+            date=day, transaction_type=StockTransaction.TransactionType.SALE, invoice__branch_id=branch_id
+        )
+        .values_list('item_id')
+        .annotate(sold=Sum('quantity'))
+        .order_by()
+    )
+
+
+def stock_take(branch_id, day):
+    """ Stock take rows of the branch for ``day``, one per active inventory row with a sale that day. """
+    sold = sold_quantities(branch_id, day)
+    if not sold:
+        return []
+
+    rows = list(
+        Inventory.objects.filter(branch_id=branch_id, status=True, product_id__in=sold)
+        .values('id', 'product_id', 'product__name', 'quantity')
+        .order_by('product__name')
+    )
+    opening = snapshots.on_hand(branch_id, day - datetime.timedelta(days=1), [row['id'] for row in rows])
+
+    return [
+        {
+            'id': row['id'],
+            'name': row['product__name'],
+            'initial_quantity': opening.get(row['id'], 0),
+            'quantity_sold': sold[row['product_id']],
+            'remaining_quantity': row['quantity'] or 0,
+            'physical_count': None,
+        }
+        for row in rows
+    ]
+
+
+def day_invoices(branch_id, day):
+    start, end = day_range(day)
+    return Invoice.objects.filter(branch_id=branch_id, issue_date__gte=start, issue_date__lt=end)
+
+
+def cash_totals(branch_id, day):
+    """ Cash taken on invoices and withdrawn by the branch on ``day``. """
+    return {
+        'total_invoices_amount': day_invoices(branch_id, day).aggregate(total=Sum('amount_paid', default=0))['total'],
+        'total_withdrawals_amount': CashWithdraw.objects.filter(
+            user__branch_id=branch_id, date=day, status=False
+        ).aggregate(total=Sum('amount', default=0))['total'],
+    }
+
+
+def close(branch_id, day, user, counts):
+    """
+    Closes the day of the branch with ``counts``, {inventory id: physical count}, and returns the new
+    ``DayClosing``. Raises ``AlreadyClosed`` when the day is closed and ``Inventory.DoesNotExist`` when a
+    counted row is not an active row of the branch.
+    """
+    counts = {int(pk): int(count) for pk, count in counts.items()}
+
+    with transaction.atomic():
+        # one closing per branch at a time, the second one finds the first
+        Branch.objects.select_for_update(no_key=True).filter(id=branch_id).values_list('id', flat=True).first()
+        closing = DayClosing.objects.filter(branch_id=branch_id, date=day).first()
+        if closing is not None:
+            raise AlreadyClosed(closing)
+
+        inventory = Inventory.objects.filter(branch_id=branch_id, status=True).select_related('product').in_bulk(counts)
+        missing = set(counts) - set(inventory)
+        if missing:
+            raise Inventory.DoesNotExist(f'Inventory matching query does not exist: {sorted(missing)}')
+        for pk, item in inventory.items():
+            item.physical_count = counts[pk]
+        Inventory.objects.bulk_update(inventory.values(), ['physical_count'])
+
+        rows = {row['id']: row for row in stock_take(branch_id, day)}
+        # counted rows that sold nothing today are in the report too
+        extra = set(counts) - set(rows)
+        if extra:
+            opening = snapshots.on_hand(branch_id, day - datetime.timedelta(days=1), extra)
+            for pk in extra:
+                item = inventory[pk]
+                rows[pk] = {
+                    'id': pk,
+                    'name': item.product.name if item.product else item.name,
+                    'initial_quantity': opening.get(pk, 0),
+                    'quantity_sold': 0,
+                    'remaining_quantity': item.quantity or 0,
+                }
+
+        invoices = day_invoices(branch_id, day)
+        invoice_totals = invoices.aggregate(
+            total_sales=Sum('amount_paid', filter=Q(payment_status=Invoice.PaymentStatus.PAID), default=0),
+            partial_payments=Sum('amount_paid', filter=Q(payment_status=Invoice.PaymentStatus.PARTIAL), default=0),
+            paid_invoices=Count('id', filter=Q(payment_status=Invoice.PaymentStatus.PAID)),
+            partial_invoices=Count('id', filter=Q(payment_status=Invoice.PaymentStatus.PARTIAL)),
+        )
+
+        expenses = Expense.objects.filter(branch_id=branch_id, issue_date=day)
+        expense_totals = expenses.aggregate(
+            total_expenses=Sum('amount', filter=Q(status=True), default=0),
+            open_expenses=Sum('amount', filter=Q(status=False), default=0),
+        )
+
+        items = []
+        for pk, row in rows.items():
+            physical_count = counts.get(pk)
+            items.append(DayClosingItem(
+                inventory_id=pk,
+                name=row['name'] or '',
+                initial_quantity=row['initial_quantity'],
+                quantity_sold=row['quantity_sold'],
+                remaining_quantity=row['remaining_quantity'],
+                physical_count=physical_count,
+                difference=None if physical_count is None else physical_count - row['remaining_quantity'],
+            ))
+
+        cash = cash_totals(branch_id, day)
+        closing = DayClosing.objects.create(
+            branch_id=branch_id,
+            date=day,
+            user=user,
+            cash_received=cash['total_invoices_amount'],
+            withdrawals=cash['total_withdrawals_amount'],
+            stock_variance=sum(item.difference or 0 for item in items),
+            invoices=[
+                {'invoice_number': number, 'amount_paid': str(amount_paid)}
+                for number, amount_paid in invoices.order_by('id').values_list('invoice_number', 'amount_paid')
+            ],
+            expenses=[
+                {'date': str(issue_date), 'category': category, 'description': description, 'amount': str(amount), 'status': status}
+                for issue_date, category, description, amount, status in expenses.order_by('id').values_list(
+                    'issue_date', 'category__name', 'description', 'amount', 'status'
+                )
+            ],
+            account_balances=[
+                {'account': account, 'currency': currency, 'balance': str(balance)}
+                for account, currency, balance in AccountBalance.objects.filter(branch_id=branch_id)
+                .order_by('account__name', 'currency__name')
+                .values_list('account__name', 'currency__name', 'balance')
+            ],
+            **invoice_totals,
+            **expense_totals,
+        )
+
+        for item in items:
+            item.closing = closing
+        DayClosingItem.objects.bulk_create(items)
+    return closing
+
+
+def report_context(closing):
+    """ Template context of the Z-report of ``closing``, from the stored closing only. """
+    expenses = closing.expenses
+    return {
+        'branch': closing.branch,
+        'date': closing.date,
+        'closing': closing,
+        'invoices': closing.invoices,
+        'total_sales': closing.total_sales,
+        'partial_payments': closing.partial_payments,
+        'total_paid_invoices': closing.paid_invoices,
+        'total_partial_invoices': closing.partial_invoices,
+        'total_expenses': closing.total_expenses,
+        'confirmed_expenses': [expense for expense in expenses if expense['status']],
+        'unconfirmed_expenses': [expense for expense in expenses if not expense['status']],
+        'account_balances': closing.account_balances,
+        'inventory_data': list(closing.items.order_by('name', 'id').values(
+            'inventory_id', 'name', 'initial_quantity', 'quantity_sold', 'remaining_quantity', 'physical_count', 'difference'
+        )),
+    }
+
+
+def report_data(closing):
+    """ The stored closing as JSON. """
+    context = report_context(closing)
+    return {
+        'branch': closing.branch.name,
+        'date': closing.date,
+        'closed_at': closing.closed_at,
+        'closed_by': closing.user.username if closing.user else None,
+        'total_sales': closing.total_sales,
+        'partial_payments': closing.partial_payments,
+        'paid_invoices': closing.paid_invoices,
+        'partial_invoices': closing.partial_invoices,
+        'cash_received': closing.cash_received,
+        'withdrawals': closing.withdrawals,
+        'total_expenses': closing.total_expenses,
+        'open_expenses': closing.open_expenses,
+        'stock_variance': closing.stock_variance,
+        'invoices': closing.invoices,
+        'expenses': closing.expenses,
+        'account_balances': closing.account_balances,
+        'inventory': context['inventory_data'],
+    }
+
+
+def report_filename(closing):
+    return f'{closing.branch.name}_day_report_{closing.date}.pdf'
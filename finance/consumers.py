@@ -1,37 +1,30 @@
-import json
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
-# Create a global variable to store connected clients
-connected_clients = []
+from .transfer_events import group_name
 
 
-class CashTransferConsumer(WebsocketConsumer):
-    def connect(self):
-        # Get the authenticated user (if any)
-        self.user = self.scope["user"]
-        if self.user.is_anonymous:
-            self.user = AnonymousUser()  
+class CashTransferConsumer(AsyncJsonWebsocketConsumer):
+    """ Cash transfers to and from the user's branch, as published by ``finance.transfer_events``. """
 
-        # Add the client to the connected clients list
-        connected_clients.append(self)
-        self.accept()
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or not user.branch_id:
+            await self.close()
+            return
 
-    def disconnect(self, close_code):
-        # Remove the client from the connected clients list
-        connected_clients.remove(self)
+        self.group_name = group_name(user.branch_id)
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+        await self.accept()
 
-    def receive(self, text_data):
-        """Receive message from WebSocket client."""
-        text_data_json = json.loads(text_data)
-        message = text_data_json["message"]
-        # Do something with the message
-        # ...
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
-    def send_message(self, message):  # <-- Add 'self' here
-        """Send message to all connected clients."""
-        for client in connected_clients:
-            async_to_sync(client.send)(text_data=json.dumps({
-                'message': message,
-                # Add other data as needed (e.g., transfer details)
-            }))
+    async def cash_transfer(self, event):
+        await self.send_json({'type': 'cash_transfer', 'event': event['event'], 'transfer': event['transfer']})
@@ -1,13 +1,14 @@
+from utils.context_cache import lazy_value
 from . models import ExpenseCategory, Customer, Currency
 
 def expense_category_list(request):
-    return {'expense_categories': ExpenseCategory.objects.all()}
+    return {'expense_categories': lazy_value('expense_categories', lambda: list(ExpenseCategory.objects.all()))}
 
 def client_list(request):
-    return {'clients': Customer.objects.all()}
+    return {'clients': lazy_value('clients', lambda: list(Customer.objects.all()))}
 
 def currency_list(request):
-    return {'currencies': Currency.objects.all()}
+    return {'currencies': lazy_value('currencies', lambda: list(Currency.objects.all()))}
 
 
 
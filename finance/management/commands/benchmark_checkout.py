@@ -0,0 +1,99 @@
+import time
+import statistics
+from decimal import Decimal
+from django.db import connection, transaction
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from django.test.utils import CaptureQueriesContext
+
+from users.models import User
+from company.models import Company, Branch
+from inventory.models import Product, Inventory
+from finance.models import Currency, Customer, VATRate, Invoice, COGS
+from finance.utils import record_invoice_items
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the invoice checkout pipeline for different cart sizes. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1, 10, 50, 200])
+        parser.add_argument('--runs', type=int, default=6)
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        runs = options['runs']
+
+        try:
+            with transaction.atomic():
+                self.run(sizes, runs)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, runs):
+        company = Company.objects.create(name='Benchmark')
+        branch = Branch.objects.create(company=company, name='Benchmark')
+        user = User(email='benchmark@techcity.local', username='benchmark', branch=branch, company=company)
+        user.save()
+        currency = Currency.objects.create(code='BMK', name='Benchmark', symbol='B')
+        vat_rate = VATRate.objects.create(rate=Decimal('15.00'), status=True)
+        customer = Customer.objects.create(name='Benchmark', address='-', id_number='-', branch=branch)
+
+        products = Product.objects.bulk_create(
+            Product(name=f'Benchmark product {i}', price=Decimal('10.00'), cost=Decimal('5.00'), description='-')
+            for i in range(max(sizes))
+        )
+        inventory = Inventory.objects.bulk_create(
+            Inventory(
+                branch=branch,
+                product=product,
+                name=product.name,
+                cost=product.cost,
+                price=product.price,
+                quantity=1_000_000,
+                stock_level_threshold=0,
+            )
+            for product in products
+        )
+
+        self.stdout.write(f'{"lines":>6} {"queries":>8} {"median ms":>10} {"max ms":>8}')
+
+        counter = 0
+        for size in sizes:
+            items_data = [
+                {'inventory_id': item.id, 'quantity': 1, 'price': '10.00'} for item in inventory[:size]
+            ]
+            timings, queries = [], 0
+            for _ in range(runs):
+                counter += 1
+                invoice = Invoice.objects.create(
+                    invoice_number=f'BENCH-{counter:06d}',
+                    customer=customer,
+                    issue_date=timezone.now(),
+                    branch=branch,
+                    user=user,
+                    currency=currency,
+                    products_purchased='-',
+                    payment_terms='cash',
+                )
+                cogs = COGS.objects.create(amount=Decimal(0))
+
+                # query capture slows down the cursor, so only the first run is counted
+                if not queries:
+                    with CaptureQueriesContext(connection) as context:
+                        record_invoice_items(invoice, items_data, user, vat_rate, cogs=cogs)
+                    queries = len(context.captured_queries)
+                    continue
+
+                start = time.perf_counter()
+                record_invoice_items(invoice, items_data, user, vat_rate, cogs=cogs)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            self.stdout.write(
+                f'{size:>6} {queries:>8} {statistics.median(timings):>10.2f} {max(timings):>8.2f}'
+            )
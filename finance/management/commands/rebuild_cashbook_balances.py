@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from finance.cashbook import rebuild_balances
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily cashbook balances from the cashbook entries. Run once after migrating.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, help='Only rebuild this branch id')
+
+    def handle(self, *args, **options):
+        count = rebuild_balances(options['branch'])
+        self.stdout.write(self.style.SUCCESS(f'{count} daily cashbook balances written'))
@@ -0,0 +1,21 @@
+from django.utils.dateparse import parse_date
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily financial rollups for a date range. Run once after migrating to backfill.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help='First day, YYYY-MM-DD')
+        parser.add_argument('--end', required=True, help='Last day, YYYY-MM-DD')
+        parser.add_argument('--branch', type=int, help='Only rebuild this branch id')
+
+    def handle(self, *args, **options):
+        start, end = parse_date(options['start']), parse_date(options['end'])
+        if not start or not end or start > end:
+            raise CommandError('Give --start and --end as YYYY-MM-DD, start first')
+
+        count = rebuild(start, end, options['branch'])
+        self.stdout.write(self.style.SUCCESS(f'{count} daily rollups written from {start} to {end}'))
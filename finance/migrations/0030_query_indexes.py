@@ -0,0 +1,51 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("finance", "0029_dailyrollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cashbook",
+            index=models.Index(
+                fields=["branch", "issue_date"], name="finance_cas_branch__5ef8e4_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["branch", "issue_date"], name="finance_exp_branch__65db38_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["branch", "issue_date"], name="finance_inv_branch__34975e_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["branch", "payment_status"],
+                name="finance_inv_branch__8d7655_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["invoice", "payment_date"],
+                name="finance_pay_invoice_8fca2f_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stocktransaction",
+            index=models.Index(
+                fields=["date", "transaction_type", "invoice"],
+                name="finance_sto_date_50255f_idx",
+            ),
+        ),
+    ]
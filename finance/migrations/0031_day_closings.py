@@ -0,0 +1,118 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("inventory", "0036_inventory_physical_count"),
+        ("company", "0002_documentsequence"),
+        ("finance", "0030_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DayClosing",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("closed_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "total_sales",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                (
+                    "partial_payments",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                ("paid_invoices", models.IntegerField(default=0)),
+                ("partial_invoices", models.IntegerField(default=0)),
+                (
+                    "cash_received",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                (
+                    "withdrawals",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                (
+                    "total_expenses",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                (
+                    "open_expenses",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                ("stock_variance", models.IntegerField(default=0)),
+                ("invoices", models.JSONField(default=list)),
+                ("expenses", models.JSONField(default=list)),
+                ("account_balances", models.JSONField(default=list)),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="day_closings",
+                        to="company.branch",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("branch", "date")},
+            },
+        ),
+        migrations.CreateModel(
+            name="DayClosingItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("initial_quantity", models.IntegerField(default=0)),
+                ("quantity_sold", models.IntegerField(default=0)),
+                ("remaining_quantity", models.IntegerField(default=0)),
+                ("physical_count", models.IntegerField(null=True)),
+                ("difference", models.IntegerField(null=True)),
+                (
+                    "closing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="finance.dayclosing",
+                    ),
+                ),
+                (
+                    "inventory",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="inventory.inventory",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:31
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def schedule_recurring_invoices(apps, schema_editor):
+    # the next period after today, missed ones are not billed retroactively
+    Invoice = apps.get_model("finance", "Invoice")
+    RecurringSchedule = apps.get_model("finance", "RecurringSchedule")
+    now = timezone.now()
+    interval = datetime.timedelta(days=30)
+
+    schedules = []
+    for invoice_id, issue_date in Invoice.objects.filter(reocurring=True).values_list("id", "issue_date"):
+        next_run_at = issue_date + interval
+        if next_run_at <= now:
+            next_run_at += interval * ((now - next_run_at) // interval + 1)
+        schedules.append(RecurringSchedule(invoice_id=invoice_id, interval_days=30, next_run_at=next_run_at))
+    RecurringSchedule.objects.bulk_create(schedules, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("finance", "0031_day_closings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecurringRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started_at", models.DateTimeField()),
+                ("due", models.IntegerField(default=0)),
+                ("created", models.IntegerField(default=0)),
+                ("skipped", models.IntegerField(default=0)),
+                ("seconds", models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RecurringSchedule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("interval_days", models.PositiveIntegerField(default=30)),
+                ("next_run_at", models.DateTimeField()),
+                ("last_run_at", models.DateTimeField(blank=True, null=True)),
+                ("active", models.BooleanField(default=True)),
+                (
+                    "invoice",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recurrence",
+                        to="finance.invoice",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RecurringOccurrence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("period", models.DateField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "invoice",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occurrence",
+                        to="finance.invoice",
+                    ),
+                ),
+                (
+                    "schedule",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occurrences",
+                        to="finance.recurringschedule",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="recurringschedule",
+            index=models.Index(
+                condition=models.Q(("active", True)),
+                fields=["next_run_at"],
+                name="recurring_schedule_due",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="recurringoccurrence",
+            constraint=models.UniqueConstraint(
+                fields=("schedule", "period"), name="recurring_occurrence_period"
+            ),
+        ),
+        migrations.RunPython(schedule_recurring_invoices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("finance", "0032_recurring_schedules"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceReminder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_sent_at", models.DateTimeField()),
+                ("invoice_count", models.IntegerField(default=0)),
+                (
+                    "amount_due",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                condition=models.Q(("amount_due__gt", 0), ("cancelled", False)),
+                fields=["customer", "issue_date"],
+                name="invoice_open_receivables",
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoicereminder",
+            name="customer",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="invoice_reminder",
+                to="finance.customer",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_branches(apps, schema_editor):
+    FinanceNotifications = apps.get_model("finance", "FinanceNotifications")
+    notifications = FinanceNotifications.objects.filter(branch__isnull=True)
+    for relation, branch in (("transfer", "transfer__to"), ("expense", "expense__branch"), ("invoice", "invoice__branch")):
+        related = FinanceNotifications.objects.filter(id=models.OuterRef("id")).values(branch)[:1]
+        notifications.filter(**{f"{relation}__isnull": False}).update(branch=models.Subquery(related))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("company", "0002_documentsequence"),
+        ("finance", "0033_invoice_reminders"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="financenotifications",
+            name="branch",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="finance_notifications",
+                to="company.branch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="financenotifications",
+            index=models.Index(
+                condition=models.Q(("status", True)),
+                fields=["branch", "id"],
+                name="finance_notifications_feed",
+            ),
+        ),
+        migrations.RunPython(set_branches, migrations.RunPython.noop),
+    ]
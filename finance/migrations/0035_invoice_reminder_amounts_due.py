@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("finance", "0034_notification_feed"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="invoicereminder",
+            name="amount_due",
+        ),
+        migrations.AddField(
+            model_name="invoicereminder",
+            name="amounts_due",
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -7,6 +7,7 @@ from django.utils.translation import gettext_lazy as _
 from phonenumber_field.modelfields import PhoneNumberField
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from utils.sequences import next_number, max_number
 
 class PaymentMethod(models.Model):
     name = models.CharField(max_length=255)
@@ -105,11 +106,11 @@ class Transaction(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.reference_number:  
-            while True:  
-                ref_number = uuid.uuid4().hex[:10].upper()  
-                if not Transaction.objects.filter(reference_number=ref_number).exists():  
-                    self.reference_number = ref_number
-                    break  
+            number = next_number(
+                'transaction',
+                seed=lambda: max_number(Transaction.objects.all(), 'reference_number', 'TR', separator='TR')
+            )
+            self.reference_number = f'TR{number:08d}'
         super(Transaction, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -186,6 +187,12 @@ class StockTransaction(models.Model):
     unit_price = models.DecimalField(max_digits=15, decimal_places=2)
     date = models.DateField()
 
+    class Meta:
+        indexes = [
+            # the day's sales of a branch, joined to the invoice for the branch
+            models.Index(fields=['date', 'transaction_type', 'invoice']),
+        ]
+
 class ExpenseCategory(models.Model):
     name = models.CharField(max_length=50)
     
@@ -208,6 +215,11 @@ class Expense(models.Model):
     status = models.BooleanField(default=False)
     purchase_order = models.ForeignKey("inventory.PurchaseOrder", on_delete=models.CASCADE, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'issue_date']),
+        ]
+
     def __str__(self):
         return f"{self.issue_date} - {self.category} - {self.description} - ${self.amount}"
     
@@ -261,18 +273,25 @@ class Invoice(models.Model):
     ))
     hold_status = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'issue_date']),
+            models.Index(fields=['branch', 'payment_status']),
+            # the open receivables, what the overdue reminders group per customer
+            models.Index(
+                fields=['customer', 'issue_date'],
+                condition=models.Q(amount_due__gt=0, cancelled=False),
+                name='invoice_open_receivables',
+            ),
+        ]
+
     def generate_invoice_number(branch):
-        last_invoice = Invoice.objects.filter(branch__name=branch).order_by('-id').first()
-        if last_invoice:
-            if str(last_invoice.invoice_number.split('-')[0])[-1] == branch[0]:
-                last_invoice_number = int(last_invoice.invoice_number.split('-')[1]) 
-                new_invoice_number = last_invoice_number + 1   
-            else:
-                new_invoice_number = 1
-            return f"INV{branch[:1]}-{new_invoice_number:04d}"  
-        else:
-            new_invoice_number = 1
-            return f"INV{branch[:1]}-{new_invoice_number:04d}"  
+        prefix = f'INV{branch[:1]}'
+        new_invoice_number = next_number(
+            f'invoice:{prefix}',
+            seed=lambda: max_number(Invoice.objects.all(), 'invoice_number', f'{prefix}-')
+        )
+        return f"{prefix}-{new_invoice_number:04d}"  
 
     def __str__(self):
         return f"Invoice #{self.invoice_number} - {self.customer}"
@@ -322,7 +341,68 @@ class laybyDates(models.Model):
 class recurringInvoices(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE)
     status = models.BooleanField(default=False)
-    
+
+
+class InvoiceReminder(models.Model):
+    """ The last overdue reminder of a customer, see ``finance.reminders``. """
+
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, related_name='invoice_reminder')
+    last_sent_at = models.DateTimeField()
+    invoice_count = models.IntegerField(default=0)
+    # {currency symbol: amount due}, the invoices of a customer can be in several currencies
+    amounts_due = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f'{self.customer} {self.last_sent_at}'
+
+
+class RecurringSchedule(models.Model):
+    """ When the next copy of a recurring invoice is issued, see ``finance.recurring``. """
+
+    invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, related_name='recurrence')
+    interval_days = models.PositiveIntegerField(default=30)
+    next_run_at = models.DateTimeField()
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_run_at'], condition=models.Q(active=True), name='recurring_schedule_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.invoice} every {self.interval_days} days'
+
+
+class RecurringOccurrence(models.Model):
+    """ The invoice issued for one period of a schedule, at most one per period. """
+
+    schedule = models.ForeignKey(RecurringSchedule, on_delete=models.CASCADE, related_name='occurrences')
+    period = models.DateField()
+    invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, related_name='occurrence')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'period'], name='recurring_occurrence_period'),
+        ]
+
+    def __str__(self):
+        return f'{self.schedule.invoice} {self.period}'
+
+
+class RecurringRun(models.Model):
+    """ Metrics of a scheduler run that found invoices due. """
+
+    started_at = models.DateTimeField()
+    due = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    seconds = models.FloatField(default=0)
+
+    def __str__(self):
+        return f'{self.started_at}: {self.created} of {self.due}'
+
 class Payment(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
     amount_due = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -336,6 +416,11 @@ class Payment(models.Model):
         ('Ecocash','Ecocash')
     ])
     user = models.ForeignKey('users.user', on_delete=models.PROTECT)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['invoice', 'payment_date']),
+        ]
     
     def __str__(self):
         return f'{self.invoice.invoice_number} {self.amount_paid}'
@@ -356,9 +441,112 @@ class Cashbook(models.Model):
     cancelled = models.BooleanField(default=False, null=True)
     note = models.TextField(default='', null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # entry as loaded, used to move the daily balances by the difference on save
+        from .cashbook import balance_key
+        instance._loaded_balance_key = balance_key(instance)
+        return instance
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'issue_date']),
+        ]
+
     def __str__(self):
         return f'{self.issue_date}'
 
+
+class CashbookBalance(models.Model):
+    """Cashbook totals and closing balance of one day, per branch and currency, cancelled entries excluded."""
+
+    branch = models.ForeignKey('company.branch', on_delete=models.CASCADE)
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE)
+    date = models.DateField()
+    debit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('branch', 'currency', 'date')
+
+    def __str__(self):
+        return f'{self.branch} {self.currency} {self.date}: {self.balance}'
+
+
+class DailyRollup(models.Model):
+    """Sales, cost of sales, expenses, VAT and invoice count of one day, per branch and currency."""
+
+    branch = models.ForeignKey('company.branch', on_delete=models.CASCADE)
+    # purchase order VAT carries no currency
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, null=True)
+    date = models.DateField()
+    sales = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    cogs = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    expenses = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    open_expenses = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    vat_output = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    vat_input = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    invoice_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('branch', 'currency', 'date')
+
+    def __str__(self):
+        return f'{self.branch} {self.currency} {self.date}'
+
+
+class DayClosing(models.Model):
+    """
+    The end of day of a branch as it stood when it was closed: the sales, expenses, account balances and
+    stock take totals and lines of the Z-report. Written once by ``finance.closing.close``, never changed.
+    """
+
+    branch = models.ForeignKey('company.branch', on_delete=models.CASCADE, related_name='day_closings')
+    date = models.DateField()
+    user = models.ForeignKey('users.user', on_delete=models.SET_NULL, null=True)
+    closed_at = models.DateTimeField(auto_now_add=True)
+    total_sales = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    partial_payments = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    paid_invoices = models.IntegerField(default=0)
+    partial_invoices = models.IntegerField(default=0)
+    cash_received = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    withdrawals = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_expenses = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    open_expenses = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    stock_variance = models.IntegerField(default=0)
+    # report lines, as they were at closing
+    invoices = models.JSONField(default=list)
+    expenses = models.JSONField(default=list)
+    account_balances = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = ('branch', 'date')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError(f'Day closing {self.pk} is final and cannot be changed')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.branch} {self.date}'
+
+
+class DayClosingItem(models.Model):
+    closing = models.ForeignKey(DayClosing, on_delete=models.CASCADE, related_name='items')
+    inventory = models.ForeignKey('inventory.Inventory', on_delete=models.SET_NULL, null=True)
+    name = models.CharField(max_length=255)
+    initial_quantity = models.IntegerField(default=0)
+    quantity_sold = models.IntegerField(default=0)
+    remaining_quantity = models.IntegerField(default=0)
+    physical_count = models.IntegerField(null=True)
+    difference = models.IntegerField(null=True)
+
+    def __str__(self):
+        return f'{self.closing}: {self.name}'
+
+
 class CashBookNote(models.Model):
     entry = models.ForeignKey(Cashbook, related_name="notes", on_delete=models.CASCADE)
     user = models.ForeignKey('users.user', on_delete=models.CASCADE)
@@ -393,6 +581,8 @@ class FinanceNotifications(models.Model):
     expense = models.OneToOneField(Expense, on_delete=models.CASCADE, null=True)
     invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, null=True)
     transfer = models.OneToOneField(CashTransfers, on_delete=models.CASCADE, null=True)
+    # the branch that sees it, kept on the row for the notification feed
+    branch = models.ForeignKey('company.Branch', on_delete=models.CASCADE, null=True, blank=True, related_name='finance_notifications')
     notification = models.CharField(max_length=255)
     status = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -402,6 +592,21 @@ class FinanceNotifications(models.Model):
         ('Transfer', 'Transfer')
     ])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'id'], condition=models.Q(status=True), name='finance_notifications_feed'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.branch_id is None:
+            if self.transfer_id:
+                self.branch_id = self.transfer.to_id
+            elif self.expense_id:
+                self.branch_id = self.expense.branch_id
+            elif self.invoice_id:
+                self.branch_id = self.invoice.branch_id
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.notification
     
@@ -416,17 +621,12 @@ class Qoutation(models.Model):
     products = models.CharField(max_length=255)
     
     def generate_qoute_number(branch):
-        last_qoute = Qoutation.objects.filter(branch__name=branch).order_by('-id').first()
-        if last_qoute:
-            if str(last_qoute.qoute_reference.split('-')[0])[-1] == branch[0]:
-                last_qoute_number = int(last_qoute.qoute_reference.split('-')[1]) 
-                new_qoute_number = last_qoute_number + 1   
-            else:
-                new_qoute_number = 1
-            return f"Q{branch[:1]}-{new_qoute_number :04d}"  
-        else:
-            new_qoute_number  = 1
-            return f"Q{branch[:1]}-{new_qoute_number :04d}"  
+        prefix = f'Q{branch[:1]}'
+        new_qoute_number = next_number(
+            f'qoutation:{prefix}',
+            seed=lambda: max_number(Qoutation.objects.all(), 'qoute_reference', f'{prefix}-')
+        )
+        return f"{prefix}-{new_qoute_number:04d}"  
     
     def __str__(self):
         return f'{self.qoute_reference} {self.customer.name}'
@@ -0,0 +1,173 @@
+"""
+Overdue invoice reminders.
+
+Invoices carry no due date, so an open invoice counts as overdue ``PAYMENT_DAYS`` after it was issued.
+``run`` groups the overdue invoices per customer and currency in one aggregate query over the
+``invoice_open_receivables`` index. It sends each customer one digest of all their overdue invoices,
+not an email per invoice. ``InvoiceReminder`` records when a customer was last reminded, and a customer
+is reminded again only after ``REMIND_EVERY``.
+
+Digests go into the email outbox in chunks of ``CHUNK_SIZE`` customers, two queries and one transaction
+a chunk. A run takes at most ``MAX_PER_RUN`` customers, oldest debt first, so a large receivables book
+is worked through over a few hourly runs rather than flooding the SMTP server. The finance team gets
+one summary email per run, and each branch a notification on its own customers.
+"""
+import time
+import datetime
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from settings.outbox import queue_email
+from .models import Customer, FinanceNotifications, Invoice, InvoiceReminder
+
+import logging
+logger = logging.getLogger(__name__)
+
+PAYMENT_DAYS = 30
+REMIND_EVERY = datetime.timedelta(days=7)
+CHUNK_SIZE = 50
+MAX_PER_RUN = 500
+TIME_BUDGET = 50  # seconds per run
+OPEN = (Invoice.PaymentStatus.PENDING, Invoice.PaymentStatus.PARTIAL, Invoice.PaymentStatus.OVERDUE)
+
+INVOICE_REMINDER_EMAILS = ['admin@techcity.co.zw']
+
+
+def overdue_invoices(now):
+    return Invoice.objects.filter(
+        amount_due__gt=0,
+        cancelled=False,
+        hold_status=False,
+        payment_status__in=OPEN,
+        issue_date__lt=now - datetime.timedelta(days=PAYMENT_DAYS),
+    )
+
+
+def due_customers(now, limit=MAX_PER_RUN):
+    """
+    {customer id: [(currency symbol, invoice count, amount due)]} of up to ``limit`` customers with
+    overdue invoices, an email address and no reminder in the last ``REMIND_EVERY``, oldest debt first.
+    """
+    rows = (
+        overdue_invoices(now)
+        .exclude(customer__email='')
+        .exclude(customer__invoice_reminder__last_sent_at__gt=now - REMIND_EVERY)
+        .values('customer_id', 'currency__symbol')
+        .annotate(invoices=Count('id'), amount_due=Sum('amount_due'), oldest=Min('issue_date'))
+        .order_by('oldest', 'customer_id')
+    )
+
+    customers = defaultdict(list)
+    for row in rows.iterator():
+        if row['customer_id'] not in customers and len(customers) == limit:
+            break
+        customers[row['customer_id']].append((row['currency__symbol'] or '', row['invoices'], row['amount_due']))
+    return customers
+
+
+def digest(customer, lines, now):
+    """ Subject and body of the reminder of ``customer``, ``lines`` are the overdue invoice rows. """
+    body = [
+        f'Dear {customer.name},',
+        '',
+        f'The following invoices are more than {PAYMENT_DAYS} days past their issue date and still have a balance:',
+        '',
+    ]
+    for number, issue_date, amount_due, symbol in lines:
+        days = (now - issue_date).days
+        body.append(f'{number}  issued {timezone.localtime(issue_date):%d/%m/%Y} ({days} days)  {symbol}{amount_due:,.2f} due')
+    body += ['', 'Please settle the outstanding balance as soon as possible.', '', 'Thank you,', customer.branch.name]
+    return f'Overdue invoice reminder ({len(lines)} invoice{"s" if len(lines) != 1 else ""})', '\n'.join(body)
+
+
+def send_chunk(customer_ids, now):
+    """ Queues the digests of one chunk of customers and records them as reminded. """
+    customers = Customer.objects.select_related('branch').in_bulk(customer_ids)
+    lines = defaultdict(list)
+    for customer_id, number, issue_date, amount_due, symbol in (
+        overdue_invoices(now).filter(customer_id__in=customers)
+        .order_by('issue_date', 'id')
+        .values_list('customer_id', 'invoice_number', 'issue_date', 'amount_due', 'currency__symbol')
+    ):
+        lines[customer_id].append((number, issue_date, amount_due, symbol or ''))
+
+    reminders = []
+    with transaction.atomic():
+        for customer_id, customer in customers.items():
+            if not lines[customer_id]:
+                continue
+            subject, body = digest(customer, lines[customer_id], now)
+            queue_email(
+                'invoice reminder', subject, body, [customer.email], settings.SYSTEM_EMAIL,
+                dedupe_key=f'invoice-reminder:{customer_id}:{timezone.localdate(now)}',
+            )
+            amounts_due = defaultdict(int)
+            for _, _, amount_due, symbol in lines[customer_id]:
+                amounts_due[symbol] += amount_due
+            reminders.append(InvoiceReminder(
+                customer=customer,
+                last_sent_at=now,
+                invoice_count=len(lines[customer_id]),
+                amounts_due={symbol: str(amount) for symbol, amount in sorted(amounts_due.items())},
+            ))
+        InvoiceReminder.objects.bulk_create(
+            reminders,
+            update_conflicts=True,
+            unique_fields=['customer'],
+            update_fields=['last_sent_at', 'invoice_count', 'amounts_due'],
+        )
+    return reminders
+
+
+def summarise(reminded, customers):
+    """ One line on the ``reminded`` customers, ``customers`` as returned by ``due_customers``. """
+    totals = defaultdict(int)
+    for reminder in reminded:
+        for symbol, _, amount_due in customers[reminder.customer_id]:
+            totals[symbol] += amount_due
+    return (
+        f'{len(reminded)} customers reminded of {sum(reminder.invoice_count for reminder in reminded)} overdue invoices: '
+        + ', '.join(f'{symbol}{amount:,.2f}' for symbol, amount in sorted(totals.items()))
+    )
+
+
+def run(now=None, chunk_size=CHUNK_SIZE, limit=MAX_PER_RUN, time_budget=TIME_BUDGET):
+    """ Reminds the customers with overdue invoices that are due a reminder, returns the run counts. """
+    now = now or timezone.now()
+    started = time.monotonic()
+
+    customers = due_customers(now, limit)
+    ids = list(customers)
+    reminded = []
+    for start in range(0, len(ids), chunk_size):
+        if time.monotonic() - started > time_budget:
+            break
+        reminded += send_chunk(ids[start:start + chunk_size], now)
+
+    invoices = sum(reminder.invoice_count for reminder in reminded)
+    if reminded:
+        branches = defaultdict(list)
+        for reminder in reminded:
+            branches[reminder.customer.branch_id].append(reminder)
+
+        with transaction.atomic():
+            # each branch is notified of its own customers
+            for branch_id, branch_reminded in branches.items():
+                FinanceNotifications.objects.create(
+                    branch_id=branch_id,
+                    notification=summarise(branch_reminded, customers)[:255],
+                    status=True,
+                    notification_type='Invoice',
+                )
+            queue_email(
+                'invoice reminder summary', 'Overdue invoice reminders', summarise(reminded, customers),
+                INVOICE_REMINDER_EMAILS, settings.SYSTEM_EMAIL,
+            )
+
+    seconds = time.monotonic() - started
+    if ids:
+        logger.info(f'[Reminders] {len(reminded)} of {len(ids)} customers reminded of {invoices} invoices in {seconds:.2f}s')
+    return {'customers': len(reminded), 'pending': len(ids) - len(reminded), 'invoices': invoices, 'seconds': seconds}
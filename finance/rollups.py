@@ -0,0 +1,117 @@
+"""
+Daily financial rollups.
+
+``DailyRollup`` keeps the sales, cost of sales, expenses, VAT and invoice count of each day per branch and
+currency, so the P&L and dashboard endpoints sum a few hundred small rows instead of the source tables.
+Saving or deleting a Sale, COGSItems, Expense, VATTransaction or Invoice marks its branch and day; the
+marked days are recomputed from the source tables once the transaction commits. ``rebuild`` recomputes
+any date range and backs the ``rebuild_daily_rollups`` task and command.
+"""
+import datetime
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F, Sum, Count, Case, When, Value, DecimalField, IntegerField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from utils.transactions import batch_on_commit
+from .models import DailyRollup, Sale, COGSItems, Expense, VATTransaction, Invoice
+
+import logging
+logger = logging.getLogger(__name__)
+
+FIELDS = ('sales', 'cogs', 'expenses', 'open_expenses', 'vat_output', 'vat_input', 'invoice_count')
+
+
+def day_of(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def rollup_changed(branch_id, day):
+    """ Marks the day of the branch for a recompute after the current transaction commits. """
+    if branch_id and day:
+        batch_on_commit('daily_rollups', (branch_id, day_of(day)), refresh)
+
+
+def refresh(days):
+    from company.models import Branch
+
+    for branch_id, day in sorted(days):
+        try:
+            with transaction.atomic():
+                # one recompute per branch at a time, the last one always sees every committed change
+                Branch.objects.select_for_update(no_key=True).filter(id=branch_id).values_list('id', flat=True).first()
+                rebuild(day, day, branch_id)
+        except Exception as e:
+            logger.error(f'Daily rollup of branch {branch_id} on {day}: {e}', exc_info=True)
+
+
+def rebuild(start, end, branch_id=None):
+    """ Recomputes the rollups of the days from ``start`` to ``end``, for one branch or all of them. """
+    rows = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+
+    def add(queryset, field, branch, currency, day, total):
+        grouped = queryset.values(
+            branch_key=F(branch),
+            currency_key=F(currency) if currency else Value(None, output_field=IntegerField()),
+            day=day,
+        ).annotate(total=total).order_by()
+        for row in grouped:
+            if row['branch_key'] is not None:
+                rows[(row['branch_key'], row['currency_key'], day_of(row['day']))][field] += row['total'] or 0
+
+    def scoped(queryset, branch):
+        return queryset.filter(**{branch: branch_id}) if branch_id else queryset
+
+    zero = Value(0, output_field=DecimalField())
+
+    sales = scoped(Sale.objects.filter(date__range=(start, end)), 'transaction__branch')
+    add(sales, 'sales', 'transaction__branch', 'transaction__currency', F('date'), Sum('total_amount'))
+
+    cogs = scoped(COGSItems.objects.filter(date__range=(start, end), invoice__isnull=False), 'invoice__branch')
+    add(cogs, 'cogs', 'invoice__branch', 'invoice__currency', F('date'), Sum('product__cost'))
+
+    expenses = scoped(Expense.objects.filter(issue_date__range=(start, end)), 'branch')
+    add(expenses, 'expenses', 'branch', 'currency', F('issue_date'), Sum('amount'))
+    add(expenses, 'open_expenses', 'branch', 'currency', F('issue_date'), Sum(Case(When(status=False, then=F('amount')), default=zero)))
+
+    vat = VATTransaction.objects.filter(date__range=(start, end))
+    output = scoped(vat.filter(invoice__isnull=False, vat_type=VATTransaction.VATType.OUTPUT), 'invoice__branch')
+    add(output, 'vat_output', 'invoice__branch', 'invoice__currency', F('date'), Sum('tax_amount'))
+    purchases = scoped(vat.filter(purchase_order__isnull=False, vat_type=VATTransaction.VATType.INPUT), 'purchase_order__branch')
+    add(purchases, 'vat_input', 'purchase_order__branch', None, F('date'), Sum('tax_amount'))
+
+    # issue_date is a datetime, bounded by the local day so the index can be used
+    start_at = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+    end_at = timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min))
+    invoices = scoped(Invoice.objects.filter(issue_date__gte=start_at, issue_date__lt=end_at, cancelled=False), 'branch')
+    add(invoices, 'invoice_count', 'branch', 'currency', TruncDate('issue_date'), Count('id'))
+
+    existing = DailyRollup.objects.filter(date__range=(start, end))
+    if branch_id:
+        existing = existing.filter(branch_id=branch_id)
+
+    with transaction.atomic():
+        existing.delete()
+        DailyRollup.objects.bulk_create([
+            DailyRollup(branch_id=branch, currency_id=currency, date=day, **totals)
+            for (branch, currency, day), totals in rows.items()
+        ], batch_size=1000)
+    return len(rows)
+
+
+def totals(branch_id, start, end):
+    """ Sums of the rollups of the branch over the days, all currencies together. """
+    sums = DailyRollup.objects.filter(branch_id=branch_id, date__range=(start, end)).aggregate(
+        **{field: Sum(field) for field in FIELDS}
+    )
+    return {field: value or 0 for field, value in sums.items()}
+
+
+def daily(branch_id, start, end):
+    """ Per day sums of the rollups of the branch, all currencies together. """
+    return DailyRollup.objects.filter(branch_id=branch_id, date__range=(start, end)).values('date').annotate(
+        **{f'{field}_total': Sum(field) for field in FIELDS}
+    ).order_by('date')
@@ -4,50 +4,62 @@ from datetime import timedelta
 from django.db.models import Max
 from django.dispatch import receiver
 from inventory.middleware import _request
-from .tasks import send_email_notification
-from django.db.models.signals import post_save
+from .tasks import send_email_notification, send_cash_transfer_notification
+from django.db.models.signals import post_save, post_delete
+from utils.context_cache import invalidate
+from . import cashbook, rollups, transfer_events
 from .models import (
     CashTransfers, 
     FinanceNotifications, 
     Expense, 
     Invoice, 
     CustomerDeposits,
-    Cashbook
+    Cashbook,
+    Customer,
+    Currency,
+    ExpenseCategory,
+    Sale,
+    COGSItems,
+    VATTransaction
 )
 
 from django.core.mail import EmailMessage
+from django.core.exceptions import ObjectDoesNotExist
 
 logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=CashTransfers)
-def cash_transfer_notification(sender, instance, **kwargs):
+def cash_transfer_notification(sender, instance, created, update_fields=None, **kwargs):
     
-    if instance.received_status==False:
-        FinanceNotifications.objects.create(
+    if created:
+        notification = FinanceNotifications.objects.create(
             transfer=instance,
             notification=f'Receive {instance.currency.symbol} {instance.amount} send from {instance.from_branch}',
             status=True,
             notification_type='Transfer'
         )
         
-        notification = FinanceNotifications.objects.get(transfer=instance)
-        notification = FinanceNotifications.objects.get(pk=notification.id)
         # subject = 'Cash Transfer Notification'
         # message = notification.notification
         # from_email = 'admin@techcity.co.zw'
         # to_email = 'cassymyo@gmail.com'
         # email = EmailMessage(subject, message, from_email, [to_email])
         # email.send()
-        send_email_notification.delay(notification.id)
+        send_cash_transfer_notification(notification.id)
+        transfer_events.transfer_changed(instance, transfer_events.CREATED)
     elif instance.received_status==True:
-        notification = FinanceNotifications.objects.get(
+        received = FinanceNotifications.objects.filter(
             transfer=instance, 
             status=True,
-            notification_type='Expense'
-        )
+            notification_type='Transfer'
+        ).update(status=False)
         
-        notification.status=False
-        notification.save()
+        if received:
+            # updated in bulk, no FinanceNotifications signal
+            invalidate('unread_notifications', branch_id=instance.to_id)
+        # only the save that receives it, not later edits of a received transfer
+        if received or (update_fields and 'received_status' in update_fields):
+            transfer_events.transfer_changed(instance, transfer_events.RECEIVED)
         
 @receiver(post_save, sender=Expense)
 def expense_confirmation_notificatioin(sender, instance, **kwargs):
@@ -102,14 +114,14 @@ def create_invoice_cashbook_entry(sender, instance, **kwargs):
 #         create_cashbook_entry(instance, instance.description, debit=False, credit=True)
 
 @receiver(post_save, sender=CashTransfers)
-def create_cash_transfer_cashbook_entry(sender, instance, **kwargs):
-    create_cashbook_entry(instance, f'Cash Transfer of {instance.amount} from {instance.from_branch.name}', debit=True, credit=False)
+def create_cash_transfer_cashbook_entry(sender, instance, created, **kwargs):
+    if not created:
+        return
     # from branch credit
     Cashbook.objects.create(
-        issue_date=instance.date_created,
-        description=f'Cash Transfer of {instance.amount} from {instance.from_branch.name}',
-        debit=True,
-        credit=False,
+        description=f'Cash Transfer of {instance.amount} to {instance.to.name}',
+        debit=False,
+        credit=True,
         amount=instance.amount,
         currency=instance.currency,
         branch=instance.from_branch
@@ -117,12 +129,92 @@ def create_cash_transfer_cashbook_entry(sender, instance, **kwargs):
     
     # to branch debit
     Cashbook.objects.create(
-        issue_date=instance.date_created,
         description=f'Cash Transfer of {instance.amount} from {instance.from_branch.name}',
         debit=True,
         credit=False,
         amount=instance.amount,
         currency=instance.currency,
-        branch=instance.to_branch
+        branch=instance.to
     )
     
+
+
+@receiver(post_save, sender=FinanceNotifications)
+@receiver(post_delete, sender=FinanceNotifications)
+def finance_notifications_changed(sender, instance, **kwargs):
+    if instance.branch_id:
+        invalidate('unread_notifications', branch_id=instance.branch_id)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def customer_changed(sender, instance, **kwargs):
+    invalidate('clients')
+
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+def currency_changed(sender, instance, **kwargs):
+    invalidate('currencies')
+
+
+@receiver(post_save, sender=ExpenseCategory)
+@receiver(post_delete, sender=ExpenseCategory)
+def expense_category_changed(sender, instance, **kwargs):
+    invalidate('expense_categories')
+
+
+@receiver(post_save, sender=Cashbook)
+def cashbook_balance_saved(sender, instance, created, **kwargs):
+    old_key = None if created else getattr(instance, '_loaded_balance_key', None)
+    new_key = cashbook.balance_key(instance)
+    cashbook.entry_changed(old_key, new_key)
+    instance._loaded_balance_key = new_key
+
+
+@receiver(post_delete, sender=Cashbook)
+def cashbook_balance_deleted(sender, instance, **kwargs):
+    cashbook.entry_changed(getattr(instance, '_loaded_balance_key', cashbook.balance_key(instance)), None)
+    instance._loaded_balance_key = None
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def sale_rollup(sender, instance, **kwargs):
+    try:
+        rollups.rollup_changed(instance.transaction.branch_id, instance.date)
+    except Invoice.DoesNotExist:
+        pass
+
+
+@receiver(post_save, sender=COGSItems)
+@receiver(post_delete, sender=COGSItems)
+def cogs_rollup(sender, instance, **kwargs):
+    try:
+        if instance.invoice_id:
+            rollups.rollup_changed(instance.invoice.branch_id, instance.date)
+    except Invoice.DoesNotExist:
+        pass
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def expense_rollup(sender, instance, **kwargs):
+    rollups.rollup_changed(instance.branch_id, instance.issue_date)
+
+
+@receiver(post_save, sender=VATTransaction)
+@receiver(post_delete, sender=VATTransaction)
+def vat_rollup(sender, instance, **kwargs):
+    try:
+        document = instance.invoice if instance.invoice_id else instance.purchase_order
+    except ObjectDoesNotExist:
+        return
+    if document is not None:
+        rollups.rollup_changed(document.branch_id, instance.date)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def invoice_rollup(sender, instance, **kwargs):
+    rollups.rollup_changed(instance.branch_id, instance.issue_date)
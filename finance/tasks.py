@@ -1,12 +1,14 @@
-import threading
 from datetime import datetime, timedelta
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
-from io import BytesIO
-from xhtml2pdf import pisa 
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.conf import settings 
 from celery import shared_task
+from twilio.rest import Client
+from django.core.files.storage import default_storage
+from utils import pdf
+from settings.outbox import queue_email
 
 from finance.models import *
 from users.models import User
@@ -15,7 +17,6 @@ from django.template.loader import render_to_string
 from django.conf import settings
 
 from finance.models import Expense
-from utils.email import EmailThread
 from django.core.mail import EmailMessage
 from loguru import logger
 
@@ -25,160 +26,163 @@ logger = logging.getLogger(__name__)
     
 @shared_task
 def generate_recurring_invoices():
-    recurring_invoices = []
-    next_seven_days = datetime.now() + timedelta(days=7)
-    invoices_due = Invoice.objects.filter(
-        reocurring=True,  
-        next_due_date__lte=next_seven_days
-    )
+    """ Issues the recurring invoices that are due, see ``finance.recurring``. """
+    from .recurring import run
 
-    for invoice in invoices_due:
-        new_invoice = Invoice(
-            invoice_number=Invoice.generate_invoice_number(invoice.branch.name),
-            amount=invoice.amount,
-            amount_paid=0,
-            amount_due=invoice.amount_due,
-            customer=invoice.customer,
-            branch=invoice.branch,
-            vat=invoice.vat,
-            payment_status='Partial',
-            currency=invoice.currency,
-            subtotal=invoice.subtotal,
-            note=invoice.note,
-            user=invoice.user,
-            products_purchased=invoice.products_purchased,
-            issue_date=datetime.now(),
-            due_date=datetime.now() + timedelta(days=2),
-            next_due_date=datetime.now() + timedelta(days=invoice.recurrence_period), 
-        )
-        new_invoice.save()
-        
-        recurring_invoices.append(new_invoice)
+    return run()
+
+
+@shared_task
+def rebuild_daily_rollups(start_date=None, end_date=None, branch_id=None):
+    """ Rebuilds the daily financial rollups between two ISO dates, yesterday and today by default. """
+    from .rollups import rebuild
+
+    end = parse_date(end_date) if end_date else timezone.localdate()
+    start = parse_date(start_date) if start_date else end - timedelta(days=1)
+
+    count = rebuild(start, end, branch_id)
+    logger.info(f'Daily rollups rebuilt from {start} to {end}: {count} rows')
+    return count
        
 
 def send_account_statement_email(customer_id, branch_id, user_id):
+    """ Queues the account statement of the customer, the PDF is rendered when the email goes out. """
     # Validate inputs
     if not customer_id or not branch_id or not user_id:
         logger.error("Invalid customer_id or branch_id provided.")
         return
-    
-    def send_email():
-        try:
-            invoice_payments = Payment.objects.filter(
-                invoice__branch_id=branch_id, 
-                invoice__customer_id=customer_id
-            ).order_by('-payment_date')
-
-            if not invoice_payments.exists():
-                logger.warning(f"No invoice payments found for customer_id: {customer_id} and branch_id: {branch_id}")
-                return
-        
-            try:
-                customer = Customer.objects.get(id=customer_id)
-                account = CustomerAccountBalances.objects.filter(account__customer=customer)
-            except Customer.DoesNotExist:
-                logger.error(f"Customer with id {customer_id} does not exist.")
-                return
-            
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                logger.error(f"Customer with id {user_id} does not exist.")
-                return
-            
-            email_body = render_to_string('emails/email_template.html', {
-                "customer": customer,
-                'message': f'Hi, {customer.name}. Please find your attached account statement.',
-                'sender_name':user.first_name
-            })
-            
-            html_string = render_to_string('emails/account_statement.html', {
-                "invoice_payments": invoice_payments,
-                'customer':customer,
-                'account':account,
-                'date': datetime.now()
-            })
-
-            email = EmailMessage(
-                subject='Your Account Statement',
-                body=email_body,
-                from_email='admin@techcity.co.zw', 
-                to=['cassymyo@gmail.com'],
-            )
-            email.content_subtype = "html"
-
-            with BytesIO() as buffer:
-                pisa.CreatePDF(html_string, dest=buffer)
-                buffer.seek(0)
-                email.attach(f'account statement({customer.name}).pdf', buffer.getvalue(), 'application/pdf')
-                email.send()
-                logger.info(f"Account statement email sent to {customer.email}")
-
-        except Exception as e:
-            logger.error(f"Error sending account statement email: {e}", exc_info=True)
-
-    # Start the email sending function in a new thread
-    email_thread = threading.Thread(target=send_email)
-    email_thread.start()
 
+    invoice_payments = Payment.objects.filter(
+        invoice__branch_id=branch_id, 
+        invoice__customer_id=customer_id
+    ).select_related('invoice', 'invoice__currency').order_by('-payment_date')
 
+    if not invoice_payments.exists():
+        logger.warning(f"No invoice payments found for customer_id: {customer_id} and branch_id: {branch_id}")
+        return
 
-def send_invoice_email_task(invoice_id):
-    invoice = Invoice.objects.get(id=invoice_id)
-    invoice_items = InvoiceItem.objects.filter(invoice=invoice)
-    account = CustomerAccount.objects.get(customer__id = invoice.customer.id)
+    try:
+        customer = Customer.objects.get(id=customer_id)
+        account = CustomerAccountBalances.objects.filter(account__customer=customer)
+    except Customer.DoesNotExist:
+        logger.error(f"Customer with id {customer_id} does not exist.")
+        return
     
-    html_string = render_to_string('pos/receipt.html', {'invoice': invoice, 'invoice_items':invoice_items, 'account':account})
-    buffer = BytesIO()
-
-    pisa.CreatePDF(html_string, dest=buffer) 
-
-    # email = EmailMessage(
-    #     'Your Invoice',
-    #     'Please find your invoice attached.',
-    #     'cassymyo@gmail.com',
-    #     ['cassymyo@gmail.com'],
-    # )
-    send_html(
-        'Your Invoice',
-        'Please find your invoice attached.',
-        'cassymyo@gmail.com',
-        ['cassymyo@gmail.com'],
-    )
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        logger.error(f"User with id {user_id} does not exist.")
+        return
+    
+    email_body = render_to_string('emails/email_template.html', {
+        "customer": customer,
+        'message': f'Hi, {customer.name}. Please find your attached account statement.',
+        'sender_name':user.first_name
+    })
     
-    # buffer.seek(0)
-    # email.attach(f'invoice_{invoice.invoice_number}.pdf', buffer.getvalue(), 'application/pdf')
+    html_string = render_to_string('emails/account_statement.html', {
+        "invoice_payments": invoice_payments,
+        'customer':customer,
+        'account':account,
+        'date': datetime.now()
+    })
+
+    queue_email(
+        'statement',
+        'Your Account Statement',
+        f'Hi, {customer.name}. Please find your attached account statement.',
+        [customer.email],
+        settings.SYSTEM_EMAIL,
+        html=email_body,
+        pdf_attachments=[(f'account statement({customer.name}).pdf', 'emails/account_statement.html', html_string)],
+    )
+    logger.info(f"Account statement email queued for {customer.email}")
 
-    # # Send the email
-    # email.send()
-    print('done')
+
+
+@shared_task
+def send_invoice_email_task(invoice_id):
+    """ Queues the invoice PDF for the customer, a resend reuses the PDF stored the first time. """
+    try:
+        invoice = Invoice.objects.select_related('customer').get(id=invoice_id)
+        if not invoice.customer.email:
+            logger.info(f'Invoice {invoice.invoice_number}: customer has no email address')
+            return
+
+        invoice_items = InvoiceItem.objects.filter(invoice=invoice)
+        account = CustomerAccount.objects.filter(customer=invoice.customer).first()
+        filename = f'invoice_{invoice.invoice_number}.pdf'
+        html = pdf.render_html('Pos/receipt.html', {'invoice': invoice, 'invoice_items':invoice_items, 'account':account})
+
+        queue_email(
+            'invoice',
+            'Your Invoice',
+            'Please find your invoice attached.',
+            [invoice.customer.email],
+            settings.SYSTEM_EMAIL,
+            pdf_attachments=[(filename, 'Pos/receipt.html', html)],
+        )
+        logger.info(f'Invoice {invoice.invoice_number} email queued for {invoice.customer.email}')
+    except Exception as e:
+        logger.error(f"Error sending invoice email: {e}", exc_info=True)
+
+
+@shared_task
+def send_day_report_whatsapp(filename, html):
+    """ Renders and stores the day report and sends its link over WhatsApp. """
+    try:
+        path = pdf.store(pdf.document_key('day_report.html', html), filename, html)
+
+        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        message = client.messages.create(
+            from_='whatsapp:' + '+14155238886',
+            body="Today's report.",
+            to='whatsapp:' + '+263778587612',
+            media_url=default_storage.url(path),
+        )
+        logger.info(f"WhatsApp message SID: {message.sid}")
+    except Exception as e:
+        logger.error(f"Error sending day report via WhatsApp: {e}", exc_info=True)
 
 
 
 def send_email_notification(notification_id):
+    """ Queues the confirmation request of an expense, once however often the expense is saved. """
     try:
-        expense = Expense.objects.get(pk=notification_id)
-        
-        subject = 'Expense Confirmation Notification'
-        message = f'Please log on to confirm the expense: {expense.description}'
-        from_email = expense.user.email
-        to_email = ['admin@techcity .co.zw'] 
-        sender_name = expense.user.first_name
-
-        # Render the email template with context
-        html_content = render_to_string('emails/email_template.html', {
-            'subject': subject,
-            'message': message,
-            'sender_name': sender_name,
-        })
-
-        send_mail_func(subject, message, html_content, from_email, to_email)
-            
+        expense = Expense.objects.select_related('user').get(pk=notification_id)
     except Expense.DoesNotExist:
-        print(f"Expense with ID {notification_id} does not exist")
+        logger.error(f"Expense with ID {notification_id} does not exist")
+        return
 
-    except Exception as e:
-        print(f"An error occurred while sending email: {e}")
+    subject = 'Expense Confirmation Notification'
+    message = f'Please log on to confirm the expense: {expense.description}'
+    from_email = expense.user.email
+    to_email = ['admin@techcity.co.zw'] 
+    sender_name = expense.user.first_name
+
+    # Render the email template with context
+    html_content = render_to_string('emails/email_template.html', {
+        'subject': subject,
+        'message': message,
+        'sender_name': sender_name,
+    })
+
+    queue_email('expense', subject, message, to_email, from_email, html=html_content, dedupe_key=f'expense:{expense.id}')
+
+
+def send_cash_transfer_notification(notification_id):
+    """ Queues the email of a cash transfer notification to the receiving branch. """
+    notification = FinanceNotifications.objects.select_related('transfer__to').get(pk=notification_id)
+    transfer = notification.transfer
+
+    queue_email(
+        'cash transfer',
+        'Cash Transfer Notification',
+        notification.notification,
+        [transfer.to.email],
+        settings.SYSTEM_EMAIL,
+        dedupe_key=f'cash-transfer:{transfer.id}',
+    )
 
 
 
@@ -191,57 +195,26 @@ def send_expense_email_notification(expense_id):
     email = EmailMessage(subject, message, from_email, [to_email])
     email.send()
 
+@shared_task
 def check_and_send_invoice_reminders():
-    timezone.activate(settings.TIME_ZONE) 
-    now = timezone.now()
-    
-    due_invoices = Invoice.objects.filter(due_date__lte=now.date(), payment_status=Invoice.PaymentStatus.PARTIAL)  
+    """ Sends the overdue invoice digests that are due, see ``finance.reminders``. """
+    from .reminders import run
 
-    for invoice in due_invoices:
-        days_overdue = (now.date() - invoice.due_date).days
-
-        # Internal Notification
-        internal_subject = f"Invoice #{invoice.id} Overdue by {days_overdue} Days"
-        internal_message = (
-            f"Invoice #{invoice.id} for {invoice.customer.name} is {days_overdue} days overdue. Payment status: Partial"
-        )
-        internal_recipients = ["your-team@example.com"]  
-        
-        email = EmailMessage(
-            internal_subject, internal_message, "from@example.com", internal_recipients
-        )
-        email.send()
-        
-        FinanceNotifications.objects.create(
-            invoice=Invoice,
-            notificatioin=f"Invoice #{invoice.id} for {invoice.customer.name} is {days_overdue} days overdue. Payment status: Partial",
-            status=False,
-            notification_type='Invoice'
-        )
-
-        # Customer Notification
-        customer_subject = f"Overdue Invoice Reminder (Invoice #{invoice.id})"
-        customer_message = f"Dear {invoice.customer.name},\n\nThis is a reminder that your invoice #{invoice.id} was due on {invoice.due_date} and is currently {days_overdue} days overdue. Please settle the remaining balance as soon as possible.\n\nThank you,\nYour Company"
-        email = EmailMessage(
-            customer_subject, customer_message, "from@example.com", [invoice.customer.email]
-        )
-        email.send()
+    return run()
 
 
 def send_expense_creation_notification(expense_id):
     expense = Expense.objects.get(id=expense_id)
     
-    email = EmailMessage(
-        subject=f"Expense Notification:",
-        body=f"""
+    queue_email(
+        'expense created',
+        f"Expense Notification:",
+        f"""
         The email is to notify you on the creation of an expense for {expense.description}.
         For an amount of ${expense.amount}.
         """,
-        from_email='admin@techcity.co.zw',
-        to=['cassymyo@gmail.com'],
+        ['cassymyo@gmail.com'],
+        'admin@techcity.co.zw',
+        dedupe_key=f'expense-created:{expense.id}',
     )
-    
-    EmailThread(email).start()
-    
-    logger.info('send')
 
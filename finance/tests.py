@@ -1,7 +1,11 @@
 import json
+import re
 from decimal import Decimal
 from django.urls import reverse
 from .forms import customerDepositsForm
+from unittest import skipUnless
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from .models import (
@@ -12,8 +16,24 @@ from .models import (
     CustomerDeposits,
     Cashbook,
     Account,
-    AccountBalance
+    AccountBalance,
+    VATRate,
+    Invoice,
+    InvoiceItem,
+    StockTransaction,
+    COGS,
+    COGSItems,
+    Sale,
+    Expense,
+    ExpenseCategory,
+    VATTransaction,
+    DailyRollup,
+    Payment
 )
+from .utils import record_invoice_items
+from .cashbook import balance_brought_forward, rebuild_balances
+from . import rollups
+from django.utils import timezone
 
 class CustomerViewTests(TestCase):
 
@@ -205,3 +225,743 @@ class EditCustomerDepositTests(TestCase):
         self.assertEqual(self.account_balance.balance, Decimal('950.00'))
         self.assertRedirects(response, reverse('finance:customer', args=[self.customer_deposit.customer_account.account.customer.id]))
 
+
+class RecordInvoiceItemsTests(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+        from inventory.models import Product, Inventory
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.vat_rate = VATRate.objects.create(rate=Decimal('15.00'), status=True)
+        customer = Customer.objects.create(name='Walk in', address='-', id_number='-', branch=self.branch)
+        currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+
+        self.inventory = [
+            Inventory.objects.create(
+                branch=self.branch,
+                product=Product.objects.create(name=f'Product {i}', price=Decimal('10.00'), description='-'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=100,
+                stock_level_threshold=0,
+            )
+            for i in range(20)
+        ]
+        self.invoices = [
+            Invoice.objects.create(
+                invoice_number=f'INVH-{i:04d}',
+                customer=customer,
+                issue_date=timezone.now(),
+                branch=self.branch,
+                user=self.user,
+                currency=currency,
+                products_purchased='-',
+                payment_terms='cash',
+            )
+            for i in range(2)
+        ]
+
+    def cart(self, size):
+        return [{'inventory_id': item.id, 'quantity': 2, 'price': '10.00'} for item in self.inventory[:size]]
+
+    def test_query_count_is_independent_of_cart_size(self):
+        for invoice, size in zip(self.invoices, (1, 20)):
+            cogs = COGS.objects.create()
+            with self.assertNumQueries(6):
+                record_invoice_items(invoice, self.cart(size), self.user, self.vat_rate, cogs=cogs)
+
+    def test_stock_and_lines_are_recorded(self):
+        from inventory.models import ActivityLog
+
+        item = self.inventory[0]
+        cart = self.cart(1) + self.cart(1)
+        record_invoice_items(self.invoices[0], cart, self.user, self.vat_rate)
+
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 96)
+        lines = InvoiceItem.objects.filter(invoice=self.invoices[0])
+        self.assertEqual(lines.count(), 2)
+        self.assertEqual(lines[0].vat_amount, Decimal('3.00'))
+        self.assertEqual(lines[0].total_amount, Decimal('20.00'))
+        self.assertEqual(StockTransaction.objects.filter(invoice=self.invoices[0]).count(), 2)
+        self.assertEqual(
+            list(ActivityLog.objects.filter(invoice=self.invoices[0]).order_by('id').values_list('total_quantity', flat=True)),
+            [98, 96]
+        )
+
+
+class CashbookBalanceTests(TestCase):
+
+    def setUp(self):
+        from company.models import Company, Branch
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.zig = Currency.objects.create(code='ZIG', name='Zig', symbol='Z')
+        self.today = timezone.localdate()
+
+    def entry(self, amount, debit=True, currency=None, days_ago=0):
+        entry = Cashbook.objects.create(
+            description='-',
+            debit=debit,
+            credit=not debit,
+            amount=Decimal(amount),
+            currency=currency or self.usd,
+            branch=self.branch,
+        )
+        if days_ago:
+            # issue_date is auto_now_add, so back dating is an update
+            entry.issue_date = self.today - timezone.timedelta(days=days_ago)
+            entry.save()
+        return entry
+
+    def brought_forward(self, days_ago):
+        return balance_brought_forward(self.branch.id, self.today - timezone.timedelta(days=days_ago))
+
+    def test_balances_follow_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = self.entry('100.00', days_ago=5)
+            self.entry('30.00', debit=False, days_ago=3)
+            self.entry('40.00', currency=self.zig, days_ago=3)
+            late = self.entry('20.00')
+
+        self.assertEqual(self.brought_forward(4), Decimal('100.00'))
+        self.assertEqual(self.brought_forward(0), Decimal('110.00'))
+        self.assertEqual(self.brought_forward(-1), Decimal('130.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.cancelled = True
+            sale.save()
+            late.issue_date = self.today - timezone.timedelta(days=10)
+            late.save()
+
+        self.assertEqual(self.brought_forward(4), Decimal('20.00'))
+        self.assertEqual(self.brought_forward(0), Decimal('30.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            late.delete()
+        self.assertEqual(self.brought_forward(0), Decimal('10.00'))
+
+        incremental = [self.brought_forward(days) for days in range(-1, 12)]
+        rebuild_balances()
+        self.assertEqual([self.brought_forward(days) for days in range(-1, 12)], incremental)
+
+    def test_brought_forward_is_one_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for days_ago in range(30):
+                self.entry('10.00', days_ago=days_ago + 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.brought_forward(0), Decimal('300.00'))
+
+
+class FinanceDownloadTests(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.usd = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.client.force_login(self.user)
+
+    def entry(self, amount, debit=True, days_ago=0):
+        entry = Cashbook.objects.create(description='-', debit=debit, credit=not debit, amount=Decimal(amount), currency=self.usd, branch=self.branch)
+        if days_ago:
+            entry.issue_date = timezone.localdate() - timezone.timedelta(days=days_ago)
+            entry.save()
+        return entry
+
+    def test_report_download_streams(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry('100.00', days_ago=1)
+            self.entry('30.00', debit=False)
+            cancelled = self.entry('5.00')
+            cancelled.cancelled = True
+            cancelled.save()
+
+        response = self.client.get(reverse('finance:download_cashbook_report'), {'filter': 'today'})
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Date,Description,Expenses,Income,Balance')
+        self.assertEqual([line.split(',')[4] for line in lines[1:]], ['100.00', '70.00', '70.00'])
+
+    def test_withdrawals_download_is_xlsx(self):
+        import io
+        import openpyxl
+        from .models import CashWithdraw
+
+        CashWithdraw.objects.create(user=self.user, password='-', amount=Decimal('12.50'), reason='float', currency=self.usd)
+
+        response = self.client.get(reverse('finance:withdrawals'), {'download': 1})
+
+        worksheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        rows = list(worksheet.values)
+        self.assertEqual(rows[0], ('Date', 'User', 'Amount', 'Reason', 'Status'))
+        self.assertEqual(rows[1][1:], ('cashier', 12.5, 'float', 'pending'))
+
+
+class DailyRollupTests(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+        from inventory.models import Product, Inventory
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.customer = Customer.objects.create(name='Walk in', address='-', id_number='-', branch=self.branch)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.category = ExpenseCategory.objects.create(name='Rent')
+        self.inventory = Inventory.objects.create(
+            branch=self.branch,
+            product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+            cost=Decimal('4.00'),
+            price=Decimal('10.00'),
+            quantity=100,
+        )
+        self.today = timezone.localdate()
+
+    def sell(self, number, amount):
+        invoice = Invoice.objects.create(
+            invoice_number=f'INVR-{number:04d}',
+            customer=self.customer,
+            issue_date=timezone.now(),
+            branch=self.branch,
+            user=self.user,
+            currency=self.currency,
+            amount=Decimal(amount),
+            products_purchased='-',
+            payment_terms='cash',
+        )
+        COGSItems.objects.create(invoice=invoice, cogs=COGS.objects.create(), product=self.inventory)
+        VATTransaction.objects.create(invoice=invoice, vat_type='Output', vat_rate=Decimal('15.00'), tax_amount=Decimal('1.50'))
+        Sale.objects.create(date=timezone.now(), transaction=invoice, total_amount=Decimal(amount))
+        return invoice
+
+    def test_rollups_follow_commits_and_match_a_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(1, '10.00')
+            self.sell(2, '25.00')
+            Expense.objects.create(
+                amount=Decimal('7.00'), payment_method='cash', currency=self.currency, category=self.category,
+                description='-', user=self.user, branch=self.branch,
+            )
+
+        totals = rollups.totals(self.branch.id, self.today, self.today)
+        self.assertEqual(totals['sales'], Decimal('35.00'))
+        self.assertEqual(totals['cogs'], Decimal('8.00'))
+        self.assertEqual(totals['expenses'], Decimal('7.00'))
+        self.assertEqual(totals['vat_output'], Decimal('3.00'))
+        self.assertEqual(totals['invoice_count'], 2)
+        self.assertEqual(DailyRollup.objects.count(), 1)
+
+        rollups.rebuild(self.today, self.today)
+        self.assertEqual(rollups.totals(self.branch.id, self.today, self.today), totals)
+
+    def test_pl_overview_reads_the_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(1, '10.00')
+
+        self.client.force_login(self.user)
+        with self.assertNumQueries(7):
+            # company check, savepoint pair, session, user, then one query per period
+            data = self.client.get(reverse('finance:pl_overview'), {'filter': 'today'}).json()
+        self.assertEqual(Decimal(data['current_net_income']), Decimal('10.00'))
+        self.assertEqual(Decimal(data['current_gross_profit']), Decimal('6.00'))
+
+        self.assertEqual(Decimal(self.client.get(reverse('finance:income_json'), {'filter': 'today'}).json()['sales_total']), Decimal('10.00'))
+        weeks = self.client.get(reverse('finance:days_data')).json()
+        self.assertEqual(Decimal(weeks['week 1']['total_sales']), Decimal('10.00'))
+
+
+class PDFQueueTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from django.core.cache import cache
+        from django.core.files.storage import FileSystemStorage
+        from users.models import User
+        from company.models import Company, Branch
+
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        storage = FileSystemStorage(media_root.name)
+        for target in ('utils.pdf.default_storage', 'utils.jobs.default_storage'):
+            patcher = mock.patch(target, storage)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        company = Company.objects.create(name='Techcity')
+        branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=branch)
+        self.invoice = Invoice.objects.create(
+            invoice_number='INV-0001',
+            customer=Customer.objects.create(name='Walk in', address='-', id_number='-', branch=branch),
+            issue_date=timezone.now(),
+            branch=branch,
+            user=self.user,
+            currency=Currency.objects.create(code='USD', name='US Dollar', symbol='$'),
+            amount=Decimal('10.00'),
+            products_purchased='-',
+            payment_terms='cash',
+        )
+        self.client.force_login(self.user)
+
+    def test_render_is_queued_and_reprints_are_served_from_the_stored_copy(self):
+        from unittest import mock
+        from utils.pdf import render_pdf
+
+        url = reverse('finance:invoice_pdf')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(url, {'id': self.invoice.id}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+
+        # the worker, run in place
+        with mock.patch.object(render_pdf, 'delay', render_pdf):
+            callbacks[0]()
+        status = self.client.get(status_url).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertTrue(status['url'].endswith('/invoice_INV-0001.pdf'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(url, {'id': self.invoice.id})
+        self.assertEqual(len(callbacks), 0)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+
+
+class DayClosingTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from django.core.files.storage import FileSystemStorage
+        from users.models import User
+        from company.models import Company, Branch
+        from inventory.models import Product, Inventory
+        from inventory import snapshots
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        storage = FileSystemStorage(media_root.name)
+        for target in ('utils.pdf.default_storage', 'utils.jobs.default_storage'):
+            patcher = mock.patch(target, storage)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.customer = Customer.objects.create(name='Walk in', address='-', id_number='-', branch=self.branch)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.vat_rate = VATRate.objects.create(rate=Decimal('15.00'), status=True)
+        self.inventory = [
+            Inventory.objects.create(
+                branch=self.branch,
+                product=Product.objects.create(name=f'Product {i}', price=Decimal('10.00'), description='-'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=100,
+                stock_level_threshold=0,
+            )
+            for i in range(3)
+        ]
+        self.today = timezone.localdate()
+        snapshots.take(self.today - timezone.timedelta(days=1))
+
+        self.sell('INV-0001', {self.inventory[0]: 2, self.inventory[1]: 3})
+        self.client.force_login(self.user)
+
+    def sell(self, number, quantities):
+        invoice = Invoice.objects.create(
+            invoice_number=number,
+            customer=self.customer,
+            issue_date=timezone.now(),
+            branch=self.branch,
+            user=self.user,
+            currency=self.currency,
+            amount=Decimal('50.00'),
+            amount_paid=Decimal('50.00'),
+            payment_status=Invoice.PaymentStatus.PAID,
+            products_purchased='-',
+            payment_terms='cash',
+        )
+        cart = [{'inventory_id': item.id, 'quantity': quantity, 'price': '10.00'} for item, quantity in quantities.items()]
+        record_invoice_items(invoice, cart, self.user, self.vat_rate)
+
+    def close(self, counts):
+        return self.client.post(
+            reverse('finance:end_of_day'),
+            json.dumps([{'item_id': item.id, 'physical_count': count} for item, count in counts.items()]),
+            content_type='application/json',
+        )
+
+    def test_stock_take_lists_the_day_sales(self):
+        data = self.client.get(reverse('finance:end_of_day')).json()
+
+        self.assertEqual(
+            [(row['id'], row['initial_quantity'], row['quantity_sold'], row['remaining_quantity']) for row in data['inventory']],
+            [(self.inventory[0].id, 100, 2, 98), (self.inventory[1].id, 100, 3, 97)]
+        )
+        self.assertEqual(Decimal(data['total_cash_amounts'][0]['total_invoices_amount']), Decimal('50.00'))
+
+    def test_closing_is_stored_once_and_served_as_closed(self):
+        from inventory.models import Inventory
+        from .models import DayClosing
+
+        response = self.close({self.inventory[0]: 97, self.inventory[2]: 100})
+        self.assertTrue(response.json()['success'])
+
+        self.assertEqual(Inventory.objects.get(id=self.inventory[0].id).physical_count, 97)
+        closing = DayClosing.objects.get(branch=self.branch, date=self.today)
+        self.assertEqual(closing.total_sales, Decimal('50.00'))
+        self.assertEqual(closing.paid_invoices, 1)
+        self.assertEqual(closing.stock_variance, -1)
+        self.assertEqual(
+            sorted(closing.items.values_list('inventory_id', 'quantity_sold', 'physical_count', 'difference')),
+            [(self.inventory[0].id, 2, 97, -1), (self.inventory[1].id, 3, None, None), (self.inventory[2].id, 0, 100, 0)]
+        )
+
+        # a second close is refused and later sales do not change the report
+        self.assertEqual(self.close({self.inventory[0]: 90}).status_code, 409)
+        self.sell('INV-0002', {self.inventory[0]: 1})
+        report = self.client.get(reverse('finance:z_report', args=[self.today]), {'format': 'json'}).json()
+        self.assertEqual(Decimal(report['total_sales']), Decimal('50.00'))
+        self.assertEqual([invoice['invoice_number'] for invoice in report['invoices']], ['INV-0001'])
+        self.assertEqual(report['stock_variance'], -1)
+
+        with self.assertRaises(ValueError):
+            closing.save()
+
+
+class RecurringInvoiceTests(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+        from utils import sequences
+
+        # invoice numbers are reserved on a connection of their own
+        sequences.reset()
+        self.addCleanup(sequences.release)
+        self.addCleanup(sequences.reset)
+
+        company = Company.objects.create(name='Techcity')
+        branch = Branch.objects.create(company=company, name='Harare')
+        user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=branch)
+        self.now = timezone.now()
+        self.invoice = Invoice.objects.create(
+            invoice_number='INVH-0001',
+            customer=Customer.objects.create(name='Walk in', address='-', id_number='-', branch=branch),
+            issue_date=self.now - timezone.timedelta(days=65),
+            branch=branch,
+            user=user,
+            currency=Currency.objects.create(code='USD', name='US Dollar', symbol='$'),
+            amount=Decimal('40.00'),
+            amount_paid=Decimal('40.00'),
+            payment_status=Invoice.PaymentStatus.PAID,
+            reocurring=True,
+            products_purchased='Hosting x 1',
+            payment_terms='cash',
+        )
+
+    def test_missed_periods_are_issued_once(self):
+        from .models import RecurringRun
+        from . import recurring
+
+        schedule = recurring.schedule(self.invoice)
+        self.assertEqual(recurring.run(self.now)['created'], 2)
+
+        copies = Invoice.objects.exclude(id=self.invoice.id)
+        self.assertEqual(copies.count(), 2)
+        self.assertTrue(all(
+            copy.amount_due == Decimal('40.00') and copy.payment_status == Invoice.PaymentStatus.PENDING for copy in copies
+        ))
+        schedule.refresh_from_db()
+        self.assertGreater(schedule.next_run_at, self.now)
+
+        # nothing due, and a period that was issued already is skipped
+        self.assertEqual(recurring.run(self.now)['due'], 0)
+        schedule.next_run_at -= timezone.timedelta(days=30)
+        schedule.save()
+        result = recurring.run(self.now)
+        self.assertEqual((result['due'], result['created'], result['skipped']), (1, 0, 1))
+        self.assertEqual(copies.count(), 2)
+        self.assertEqual(list(RecurringRun.objects.order_by('id').values_list('created', 'skipped')), [(2, 0), (0, 1)])
+
+
+class InvoiceReminderTests(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        self.now = timezone.now()
+
+        self.owing = Customer.objects.create(name='Owing', email='owing@example.com', address='-', id_number='-', branch=self.branch)
+        self.recent = Customer.objects.create(name='Recent', email='recent@example.com', address='-', id_number='-', branch=self.branch)
+        for i, (customer, days) in enumerate([(self.owing, 40), (self.owing, 45), (self.owing, 60), (self.recent, 5)]):
+            Invoice.objects.create(
+                invoice_number=f'INVH-{i:04d}',
+                customer=customer,
+                issue_date=self.now - timezone.timedelta(days=days),
+                branch=self.branch,
+                user=self.user,
+                currency=self.currency,
+                amount=Decimal('30.00'),
+                amount_paid=Decimal('10.00'),
+                amount_due=Decimal('20.00'),
+                payment_status=Invoice.PaymentStatus.PARTIAL,
+                products_purchased='-',
+                payment_terms='cash',
+            )
+
+    def test_one_digest_per_customer_until_the_next_reminder_is_due(self):
+        from settings.models import OutboxEmail
+        from .models import FinanceNotifications, InvoiceReminder
+        from . import reminders
+
+        zig = Currency.objects.create(code='ZIG', name='Zimbabwe Gold', symbol='ZiG')
+        Invoice.objects.filter(invoice_number='INVH-0002').update(currency=zig)
+        with self.captureOnCommitCallbacks():
+            result = reminders.run(self.now)
+        self.assertEqual((result['customers'], result['invoices']), (1, 3))
+
+        digest = OutboxEmail.objects.get(kind='invoice reminder')
+        self.assertEqual(digest.to_email, 'owing@example.com')
+        self.assertEqual(digest.body.count('INVH-'), 3)
+        self.assertEqual(OutboxEmail.objects.filter(kind='invoice reminder summary').count(), len(reminders.INVOICE_REMINDER_EMAILS))
+        self.assertEqual(InvoiceReminder.objects.get(customer=self.owing).amounts_due, {'$': '40.00', 'ZiG': '20.00'})
+        notification = FinanceNotifications.objects.get(notification_type='Invoice')
+        self.assertEqual(notification.branch_id, self.branch.id)
+        self.assertEqual(notification.notification, '1 customers reminded of 3 overdue invoices: $40.00, ZiG20.00')
+
+        with self.captureOnCommitCallbacks():
+            self.assertEqual(reminders.run(self.now + timezone.timedelta(days=1))['customers'], 0)
+            self.assertEqual(reminders.run(self.now + reminders.REMIND_EVERY + timezone.timedelta(hours=1))['customers'], 1)
+        self.assertEqual(OutboxEmail.objects.filter(kind='invoice reminder').count(), 2)
+
+
+class CashTransferBroadcastTests(TestCase):
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare', email='harare@techcity.co.zw')
+        self.bulawayo = Branch.objects.create(company=company, name='Bulawayo', email='bulawayo@techcity.co.zw')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.bulawayo)
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+
+    def test_created_and_received_reach_both_branches_after_commit(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from .models import CashTransfers, FinanceNotifications
+        from . import transfer_events
+
+        layer = get_channel_layer()
+        channels = {}
+        for branch in (self.branch, self.bulawayo):
+            channels[branch.id] = async_to_sync(layer.new_channel)()
+            async_to_sync(layer.group_add)(transfer_events.group_name(branch.id), channels[branch.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer = CashTransfers.objects.create(
+                from_branch=self.branch,
+                to=self.bulawayo,
+                branch=self.branch,
+                amount=Decimal('100.00'),
+                currency=self.currency,
+                user=self.user,
+                reason='float',
+            )
+        for channel in channels.values():
+            message = async_to_sync(layer.receive)(channel)
+            self.assertEqual((message['event'], message['transfer']['id'], message['transfer']['amount']), ('created', transfer.id, '100.00'))
+        self.assertEqual(Cashbook.objects.filter(branch=self.bulawayo, debit=True).count(), 1)
+        self.assertEqual(Cashbook.objects.filter(branch=self.branch, credit=True).count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer.received_status = True
+            transfer.save()
+            transfer.save()
+        message = async_to_sync(layer.receive)(channels[self.bulawayo.id])
+        self.assertEqual((message['event'], message['transfer']['received']), ('received', True))
+        self.assertFalse(FinanceNotifications.objects.get(transfer=transfer).status)
+        self.assertEqual(Cashbook.objects.count(), 2)
+
+    async def test_consumer_joins_the_users_branch(self):
+        from channels.layers import get_channel_layer
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from django.contrib.auth.models import AnonymousUser
+        from .routing import websocket_urlpatterns
+        from . import transfer_events
+
+        application = URLRouter(websocket_urlpatterns)
+
+        anonymous = WebsocketCommunicator(application, '/ws/cash_transfers/')
+        anonymous.scope['user'] = AnonymousUser()
+        connected, _ = await anonymous.connect()
+        self.assertFalse(connected)
+
+        communicator = WebsocketCommunicator(application, '/ws/cash_transfers/')
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        transfer = {'id': 1, 'to': self.bulawayo.id}
+        await get_channel_layer().group_send(
+            transfer_events.group_name(self.bulawayo.id),
+            {'type': 'cash.transfer', 'event': 'created', 'transfer': transfer}
+        )
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'cash_transfer', 'event': 'created', 'transfer': transfer})
+        await communicator.disconnect()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'query plans are checked on Postgres')
+class QueryPlanTests(TestCase):
+    """ The hot filters of the finance and stock pages are answered from their composite indexes. """
+
+    def setUp(self):
+        from users.models import User
+        from company.models import Company, Branch
+        from inventory.models import Product, Inventory, Transfer, TransferItems, ActivityLog, StockNotifications
+
+        company = Company.objects.create(name='Techcity')
+        self.branches = [Branch.objects.create(company=company, name=name) for name in ('Harare', 'Bulawayo', 'Gweru')]
+        self.branch = self.branches[0]
+        user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$')
+        category = ExpenseCategory.objects.create(name='Rent')
+        product = Product.objects.create(name='Charger', price=Decimal('10.00'), description='-')
+        self.inventory = Inventory.objects.create(branch=self.branch, product=product, cost=Decimal('5.00'), price=Decimal('10.00'), quantity=10)
+        self.today = timezone.localdate()
+
+        invoices = Invoice.objects.bulk_create([
+            Invoice(
+                invoice_number=f'INV-{i:05d}',
+                customer=Customer.objects.get_or_create(name='Walk in', address='-', id_number='-', branch=self.branch)[0],
+                issue_date=timezone.now() - timezone.timedelta(days=i % 90),
+                branch=self.branches[i % 3],
+                user=user,
+                currency=currency,
+                payment_status=Invoice.PaymentStatus.PARTIAL if i % 7 == 0 else Invoice.PaymentStatus.PAID,
+                products_purchased='-',
+                payment_terms='cash',
+            )
+            for i in range(600)
+        ])
+        self.invoice = invoices[0]
+        Payment.objects.bulk_create([
+            Payment(invoice=invoice, amount_paid=Decimal('10.00'), payment_method='cash', user=user) for invoice in invoices
+        ])
+        StockTransaction.objects.bulk_create([
+            StockTransaction(
+                item=product,
+                invoice=invoice,
+                transaction_type=StockTransaction.TransactionType.SALE,
+                quantity=1,
+                unit_price=Decimal('10.00'),
+                date=timezone.localtime(invoice.issue_date).date(),
+            )
+            for invoice in invoices
+        ])
+        Expense.objects.bulk_create([
+            Expense(amount=Decimal('5.00'), payment_method='cash', currency=currency, category=category, description='-', user=user, branch=self.branches[i % 3])
+            for i in range(300)
+        ])
+        Cashbook.objects.bulk_create([
+            Cashbook(description='-', amount=Decimal('5.00'), currency=currency, branch=self.branches[i % 3], debit=True)
+            for i in range(300)
+        ])
+
+        transfer = Transfer.objects.create(branch=self.branches[1], transfer_to=self.branch, user=user, transfer_ref='T-1')
+        TransferItems.objects.bulk_create([
+            TransferItems(transfer=transfer, from_branch=self.branches[1], to_branch=self.branches[i % 3], product=product, quantity=1, price=Decimal('10.00'), received=i % 4 != 0, description='-')
+            for i in range(300)
+        ])
+        ActivityLog.objects.bulk_create([
+            ActivityLog(branch=self.branch, inventory=self.inventory, user=user, action='Sale', quantity=1, total_quantity=10)
+            for _ in range(300)
+        ])
+        StockNotifications.objects.bulk_create([
+            # transfer notifications have no inventory row
+            StockNotifications(
+                inventory=self.inventory if i % 3 == 0 else None,
+                branch=self.branches[i % 3],
+                notification='-',
+                status=i % 10 == 0,
+                type='stock level' if i % 3 == 0 else 'stock transfer',
+            )
+            for i in range(300)
+        ])
+
+        with connection.cursor() as cursor:
+            # auto_now_add dates all fall on today, spread them over three months like a live table
+            for table, column in [('finance_cashbook', 'issue_date'), ('finance_expense', 'issue_date'), ('inventory_activitylog', 'timestamp')]:
+                cursor.execute(f'UPDATE {table} SET "{column}" = "{column}" - (id % 90)::int')
+            cursor.execute('ANALYZE')
+            # the seeded tables are small enough that a sequential scan would always win, so the planner is
+            # told not to pick one unless nothing else answers the query
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, model, index_name=None):
+        plan = queryset.explain()
+        names = [index_name] if index_name else [index.name for index in model._meta.indexes]
+        self.assertTrue(any(re.search(rf'\b{name}\b', plan) for name in names), plan)
+        self.assertNotIn(f'Seq Scan on {model._meta.db_table}', plan)
+
+    def test_invoices_of_a_branch(self):
+        start = timezone.now() - timezone.timedelta(days=7)
+        self.assertUsesIndex(Invoice.objects.filter(branch=self.branch, issue_date__gte=start), Invoice)
+        self.assertUsesIndex(Invoice.objects.filter(branch=self.branch, payment_status=Invoice.PaymentStatus.PARTIAL), Invoice)
+
+    def test_day_sales_and_payments(self):
+        sales = StockTransaction.objects.filter(
+            invoice__branch=self.branch, date=self.today, transaction_type=StockTransaction.TransactionType.SALE,
+        ).values('item__id').annotate(quantity_sold=Sum('quantity'))
+        self.assertUsesIndex(sales, StockTransaction)
+        self.assertUsesIndex(Payment.objects.filter(invoice=self.invoice).order_by('-payment_date'), Payment)
+
+    def test_cashbook_and_expenses_of_a_day(self):
+        self.assertUsesIndex(Cashbook.objects.filter(branch=self.branch, issue_date__gte=self.today), Cashbook)
+        self.assertUsesIndex(Expense.objects.filter(branch=self.branch, issue_date=self.today), Expense)
+
+    def test_stock_pages(self):
+        from inventory.models import TransferItems, ActivityLog, StockNotifications
+
+        self.assertUsesIndex(TransferItems.objects.filter(to_branch=self.branch, received=False).order_by('-date'), TransferItems)
+        self.assertUsesIndex(ActivityLog.objects.filter(inventory=self.inventory, timestamp__gte=self.today - timezone.timedelta(days=7)), ActivityLog)
+        self.assertUsesIndex(
+            StockNotifications.objects.filter(inventory=self.inventory, type='stock level', status=True),
+            StockNotifications,
+            'stock_notifications_active',
+        )
+        self.assertUsesIndex(
+            StockNotifications.objects.filter(branch=self.branch, status=True, id__gt=100).order_by('id'),
+            StockNotifications,
+            'stock_notifications_feed',
+        )
@@ -0,0 +1,55 @@
+"""
+Cash transfer broadcasts.
+
+Every ``CashTransferConsumer`` joins the channel layer group of its user's branch. When a transfer is
+created or received, ``transfer_changed`` publishes the event to the sending and the receiving branch
+once the change commits: two ``group_send`` calls whatever the number of open sockets. With the Redis
+layer the event reaches the clients of every worker and node, and a slow socket only delays itself.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+import logging
+logger = logging.getLogger(__name__)
+
+CREATED = 'created'
+RECEIVED = 'received'
+
+
+def group_name(branch_id):
+    return f'cash_transfers_{branch_id}'
+
+
+def payload(transfer):
+    return {
+        'id': transfer.id,
+        'from_branch': transfer.from_branch_id,
+        'from_branch_name': transfer.from_branch.name,
+        'to': transfer.to_id,
+        'to_name': transfer.to.name,
+        'amount': str(transfer.amount),
+        'currency': transfer.currency.symbol,
+        'transfer_method': transfer.transfer_method,
+        'received': transfer.received_status,
+        'notification': f'Receive {transfer.currency.symbol} {transfer.amount} send from {transfer.from_branch}',
+    }
+
+
+def transfer_changed(transfer, event):
+    """ Publishes ``event`` about ``transfer`` to both of its branches after the current transaction commits. """
+    message = {'type': 'cash.transfer', 'event': event, 'transfer': payload(transfer)}
+    branch_ids = {transfer.from_branch_id, transfer.to_id}
+    transaction.on_commit(lambda: publish(branch_ids, message))
+
+
+def publish(branch_ids, message):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    for branch_id in branch_ids:
+        try:
+            async_to_sync(layer.group_send)(group_name(branch_id), message)
+        except Exception as e:
+            # the notifications list still has the transfer
+            logger.warning(f'[Cash transfers] branch {branch_id}: {e}')
@@ -76,6 +76,7 @@ urlpatterns = [
     
     # end of day
     path('end_of_day/', end_of_day, name='end_of_day'),
+    path('end_of_day/<str:date>/', z_report, name='z_report'),
     
     #settings
     path('settings/', finance_settings, name='finance_setings'),
@@ -1,3 +1,8 @@
+from decimal import Decimal
+from collections import defaultdict
+from django.utils import timezone
+
+
 def calculate_expenses_totals(expense_queryset):
     """Calculates the total cost of all expenses in a queryset."""
 
@@ -7,4 +12,80 @@ def calculate_expenses_totals(expense_queryset):
     return total_cost
 
 
+def record_invoice_items(invoice, items_data, user, vat_rate, cogs=None):
+    """
+    Deducts stock and writes the invoice lines for a checkout in a fixed number of queries.
+
+    The stock of every row in the cart is decremented by one conditional update, see
+    ``inventory.stock``, that refuses the sale when a row does not hold enough. The InvoiceItem,
+    StockTransaction and ActivityLog rows are bulk created. Must be called inside a transaction.
+    """
+    from inventory.models import Inventory, ActivityLog
+    from inventory import stock, activity
+    from .models import InvoiceItem, StockTransaction, COGSItems
+
+    # a product can appear on more than one cart line
+    sold = defaultdict(int)
+    for item_data in items_data:
+        sold[int(item_data['inventory_id'])] += int(item_data['quantity'])
+
+    # raises before anything is written when a row is short
+    quantities = stock.adjust({pk: -quantity for pk, quantity in sold.items()})
+    inventory = Inventory.objects.select_related('product').in_bulk(list(sold))
+
+    # a line shows the quantity left after it, later lines of the same row come back up to the total
+    left = {pk: quantities.get(pk, inventory[pk].quantity) + quantity for pk, quantity in sold.items()}
+
+    rate = Decimal(vat_rate.rate) / Decimal('100')
+    today = timezone.now()
+
+    invoice_items, stock_transactions, logs = [], [], []
+    for item_data in items_data:
+        item = inventory[int(item_data['inventory_id'])]
+        quantity = int(item_data['quantity'])
+        unit_price = Decimal(str(item_data['price']))
+
+        # InvoiceItem.save is bypassed by bulk_create so the amounts are set here
+        subtotal = unit_price * quantity
+        left[item.id] -= quantity
+
+        invoice_items.append(InvoiceItem(
+            invoice=invoice,
+            item=item,
+            quantity=quantity,
+            unit_price=unit_price,
+            vat_rate=vat_rate,
+            vat_amount=subtotal * rate,
+            total_amount=subtotal,
+        ))
+
+        stock_transactions.append(StockTransaction(
+            item=item.product,
+            transaction_type=StockTransaction.TransactionType.SALE,
+            quantity=quantity,
+            unit_price=item.price,
+            invoice=invoice,
+            date=today,
+        ))
+
+        logs.append(ActivityLog(
+            branch=user.branch,
+            inventory=item,
+            user=user,
+            quantity=quantity,
+            total_quantity=left[item.id],
+            action='Sale',
+            invoice=invoice,
+        ))
+
+    InvoiceItem.objects.bulk_create(invoice_items)
+    StockTransaction.objects.bulk_create(stock_transactions)
+    ActivityLog.objects.bulk_create(logs)
+    # bulk_create skips the ActivityLog signals
+    activity.movements_changed(sold)
+
+    # cost of sales item, one per invoice
+    if cogs is not None and invoice_items:
+        COGSItems.objects.create(invoice=invoice, cogs=cogs, product=invoice_items[0].item)
 
+    return invoice_items
@@ -4,7 +4,6 @@ from decimal import Decimal
 from io import BytesIO
 from users.models import User
 from company.models import Branch
-from .consumers import CashTransferConsumer 
 from xhtml2pdf import pisa 
 from django.views import View
 from django.db.models import Q
@@ -19,19 +18,23 @@ from django.http import JsonResponse
 from utils.utils import generate_pdf
 from asgiref.sync import async_to_sync, sync_to_async
 from inventory.models import Inventory
-from channels.layers import get_channel_layer
+from inventory.stock import InsufficientStock
 import json, datetime, os, boto3, openpyxl 
 from utils.account_name_identifier import account_identifier
-from .tasks import send_invoice_email_task, send_account_statement_email
+from utils import exports, pdf
+from .tasks import send_invoice_email_task, send_account_statement_email, send_day_report_whatsapp
 from pytz import timezone as pytz_timezone 
 from openpyxl.styles import Alignment, Font
-from . utils import calculate_expenses_totals
+from . utils import calculate_expenses_totals, record_invoice_items
+from . cashbook import balance_brought_forward
+from . import rollups, closing, recurring
 from django.utils.dateparse import parse_date
 from django.templatetags.static import static
 from django.db.models import Sum, DecimalField
 from inventory.models import ActivityLog, Product
 from django.http import JsonResponse, HttpResponse
 from django.template.loader import render_to_string
+from django.urls import reverse
 from django.core.mail import send_mail, EmailMessage
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
@@ -123,26 +126,21 @@ def expenses(request):
         expenses = Expense.objects.filter(issue_date__gte=start_date, issue_date__lte=end_date, branch=request.user.branch).order_by('issue_date')
         
         if download:
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = f'attachment; filename="expenses_report_{filter_option}.csv"'
-
-            writer = csv.writer(response)
-            writer.writerow(['Date', 'Description', 'Done By', 'Amount'])
-
-            total_expense = 0  
-            for expense in expenses:
-                total_expense += expense.amount
-
-                writer.writerow([
-                    expense.issue_date,
-                    expense.description,
-                    expense.user.first_name,
-                    expense.amount,
-                ])
-
-            writer.writerow(['Total', '', '', total_expense])
-            
-            return response
+            def rows():
+                total_expense = 0
+                for issue_date, description, first_name, amount in exports.iterate(
+                    expenses.values_list('issue_date', 'description', 'user__first_name', 'amount')
+                ):
+                    total_expense += amount
+                    yield [issue_date, description, first_name, amount]
+
+                yield ['Total', '', '', total_expense]
+
+            return exports.csv_response(
+                f'expenses_report_{filter_option}.csv',
+                ['Date', 'Description', 'Done By', 'Amount'],
+                rows(),
+            )
         
         return render(request, 'finance/expenses.html', 
             {
@@ -587,6 +585,9 @@ def create_invoice(request):
                     
                     # laybyDates.objects.bulk_create(layby_dates)
                 
+                if invoice.reocurring:
+                    recurring.schedule(invoice)
+
                 # create monthly installment object
                 if invoice.payment_terms == 'installment':
                     recurringInvoices.objects.create(
@@ -610,54 +611,14 @@ def create_invoice(request):
                 # Cost of sales parent object
                 
                 
-                # Create InvoiceItem objects
-                for item_data in items_data:
-                    item = Inventory.objects.get(pk=item_data['inventory_id'])
-                    product = Product.objects.get(pk=item.product.id)
-                    
-                    item.quantity -= item_data['quantity']
-                    item.save()
-                  
-                    InvoiceItem.objects.create(
-                        invoice=invoice,
-                        item=item,
-                        quantity=item_data['quantity'],
-                        unit_price=item_data['price'],
-                        vat_rate = vat_rate
-                    )
-                    
-                    # Create StockTransaction for each sold item
-                    stock_transaction = StockTransaction.objects.create(
-                        item=product,
-                        transaction_type=StockTransaction.TransactionType.SALE,
-                        quantity=item_data['quantity'],
-                        unit_price=item.price,
-                        invoice=invoice,
-                        date=timezone.now()
-                    )
-
-                    # cost of sales item
-                    COGSItems.objects.get_or_create(
-                        invoice=invoice,
-                        defaults={'cogs': cogs, 'product': Inventory.objects.get(product=product, branch=request.user.branch)}
-                    )
-                    
-                    # stock log  
-                    ActivityLog.objects.create(
-                        branch=request.user.branch,
-                        inventory=item,
-                        user=request.user,
-                        quantity=item_data['quantity'],
-                        total_quantity = item.quantity,
-                        action='Sale',
-                        invoice=invoice
-                    )
+                # Create InvoiceItem, StockTransaction, COGSItems and ActivityLog objects
+                record_invoice_items(invoice, items_data, request.user, vat_rate, cogs=cogs)
                     
                 # # Create VATTransaction
                 VATTransaction.objects.create(
                     invoice=invoice,
                     vat_type=VATTransaction.VATType.OUTPUT,
-                    vat_rate=VATRate.objects.get(status=True).rate,
+                    vat_rate=vat_rate.rate,
                     tax_amount=invoice_data['vat_amount']
                 )                                                          
                 # Create Sale object
@@ -700,48 +661,13 @@ def create_invoice(request):
                 # return redirect('finance:invoice_preview', invoice.id)
                 return JsonResponse({'success':True, 'invoice_id': invoice.id})
 
-        except (KeyError, json.JSONDecodeError, Customer.DoesNotExist, Inventory.DoesNotExist) as e:
+        except (KeyError, json.JSONDecodeError, Customer.DoesNotExist, Inventory.DoesNotExist, InsufficientStock) as e:
             return JsonResponse({'success': False, 'error': str(e)})
 
     return render(request, 'finance/invoices/add_invoice.html')
 
 def held_invoice(items_data, invoice, request, vat_rate):
-    for item_data in items_data:
-        item = Inventory.objects.get(pk=item_data['inventory_id'])
-        product = Product.objects.get(pk=item.product.id)
-                    
-        item.quantity -= item_data['quantity']
-        item.save()
-                  
-        InvoiceItem.objects.create(
-            invoice=invoice,
-            item=item,
-            quantity=item_data['quantity'],
-            unit_price=item_data['price'],
-            vat_rate = vat_rate
-        )
-                    
-                    # Create StockTransaction for each sold item
-        stock_transaction = StockTransaction.objects.create(
-            item=product,
-            transaction_type=StockTransaction.TransactionType.SALE,
-            quantity=item_data['quantity'],
-            unit_price=item.price,
-            invoice=invoice,
-            date=timezone.now()
-        )
-                    
-        # stock log  
-        ActivityLog.objects.create(
-            branch=request.user.branch,
-            inventory=item,
-            user=request.user,
-            quantity=item_data['quantity'],
-            total_quantity = item.quantity,
-            action='Sale',
-            invoice=invoice
-        )
-
+    record_invoice_items(invoice, items_data, request.user, vat_rate)
 
 def create_invoice_pdf(invoice):
     # Buffer to hold the PDF
@@ -1037,37 +963,21 @@ def customer_list(request):
         logger.info(f'Customers:{total_balances_per_currency.values}')
 
     if 'download' in request.GET: 
-        customers = Customer.objects.all() 
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=customers.xlsx'
-
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-        
-        header_font = Font(bold=True)
-        header_alignment = Alignment(horizontal='center')
-        for col_num, header_title in enumerate(['Customer Name', 'Phone Number', 'Email', 'Account Balance'], start=1):
-            cell = worksheet.cell(row=1, column=col_num)
-            cell.value = header_title
-            cell.font = header_font
-            cell.alignment = header_alignment
-            
-            column_letter = openpyxl.utils.get_column_letter(col_num)
-            worksheet.column_dimensions[column_letter].width = max(len(header_title), 20)
-
-        customer_accounts = CustomerAccountBalances.objects.all()
-        for customer in customer_accounts:
-            worksheet.append(
-                [
-                    customer.account.customer.name, 
-                    customer.account.customer.phone_number, 
-                    customer.account.customer.email, 
-                    customer.balance if customer.balance else 0,
-                ]
-            )  
-            
-        workbook.save(response)
-        return response
+        customer_accounts = CustomerAccountBalances.objects.values_list(
+            'account__customer__name',
+            'account__customer__phone_number',
+            'account__customer__email',
+            'balance',
+        ).order_by('id')
+
+        return exports.xlsx_response(
+            'customers.xlsx',
+            ['Customer Name', 'Phone Number', 'Email', 'Account Balance'],
+            (
+                [name, phone_number, email, balance if balance else 0]
+                for name, phone_number, email, balance in exports.iterate(customer_accounts)
+            ),
+        )
         
     return render(request, 'finance/customers/customers.html', {
         'customers':customers, 
@@ -1627,7 +1537,9 @@ def expenses_report(request):
             'report_date': datetime.date.today(),
             'total_expenses':calculate_expenses_totals(expenses),
             'expenses':expenses
-        }
+        },
+        request=request,
+        filename='expenses.pdf',
     )
 
 
@@ -1710,7 +1622,9 @@ def invoice_pdf(request):
             'report_date': datetime.date.today(),
             'invoice':invoice,
             'invoice_items':invoice_items
-        }
+        },
+        request=request,
+        filename=f'invoice_{invoice.invoice_number}.pdf',
     )
    
 # emails
@@ -1718,36 +1632,11 @@ def invoice_pdf(request):
 def send_invoice_email(request):
     if request.method == 'POST':
         data = json.loads(request.body)
-        invoice_id = data['invoice_id']
-        invoice = Invoice.objects.get(id=invoice_id)
-        invoice_items = InvoiceItem.objects.filter(invoice=invoice)
-        account = CustomerAccount.objects.get(customer__id = invoice.customer.id)
-        
-        html_string = render_to_string('Pos/receipt.html', {'invoice': invoice, 'invoice_items':invoice_items, 'account':account})
-        buffer = BytesIO()
-
-        pisa.CreatePDF(html_string, dest=buffer) 
-
-        email = EmailMessage(
-            'Your Invoice',
-            'Please find your invoice attached.',
-            'your_email@example.com',
-            ['recipient_email@example.com'],
-        )
-        
-        buffer.seek(0)
-        email.attach(f'invoice_{invoice.invoice_number}.pdf', buffer.getvalue(), 'application/pdf')
+        invoice = get_object_or_404(Invoice, id=data['invoice_id'])
 
-        # Send the email
-        email.send()
-
-        task = send_invoice_email_task.delay(data['invoice_id']) 
-        task_id = task.id 
-        buffer.seek(0)
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename=invoice_{invoice.invoice_number}.pdf'
-        
-        return response
+        # queued in the outbox, the PDF is rendered, or taken from the stored copy, when it is sent
+        send_invoice_email_task(invoice.id)
+        return JsonResponse({'success': True})
     return JsonResponse({'success': False, 'error':'error'})
 
 
@@ -1808,136 +1697,52 @@ def send_invoice_whatsapp(request, invoice_id):
 
 @login_required
 def end_of_day(request):
-    today = timezone.now().date()
-    
-    user_timezone_str = request.user.timezone if hasattr(request.user, 'timezone') else 'UTC'
-    user_timezone = pytz_timezone(user_timezone_str)  
+    branch_id = request.user.branch.id
+    today = timezone.localdate()
 
-    # make a utility
-    def filter_by_date_range(start_date, end_date):
-        start_datetime = user_timezone.localize(
-            timezone.datetime.combine(start_date, timezone.datetime.min.time())
-        )
-        end_datetime = user_timezone.localize(
-            timezone.datetime.combine(end_date, timezone.datetime.max.time())
-        )
-        return Invoice.objects.filter(branch=request.user.branch, issue_date__range=[start_datetime, end_datetime])
-
-    now = timezone.now().astimezone(user_timezone)
-    today = now.date()
-
-    now = timezone.now() 
-    today = now.date()  
-    
-    invoices = filter_by_date_range(today, today)
-    withdrawals = CashWithdraw.objects.filter(user__branch=request.user.branch, date=today, status=False)
-    
-    total_cash_amounts = [
-        {
-            'total_invoices_amount' : invoices.aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0,
-            'total_withdrawals_amount' : withdrawals.aggregate(Sum('amount'))['amount__sum'] or 0
-        }
-    ]
-
-    sold_inventory = (
-        StockTransaction.objects
-        .filter(invoice__branch=request.user.branch, date=today, transaction_type=StockTransaction.TransactionType.SALE)
-        .values('item__id', 'item__name')
-        .annotate(quantity_sold=Sum('quantity'))
-    )
-    
     if request.method == 'GET':
-        all_inventory = Inventory.objects.filter(branch=request.user.branch, status=True).values(
-            'id', 'product__name', 'quantity'
-        )
-
-        inventory_data = []
-        for item in sold_inventory:
-            sold_info = next((inv for inv in all_inventory if item['item__id'] == inv['id']), None)
-            
-            if sold_info:
-                inventory_data.append({
-                    'id': item['item__id'],
-                    'name': item['item__name'],
-                    'initial_quantity': item['quantity_sold'] + sold_info['quantity'] if sold_info else 0,
-                    'quantity_sold':  item['quantity_sold'],
-                    'remaining_quantity':sold_info['quantity'] if sold_info else 0,
-                    'physical_count': None
-                })
-           
-        return JsonResponse({'inventory': inventory_data, 'total_cash_amounts':total_cash_amounts})
+        return JsonResponse({
+            'inventory': closing.stock_take(branch_id, today),
+            'total_cash_amounts': [closing.cash_totals(branch_id, today)],
+        })
     
     elif request.method == 'POST':
         try:
             data = json.loads(request.body)
-            inventory_data = []
-            
-            for item in data:
-                try:
-                    inventory = Inventory.objects.get(id=item['item_id'], branch=request.user.branch, status=True)
-                    inventory.physical_count = item['physical_count']
-                    inventory.save()
-
-                    sold_info = next((i for i in sold_inventory if i['item__id'] == inventory.id), None)
-                    inventory_data.append({
-                        'id': inventory.id,
-                        'name': inventory.product.name,
-                        'initial_quantity': inventory.quantity,
-                        'quantity_sold': sold_info['quantity_sold'] if sold_info else 0,
-                        'remaining_quantity': inventory.quantity - (sold_info['quantity_sold'] if sold_info else 0),
-                        'physical_count': inventory.physical_count,
-                        'difference': inventory.physical_count - (inventory.quantity - (sold_info['quantity_sold'] if sold_info else 0))
-                    })
-                except Inventory.DoesNotExist:
-                    return JsonResponse({'success': False, 'error': f'Inventory item with id {item["item_id"]} does not exist.'})
-
-            today_min = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_max = timezone.now().replace(hour=23, minute=59, second=59, microsecond=999999)
-            
-            # Invoice data
-            invoices = Invoice.objects.filter(branch=request.user.branch, issue_date__range=(today_min, today_max))
-            partial_invoices = invoices.filter(payment_status=Invoice.PaymentStatus.PARTIAL)
-            paid_invoices = invoices.filter(payment_status=Invoice.PaymentStatus.PAID, branch=request.user.branch)
-           
-            # Expenses
-            expenses = Expense.objects.filter(branch=request.user.branch, date=today)
-            confirmed_expenses = expenses.filter(status=True)
-            unconfirmed_expenses = expenses.filter(status=False)
-            
-            # Accounts
-            account_balances = AccountBalance.objects.filter(branch=request.user.branch)
-
-            html_string = render_to_string('day_report.html', {
-                'request':request,
-                'invoices':invoices,
-                'expenses':expenses,
-                'date': today,
-                'inventory_data': inventory_data,
-                'total_sales': paid_invoices.aggregatea,
-                'partial_payments': partial_invoices.aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0,
-                'total_paid_invoices': paid_invoices.count(),
-                'total_partial_invoices': partial_invoices.count(),
-                'total_expenses': confirmed_expenses.aggregate(Sum('amount'))['amount__sum'] or 0,
-                'confirmed_expenses': confirmed_expenses,
-                'unconfirmed_expenses': unconfirmed_expenses,
-                'account_balances': account_balances,
-            })
-            
-            pdf_buffer = BytesIO()
-            pisa_status = pisa.CreatePDF(html_string, dest=pdf_buffer)
-            if not pisa_status.err:
-                filename = f"{request.user.branch.name}_today_report_{today}.pdf"
-                return JsonResponse({"success": True})
-            else:
-                return JsonResponse({"success": False, "error": "Error generating PDF."})
+            report = closing.close(branch_id, today, request.user, {item['item_id']: item['physical_count'] for item in data})
         except json.JSONDecodeError:
             return JsonResponse({'success': False, 'error': 'Invalid JSON data.'})
-        except Exception as e:
-            logger.exception(f"Error processing request: {e}")
+        except closing.AlreadyClosed as e:
+            return JsonResponse({
+                'success': False, 'error': str(e), 'report_url': reverse('finance:z_report', args=[e.closing.date])
+            }, status=409)
+        except (Inventory.DoesNotExist, KeyError, TypeError, ValueError) as e:
             return JsonResponse({'success': False, 'error': str(e)})
+
+        job_id = pdf.queue_document(request, 'day_report.html', closing.report_context(report), closing.report_filename(report))
+        return JsonResponse({
+            "success": True,
+            "job_id": job_id,
+            "status_url": reverse('job_status', args=[job_id]),
+            "report_url": reverse('finance:z_report', args=[report.date]),
+        })
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
+
+@login_required
+def z_report(request, date):
+    """ Z-report of a closed day of the branch, served from the stored closing: the PDF, or JSON with ?format=json. """
+    try:
+        day = parse_date(date)
+    except ValueError:
+        day = None
+    report = get_object_or_404(DayClosing.objects.select_related('branch', 'user'), branch=request.user.branch, date=day)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse(closing.report_data(report))
+    return pdf.pdf_response(request, 'day_report.html', closing.report_context(report), closing.report_filename(report))
+
 @login_required
 def invoice_payment_track(request):
     invoice_id = request.GET.get('invoice_id', '')
@@ -1949,78 +1754,15 @@ def invoice_payment_track(request):
     return JsonResponse(list(payments), safe=False)
 
 @login_required
-def day_report(request, inventory_data):
-    today_min = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_max = timezone.now().replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    # invoice data
-    invoices = Invoice.objects.filter(branch=request.user.branch, issue_date__range=(today_min, today_max))
-    
-    partial_invoices = invoices.filter(payment_status=Invoice.PaymentStatus.PARTIAL)
-    paid_invoices = invoices.filter(payment_status=Invoice.PaymentStatus.PAID)
-    
-    # expenses
-    expenses = Expense.objects.filter(branch=request.user.branch, date=datetime.date.today())
-    
-    confirmed_expenses = expenses.filter(status=True)
-    unconfirmed_expenses = expenses.filter(staus=False)
-    
-    # accounts
-    account_balances = AccountBalance.objects.filter(branch=request.user.branch)
+def day_report(request, date):
+    report = get_object_or_404(DayClosing.objects.select_related('branch'), branch=request.user.branch, date=parse_date(date))
     
     try:
-        html_string = render_to_string('day_report.html',{
-                'request':request,
-                'invoices':invoices,
-                'date': datetime.date.today(),
-                'inventory_data': inventory_data,
-                'total_sales': paid_invoices.aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0,
-                'partial_payments': partial_invoices.aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0,
-                'total_paid_invoices': paid_invoices.count(),
-                'expenses':expenses,
-                'total_partial_invoices': partial_invoices.count(),
-                'total_expenses': confirmed_expenses.aggregate(Sum('amount'))['amount__sum'] or 0,
-                'confirmed_expenses': confirmed_expenses,
-                'unconfirmed_expenses': unconfirmed_expenses,
-                'account_balances': account_balances,
-            })
-        
-        pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(html_string, dest=pdf_buffer)
-        if not pisa_status.err:
-            # Save PDF to S3 and get URL
-            s3 = boto3.client(
-                "s3",
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-            )
-            invoice_filename = f"{request.user.branch} today's ({datetime.date.today}) report.pdf"
-            s3.put_object(
-                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-                Key=f"daily_reports/{invoice_filename}",
-                Body=pdf_buffer.getvalue(),
-                ContentType="application/pdf",
-                ACL="public-read",
-            )
-            s3_url = f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/invoices/{invoice_filename}"
-
-            # Send WhatsApp Message with Twilio
-            account_sid = settings.TWILIO_ACCOUNT_SID
-            auth_token = settings.TWILIO_AUTH_TOKEN
-            client = Client(account_sid, auth_token)
-            from_whatsapp_number = 'whatsapp:' + '+14155238886'
-            to_whatsapp_number = 'whatsapp:' + '+263778587612'
+        html_string = pdf.render_html('day_report.html', closing.report_context(report))
 
-            message = client.messages.create(
-                from_=from_whatsapp_number,
-                body="Today's report.",
-                to=to_whatsapp_number,
-                media_url=s3_url
-            )
-
-            logger.info(f"WhatsApp message SID: {message.sid}")
-            return JsonResponse({"success": True, "message_sid": message.sid})
+        # rendered, stored and sent over WhatsApp by the worker
+        task = send_day_report_whatsapp.delay(closing.report_filename(report), html_string)
+        return JsonResponse({"success": True, "task_id": task.id})
     except Exception as e:
         logger.exception(f"Error sending invoice via WhatsApp: {e}")
         return JsonResponse({"error": "Error sending invoice via WhatsApp"})
@@ -2083,7 +1825,7 @@ def cash_transfer(request):
 
 @login_required
 def finance_notifications_json(request):
-    notifications = FinanceNotifications.objects.filter(status=True).values(
+    notifications = FinanceNotifications.objects.filter(branch=request.user.branch, status=True).values(
         'transfer__id', 
         'transfer__to',
         'expense__id',
@@ -2238,12 +1980,7 @@ def cashbook_view(request):
     total_debit = entries.filter(debit=True, cancelled=False).aggregate(Sum('amount'))['amount__sum'] or 0
     total_credit = entries.filter(credit=True, cancelled=False).aggregate(Sum('amount'))['amount__sum'] or 0
     
-    balance_bf = 0 
-    
-    previous_entries = Cashbook.objects.filter(issue_date__lt=start_date)
-    previous_debit = previous_entries.filter(debit=True).aggregate(Sum('amount'))['amount__sum'] or 0
-    previous_credit = previous_entries.filter(credit=True).aggregate(Sum('amount'))['amount__sum'] or 0
-    balance_bf = previous_debit - previous_credit
+    balance_bf = balance_brought_forward(request.user.branch_id, start_date.date())
 
     total_balance = total_debit - total_credit
     logger.info(total_balance)
@@ -2288,34 +2025,41 @@ def download_cashbook_report(request):
         start_date = now - timedelta(days=now.weekday())
         end_date = now
 
-    entries = Cashbook.objects.filter(date__gte=start_date, date__lte=end_date, branch=request.user.branch).order_by('date')
-
-    # Create a CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="cashbook_report_{filter_option}.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Description', 'Expenses', 'Income', 'Balance'])
-
-    balance = 0  
-    for entry in entries:
-        if entry.debit:
-            balance += entry.amount
-        elif entry.credit:
-            balance -= entry.amount
-
-        writer.writerow([
-            entry.issue_date,
-            entry.description,
-            entry.amount if entry.debit else '',
-            entry.amount if entry.credit else '',
-            balance,
-            entry.accountant,
-            entry.manager,
-            entry.director
-        ])
-
-    return response
+    entries = Cashbook.objects.filter(issue_date__gte=start_date, issue_date__lte=end_date, branch=request.user.branch).order_by('issue_date', 'id')
+
+    # aggregates come back at whatever scale the database keeps, the report shows cents
+    cents = Decimal('0.01')
+    balance_bf = Decimal(balance_brought_forward(request.user.branch_id, start_date.date())).quantize(cents)
+
+    def rows():
+        balance = balance_bf
+        yield [start_date.date(), 'Balance B/F', '', '', balance]
+
+        for issue_date, description, amount, debit, credit, cancelled, accountant, manager, director in exports.iterate(
+            entries.values_list('issue_date', 'description', 'amount', 'debit', 'credit', 'cancelled', 'accountant', 'manager', 'director')
+        ):
+            if debit and not cancelled:
+                balance += amount
+            elif credit and not cancelled:
+                balance -= amount
+            balance = balance.quantize(cents)
+
+            yield [
+                issue_date,
+                description,
+                amount if debit else '',
+                amount if credit else '',
+                balance,
+                accountant,
+                manager,
+                director
+            ]
+
+    return exports.csv_response(
+        f'cashbook_report_{filter_option}.csv',
+        ['Date', 'Description', 'Expenses', 'Income', 'Balance'],
+        rows(),
+    )
 
 
 @login_required
@@ -2432,36 +2176,18 @@ def cashWithdrawals(request):
         withdrawals = CashWithdraw.objects.filter(deleted=True).order_by('-date')
         
     if 'download' in request.GET:
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=withdrawals.xlsx'
-
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-        
-        header_font = Font(bold=True)
-        header_alignment = Alignment(horizontal='center')
-        for col_num, header_title in enumerate(['Date', 'User', 'Amount', 'Reason', 'Status'], start=1):
-            cell = worksheet.cell(row=1, column=col_num)
-            cell.value = header_title
-            cell.font = header_font
-            cell.alignment = header_alignment
-            
-            column_letter = openpyxl.utils.get_column_letter(col_num)
-            worksheet.column_dimensions[column_letter].width = max(len(header_title), 20)
-
-        withdrawals = CashWithdraw.objects.all().order_by('-date')
-        for withdrawal in withdrawals:
-            worksheet.append(
-                [
-                    withdrawal.date,
-                    withdrawal.user.username,
-                    withdrawal.amount,
-                    withdrawal.reason,
-                    'Canceled' if withdrawal.deleted else 'Expensed' if withdrawal.status else 'pending'
-                ])  
-            
-        workbook.save(response)
-        return response
+        withdrawals = CashWithdraw.objects.values_list(
+            'date', 'user__username', 'amount', 'reason', 'deleted', 'status'
+        ).order_by('-date', '-id')
+
+        return exports.xlsx_response(
+            'withdrawals.xlsx',
+            ['Date', 'User', 'Amount', 'Reason', 'Status'],
+            (
+                [date, username, amount, reason, 'Canceled' if deleted else 'Expensed' if status else 'pending']
+                for date, username, amount, reason, deleted, status in exports.iterate(withdrawals)
+            ),
+        )
     
     form = CashWithdrawForm()
     expense_form = cashWithdrawExpenseForm()
@@ -2593,37 +2319,34 @@ def delete_withdrawal(request, withdrawal_id):
     return redirect('finance:withdrawals')
     
     
+def month_range(year, month):
+    first_day = datetime.date(year, month, 1)
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+    return first_day, next_month - timedelta(days=1)
+
 @login_required
 def days_data(request):
-    current_month = get_current_month()
-
-    sales = Sale.objects.filter(date__month=current_month)
-    cogs = COGSItems.objects.filter(date__month=current_month)
+    today = datetime.date.today()
+    first_day, last_day = month_range(today.year, today.month)
 
-    first_day = min(sales.first().date, cogs.first().date)
+    days = list(rollups.daily(request.user.branch_id, first_day, last_day))
     
-    def get_week_data(queryset, start_date, end_date, amount_field):
-        week_data = queryset.filter(date__gte=start_date, date__lt=end_date).values(amount_field, 'date')
-        logger.info(week_data)
-        total = week_data.aggregate(total=Sum(amount_field))['total'] or 0
-        return week_data, total
+    # weeks start on the first day of the month with sales or cost of sales
+    active = [day['date'] for day in days if day['sales_total'] or day['cogs_total']]
+    first_day = active[0] if active else first_day
 
     data = {}
     for week in range(1, 5):
         week_start = first_day + timedelta(days=(week-1)*7)
         week_end = week_start + timedelta(days=7)
 
-        logger.info(week_start)
-        logger.info(week_end)
-
-        sales_data, sales_total = get_week_data(sales, week_start, week_end, 'total_amount')
-        cogs_data, cogs_total = get_week_data(cogs, week_start, week_end, 'product__cost')
+        week_days = [day for day in days if week_start <= day['date'] < week_end]
         
         data[f'week {week}'] = {
-            'sales': list(sales_data),
-            'cogs': list(cogs_data),
-            'total_sales': sales_total,
-            'total_cogs': cogs_total
+            'sales': [{'total_amount': day['sales_total'], 'date': day['date']} for day in week_days if day['sales_total']],
+            'cogs': [{'product__cost': day['cogs_total'], 'date': day['date']} for day in week_days if day['cogs_total']],
+            'total_sales': sum(day['sales_total'] for day in week_days),
+            'total_cogs': sum(day['cogs_total'] for day in week_days)
         }
 
     return JsonResponse(data)
@@ -2633,17 +2356,16 @@ def income_json(request):
     current_month = get_current_month()
     today = datetime.date.today()
     
-    month = request.GET.get('month', current_month)
-    day = request.GET.get('day', today.day)
-
-    sales = Sale.objects.filter(transaction__branch=request.user.branch)
+    month = int(request.GET.get('month', current_month))
     
     if request.GET.get('filter') == 'today':
-        sales_total = sales.filter(date=today).aggregate(Sum('total_amount'))
+        start_date, end_date = today, today
     else:
-        sales_total = sales.filter(date__month=month).aggregate(Sum('total_amount'))
+        start_date, end_date = month_range(today.year, month)
 
-    return JsonResponse({'sales_total': sales_total['total_amount__sum'] or 0})
+    sales_total = rollups.totals(request.user.branch_id, start_date, end_date)['sales']
+
+    return JsonResponse({'sales_total': sales_total})
 
 
 @login_required
@@ -2651,33 +2373,27 @@ def expense_json(request):
     current_month = get_current_month()
     today = datetime.date.today()
     
-    month = request.GET.get('month', current_month)
-    day = request.GET.get('day', today.day)
-
-    expenses = Expense.objects.filter(branch=request.user.branch)
+    month = int(request.GET.get('month', current_month))
     
     if request.GET.get('filter') == 'today':
-        expense_total = expenses.filter(issue_date=today, status=False).aggregate(Sum('amount'))
+        start_date, end_date = today, today
     else:
-        expense_total = expenses.filter(issue_date__month=month, status=False).aggregate(Sum('amount'))
+        start_date, end_date = month_range(today.year, month)
+
+    expense_total = rollups.totals(request.user.branch_id, start_date, end_date)['open_expenses']
     
-    return JsonResponse({'expense_total': expense_total['amount__sum'] or 0})
+    return JsonResponse({'expense_total': expense_total})
 
 
 @login_required
 def pl_overview(request):
     filter_option = request.GET.get('filter')
     today = datetime.date.today()
-    previous_month = get_previous_month()
     current_year = today.year
     current_month = today.month
 
-    sales = Sale.objects.filter(transaction__branch=request.user.branch)
-    expenses = Expense.objects.filter(branch=request.user.branch)
-    cogs = COGSItems.objects.filter(invoice__branch=request.user.branch)
-
     if filter_option == 'today':
-        date_filter = today
+        date_filter = (today, today)
     elif filter_option == 'last_week':
         last_week_start = today - datetime.timedelta(days=today.weekday() + 7)
         last_week_end = last_week_start + datetime.timedelta(days=6)
@@ -2690,22 +2406,19 @@ def pl_overview(request):
     else:
         date_filter = (datetime.date(current_year, current_month, 1), today)
 
-    if filter_option == 'today':
-        current_month_sales = sales.filter(date=date_filter).aggregate(total_sales=Sum('total_amount'))['total_sales'] or 0
-        current_month_expenses = expenses.filter(issue_date=date_filter).aggregate(total_expenses=Sum('amount'))['total_expenses'] or 0
-        cogs_total = cogs.objects.filter(date=date_filter).aggregate(total_cogs=Sum('product__cost'))['total_cogs'] or 0
-    elif filter_option == 'last_week':
-        current_month_sales = sales.filter(date__range=date_filter).aggregate(total_sales=Sum('total_amount'))['total_sales'] or 0
-        current_month_expenses = expenses.filter(issue_date__range=date_filter).aggregate(total_expenses=Sum('amount'))['total_expenses'] or 0
-        cogs_total = cogs.filter(date__range=date_filter).aggregate(total_cogs=Sum('product__cost'))['total_cogs'] or 0
-    else:
-        current_month_sales = sales.filter(date__range=date_filter).aggregate(total_sales=Sum('total_amount'))['total_sales'] or 0
-        current_month_expenses = expenses.filter(dissue_date__range=date_filter).aggregate(total_expenses=Sum('amount'))['total_expenses'] or 0
-        cogs_total = cogs.filter(date__range=date_filter).aggregate(total_cogs=Sum('product__cost'))['total_cogs'] or 0
+    last_day_of_previous_month = today.replace(day=1) - timedelta(days=1)
+    previous_month = month_range(last_day_of_previous_month.year, last_day_of_previous_month.month)
+
+    current = rollups.totals(request.user.branch_id, *date_filter)
+    previous = rollups.totals(request.user.branch_id, *previous_month)
+
+    current_month_sales = current['sales']
+    current_month_expenses = current['expenses']
+    cogs_total = current['cogs']
 
-    previous_month_sales = sales.filter(date__year=current_year, date__month=previous_month).aggregate(total_sales=Sum('total_amount'))['total_sales'] or 0
-    previous_month_expenses = expenses.filter(issue_date__year=current_year, issue_date__month=previous_month).aggregate(total_expenses=Sum('amount'))['total_expenses'] or 0
-    previous_cogs =  cogs.filter(date__year=current_year, date__month=previous_month).aggregate(total_cogs=Sum('product__cost'))['total_cogs'] or 0
+    previous_month_sales = previous['sales']
+    previous_month_expenses = previous['expenses']
+    previous_cogs = previous['cogs']
     
     current_net_income = current_month_sales
     previous_net_income = previous_month_sales 
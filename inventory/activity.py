@@ -0,0 +1,84 @@
+"""
+Activity of an inventory row.
+
+The monthly sales, stock in and transfer totals of the product activity chart are summed by the database,
+one row per month, and cached per inventory row until its next stock movement. The log table under the
+chart is read a page at a time with a keyset on the log id, so the newest page costs the same however
+long the history is.
+"""
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth
+
+from utils.transactions import batch_on_commit
+from .models import ActivityLog
+
+PAGE_SIZE = 50
+TIMEOUT = 24 * 60 * 60
+
+SALES = ('Sale',)
+STOCK_IN = ('stock in', 'Update')
+TRANSFERS = ('Transfer',)
+
+
+def series_key(inventory_id):
+    return f'inventory:series:{inventory_id}'
+
+
+def compute_series(inventory):
+    months = (
+        ActivityLog.objects.filter(inventory=inventory, branch_id=inventory.branch_id)
+        .annotate(month=TruncMonth('timestamp'))
+        .values('month')
+        .annotate(
+            sales=Sum('quantity', filter=Q(action__in=SALES), default=0),
+            stock_in=Sum('quantity', filter=Q(action__in=STOCK_IN), default=0),
+            transfers=Sum('quantity', filter=Q(action__in=TRANSFERS), default=0),
+        )
+        .order_by('month')
+    )
+
+    series = {'labels': [], 'sales_data': [], 'stock_in_data': [], 'transfer_data': []}
+    for month in months:
+        series['labels'].append(month['month'].strftime('%B %Y'))
+        series['sales_data'].append(month['sales'])
+        series['stock_in_data'].append(month['stock_in'])
+        series['transfer_data'].append(month['transfers'])
+    return series
+
+
+def monthly_series(inventory):
+    """ Chart labels and the sales, stock in and transfer quantity of each month, from the cache if there. """
+    series = cache.get(series_key(inventory.id))
+    if series is None:
+        series = compute_series(inventory)
+        cache.set(series_key(inventory.id), series, TIMEOUT)
+    return series
+
+
+def movements_changed(inventory_ids):
+    """ Drops the cached series of the rows once the current transaction commits. """
+    for inventory_id in inventory_ids:
+        batch_on_commit('inventory_series', inventory_id, drop_series)
+
+
+def drop_series(inventory_ids):
+    cache.delete_many([series_key(inventory_id) for inventory_id in inventory_ids])
+
+
+def log_page(inventory, before=None, size=PAGE_SIZE):
+    """
+    The ``size`` newest logs of the row older than the log id ``before``, and the ``before`` of the next
+    page, None on the last page.
+    """
+    logs = (
+        ActivityLog.objects.filter(inventory=inventory, branch_id=inventory.branch_id)
+        .select_related('user', 'invoice', 'product_transfer__transfer', 'purchase_order')
+        .order_by('-id')
+    )
+    if before:
+        logs = logs.filter(id__lt=before)
+
+    page = list(logs[:size + 1])
+    next_before = page[size - 1].id if len(page) > size else None
+    return page[:size], next_before
@@ -1,27 +1,31 @@
-import json
-from channels.generic.websocket import AsyncWebsocketConsumer, AsyncJsonWebsocketConsumer
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .stock_push import group_name
+
 
 class InventoryConsumer(AsyncJsonWebsocketConsumer):
+    """ Stock movements of the user's branch, as pushed by ``inventory.stock_push``. """
+
     async def connect(self):
         self.branch_id = self.scope['url_route']['kwargs']['branch_id']
-        self.group_name = f'branch_{self.branch_id}'
-        print(self.branch_id)
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or user.branch_id != self.branch_id:
+            await self.close()
+            return
 
+        self.group_name = group_name(self.branch_id)
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
         )
-    
-    async def disconnect(self, close_code):  
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-    )
-
+        await self.accept()
 
-    # async def stock_update(self, event):
-    #     await self.send(text_data=json.dumps({
-    #         'product': event['product'],
-    #         'quantity': event['quantity']
-    #     }))
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
+    async def stock_delta(self, event):
+        await self.send_json({'type': 'stock', 'items': event['items']})
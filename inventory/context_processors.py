@@ -1,4 +1,5 @@
 from techcity.settings import LOW_STOCK_THRESHHOLD
+from utils.context_cache import lazy_value
 from . models import ProductCategory, Inventory, StockNotifications, TransferItems
 
 def product_category_list(request):
@@ -6,34 +7,50 @@ def product_category_list(request):
 
 def product_list(request):
     if request.user.id != None:
-       return { 'inventory': Inventory.objects.filter(branch=request.user.branch, status=True)}
+       branch_id = request.user.branch_id
+       return { 'inventory': lazy_value(
+           'inventory',
+           lambda: list(Inventory.objects.filter(branch_id=branch_id, status=True).select_related('product')),
+           branch_id
+        )}
     return {}
 
 def stock_notification_count(request):
     if request.user.id != None:
-       return { 'notis_count': StockNotifications.objects.filter(
-           type='stock level',
-           status=True,
-           inventory__branch=request.user.branch
-        ).count()}
+       branch_id = request.user.branch_id
+       return { 'notis_count': lazy_value(
+           'notis_count',
+           lambda: StockNotifications.objects.filter(
+               type='stock level',
+               status=True,
+               inventory__branch_id=branch_id
+            ).count(),
+           branch_id
+        )}
     return {}
 
 def transfers(request):
     if request.user.id != None:
-        return { 'transfers_count': TransferItems.objects.filter(
-           received=False,
-           to_branch=request.user.branch
-        ).count()}
+        branch_id = request.user.branch_id
+        return { 'transfers_count': lazy_value(
+            'transfers_count',
+            lambda: TransferItems.objects.filter(
+               received=False,
+               to_branch_id=branch_id
+            ).count(),
+            branch_id
+        )}
     return {}
 
 def stock_notifications(request):
     if request.user.id != None:
-        notifications = StockNotifications.objects.filter(inventory__branch=request.user.branch, inventory__reorder=False, inventory__alert_notification=False)
+        branch_id = request.user.branch_id
+        notifications = StockNotifications.objects.filter(inventory__branch_id=branch_id, inventory__reorder=False, inventory__alert_notification=False)
         return (
             {
-                'inv_notifications_count':notifications.count(),
-                'stock_notifications':notifications,
+                'inv_notifications_count':lazy_value('inv_notifications_count', notifications.count, branch_id),
+                'stock_notifications':lazy_value('stock_notifications', lambda: list(notifications), branch_id),
             }
         )
     return {}
-    
\ No newline at end of file
+
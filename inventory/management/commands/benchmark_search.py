@@ -0,0 +1,117 @@
+import time
+import random
+import statistics
+from decimal import Decimal
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+
+from company.models import Company, Branch
+from inventory.models import Product, Inventory
+from inventory import search
+
+
+class Rollback(Exception):
+    pass
+
+
+BRANDS = [
+    'samsung', 'apple', 'huawei', 'xiaomi', 'tecno', 'itel', 'infinix', 'nokia', 'oppo', 'vivo', 'lenovo',
+    'hp', 'dell', 'acer', 'asus', 'toshiba', 'sony', 'lg', 'hisense', 'jbl', 'anker', 'oraimo', 'baseus',
+    'logitech', 'tplink', 'dlink', 'canon', 'epson', 'brother', 'kingston', 'sandisk', 'seagate', 'wd',
+]
+TYPES = [
+    'charger', 'cable', 'screen protector', 'back cover', 'battery', 'adapter', 'hdmi cable', 'usb hub',
+    'headphones', 'earbuds', 'speaker', 'mouse', 'keyboard', 'router', 'switch', 'printer', 'toner',
+    'ink cartridge', 'memory card', 'flash drive', 'hard drive', 'power bank', 'laptop bag', 'monitor',
+    'webcam', 'smart watch', 'tablet', 'phone', 'laptop', 'extension cord', 'surge protector', 'ups',
+]
+EXTRAS = ['fast', 'wireless', 'original', 'black', 'white', 'braided', 'portable', 'dual', 'type c', 'micro usb']
+
+
+def product_name(rng, i):
+    model = ''.join(rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ0123456789') for _ in range(5))
+    return f'{rng.choice(BRANDS)} {rng.choice(EXTRAS)} {rng.choice(TYPES)} {model}'
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks product search latency on a generated catalog. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--memory', action='store_true', help='Use the in-memory index instead of the database')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['products'], options['queries'], options['memory'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, total, queries, memory):
+        rng = random.Random(42)
+        company = Company.objects.create(name='Benchmark')
+        branch = Branch.objects.create(company=company, name='Benchmark')
+
+        products = Product.objects.bulk_create(
+            (
+                Product(
+                    name=product_name(rng, i),
+                    description=f'{rng.choice(EXTRAS)} {rng.choice(TYPES)} for {rng.choice(BRANDS)} devices',
+                    batch=f'B{i % 500:04d}',
+                    price=Decimal('10.00'),
+                )
+                for i in range(total)
+            ),
+            batch_size=5000,
+        )
+        Inventory.objects.bulk_create(
+            (
+                Inventory(branch=branch, product=product, cost=Decimal('5.00'), price=Decimal('10.00'), quantity=10)
+                for product in products
+            ),
+            batch_size=5000,
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE inventory_product')
+                cursor.execute('ANALYZE inventory_inventory')
+
+        names = [product.name for product in products]
+        terms = []
+        for _ in range(queries):
+            words = rng.choice(names).split()
+            word = rng.choice(words)
+            kind = rng.random()
+            if kind < 0.4:
+                terms.append(word[:rng.randint(min(3, len(word)), len(word))])    # typing a prefix
+            elif kind < 0.7 and len(word) > 3:
+                position = rng.randrange(len(word))
+                terms.append(word[:position] + word[position + 1:])   # a missing letter
+            else:
+                terms.append(f'{words[0]} {words[-2][:3]}')
+
+        backend = 'memory' if memory or connection.vendor != 'postgresql' else 'pg_trgm'
+        queryset = Inventory.objects.filter(branch=branch, status=True)
+
+        if backend == 'memory':
+            start = time.perf_counter()
+            index = search.memory_index(branch.id)
+            self.stdout.write(f'index built in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+        timings = []
+        for term in terms:
+            start = time.perf_counter()
+            if backend == 'memory':
+                index.search(term)
+            else:
+                search.trigram_search(queryset, term)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{backend}: {total} products, {queries} queries, '
+            f'p50 {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms, max {timings[-1]:.2f} ms'
+        )
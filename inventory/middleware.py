@@ -1,4 +1,11 @@
+import time
 from threading import local
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from utils import profiling
 
 _request = local()
 
@@ -10,3 +17,35 @@ class RequestMiddleware(object):
     def __call__(self, request):
         _request.request = request
         return self.get_response(request)
+
+
+class ProfilingMiddleware(object):
+    """
+    Records query count, database time, repeated queries, Python time and response size per request.
+    Switched on with the PROFILING_ENABLED setting, the results are on the settings profiling page.
+    """
+    skip_paths = ('/static/', '/media/')
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(self.skip_paths):
+            return self.get_response(request)
+
+        recorder = profiling.QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        endpoint = (match.view_name if match else None) or request.path
+        size = 0 if response.streaming else len(response.content)
+
+        profiling.record(endpoint, request.method, request.path, response.status_code, total, recorder, size)
+        return response
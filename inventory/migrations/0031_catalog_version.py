@@ -0,0 +1,51 @@
+# Generated by Django 4.2.16 on 2026-10-18 10:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("company", "0002_documentsequence"),
+        ("inventory", "0030_alter_product_cost_alter_product_end_of_day_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+                ("reset_version", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="inventory",
+            name="catalog_version",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="inventory",
+            index=models.Index(
+                fields=["branch", "catalog_version"],
+                name="inventory_i_branch__8c0880_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="catalogversion",
+            name="branch",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="catalog_version",
+                to="company.branch",
+            ),
+        ),
+    ]
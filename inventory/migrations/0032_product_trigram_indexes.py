@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+# icontains compiles to UPPER(column) LIKE UPPER(%s), so the GIN indexes for substring matches are on
+# UPPER(column). Products are rarely written, fastupdate is off so searches never scan a GIN pending list.
+# The GiST index on name serves the word similarity filter and the ranked top N (ORDER BY <<->), the
+# pattern index serves prefix searches shorter than a trigram.
+INDEXES = {
+    'inventory_product_name_upper_trgm': 'USING gin (UPPER(name) gin_trgm_ops) WITH (fastupdate = off)',
+    'inventory_product_description_upper_trgm': 'USING gin (UPPER(description) gin_trgm_ops) WITH (fastupdate = off)',
+    'inventory_product_batch_upper_trgm': 'USING gin (UPPER(batch) gin_trgm_ops) WITH (fastupdate = off)',
+    'inventory_product_name_trgm': 'USING gist (name gist_trgm_ops)',
+    'inventory_product_name_upper_like': '(UPPER(name) varchar_pattern_ops)',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, definition in INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON inventory_product {definition}')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0031_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+def mark_existing_emailed(apps, schema_editor):
+    # alerts raised before the digest were emailed when they were created
+    StockNotifications = apps.get_model("inventory", "StockNotifications")
+    StockNotifications.objects.update(emailed=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventory", "0032_product_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stocknotifications",
+            name="emailed",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_existing_emailed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("company", "0002_documentsequence"),
+        ("inventory", "0033_stocknotifications_emailed"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("last_log_id", models.BigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_snapshots",
+                        to="company.branch",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StockSnapshotItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.IntegerField()),
+                ("cost", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "inventory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.inventory",
+                    ),
+                ),
+                (
+                    "snapshot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="inventory.stocksnapshot",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="stocksnapshotitem",
+            constraint=models.UniqueConstraint(
+                fields=("snapshot", "inventory"), name="stock_snapshot_item"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="stocksnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("branch", "date"), name="stock_snapshot_branch_date"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventory", "0034_stock_snapshots"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="activitylog",
+            index=models.Index(
+                fields=["inventory", "timestamp"], name="inventory_a_invento_cc1f8d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="activitylog",
+            index=models.Index(
+                fields=["inventory", "-id"], name="inventory_a_invento_981f0e_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stocknotifications",
+            index=models.Index(
+                condition=models.Q(("status", True)),
+                fields=["inventory", "type"],
+                name="stock_notifications_active",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transferitems",
+            index=models.Index(
+                fields=["to_branch", "received", "date"],
+                name="inventory_t_to_bran_5a2287_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventory", "0035_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="inventory",
+            name="physical_count",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
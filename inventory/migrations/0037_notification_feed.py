@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def set_branches(apps, schema_editor):
+    StockNotifications = apps.get_model("inventory", "StockNotifications")
+    Inventory = apps.get_model("inventory", "Inventory")
+    Transfer = apps.get_model("inventory", "Transfer")
+    notifications = StockNotifications.objects.filter(branch__isnull=True)
+    notifications.filter(inventory__isnull=False).update(
+        branch=models.Subquery(Inventory.objects.filter(id=models.OuterRef("inventory_id")).values("branch_id")[:1])
+    )
+    notifications.filter(inventory__isnull=True, transfer__isnull=False).update(
+        branch=models.Subquery(Transfer.objects.filter(id=models.OuterRef("transfer_id")).values("transfer_to_id")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("company", "0002_documentsequence"),
+        ("inventory", "0036_inventory_physical_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stocknotifications",
+            name="branch",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="stock_notifications",
+                to="company.branch",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stocknotifications",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="stocknotifications",
+            index=models.Index(
+                condition=models.Q(("status", True)),
+                fields=["branch", "id"],
+                name="stock_notifications_feed",
+            ),
+        ),
+        migrations.RunPython(set_branches, migrations.RunPython.noop),
+    ]
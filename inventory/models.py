@@ -4,6 +4,7 @@ from company.models import Branch
 from django.db.models import Sum
 from django.utils import timezone
 from django.db.models import F
+from utils.sequences import next_number, max_number
 
 class BatchCode(models.Model):
     code = models.CharField(max_length=255)
@@ -89,12 +90,17 @@ class PurchaseOrder(models.Model):
     batch = models.CharField(max_length=20, null=True)
     hold = models.BooleanField(null=True, default=True)
 
-    def generate_order_number():
-        return f'PO-{uuid.uuid4().hex[:10].upper()}'
+    def generate_order_number(branch):
+        prefix = f'PO{branch[:1]}'
+        new_order_number = next_number(
+            f'purchase_order:{prefix}',
+            seed=lambda: max_number(PurchaseOrder.objects.all(), 'order_number', f'{prefix}-')
+        )
+        return f'{prefix}-{new_order_number:04d}'
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            self.order_number = self.generate_order_number()
+            self.order_number = PurchaseOrder.generate_order_number(self.branch.name)
         super(PurchaseOrder, self).save(*args, **kwargs)
 
     def check_partial_status(self):
@@ -186,8 +192,22 @@ class Inventory(models.Model):
     reorder = models.BooleanField(default=False, null=True)
     alert_notification = models.BooleanField(default=False, null=True, blank=True)
     batch = models.CharField(max_length=255, blank=True, null=True)
+    catalog_version = models.BigIntegerField(default=0)
+    # last end of day count
+    physical_count = models.IntegerField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'catalog_version']),
+        ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # quantity as loaded, compared on save to spot stock level threshold crossings
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        return instance
+
     def update_stock(self, added_quantity):
         self.quantity += added_quantity
         self.save()
@@ -195,6 +215,17 @@ class Inventory(models.Model):
     def __str__(self):
         return f'{self.branch.name} : ({self.product.name}) quantity ({self.quantity})'
     
+class CatalogVersion(models.Model):
+    """Version of a branch POS catalog, bumped whenever one of its inventory rows or products change."""
+
+    branch = models.OneToOneField(Branch, on_delete=models.CASCADE, related_name='catalog_version')
+    version = models.BigIntegerField(default=0)
+    # version at the last hard delete, deltas older than this need a full sync
+    reset_version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.branch.name}: {self.version}'
+    
 class Transfer(models.Model):
     transfer_ref = models.CharField(max_length=20)
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='user_branch')
@@ -209,17 +240,11 @@ class Transfer(models.Model):
     
     @classmethod
     def generate_transfer_ref(self, branch, destination_branch):
-        last_transfer = Transfer.objects.filter(branch__name=branch).order_by('-id').first()
-        if last_transfer:
-            if str(last_transfer.transfer_ref.split(':')[0])[-1] == branch[0]:
-                last_reference_number = int(last_transfer.transfer_ref.split('-')[1]) 
-                new__reference_number = last_reference_number + 1   
-            else:
-                new__reference_number  = 1
-            return f"{branch[:1]}:{destination_branch[:1]}-{new__reference_number:04d}"  
-        else:
-            new__reference_number = 1
-            return f"{branch[:1]}:{destination_branch[:1]}-{new__reference_number:04d}"  
+        new__reference_number = next_number(
+            f'transfer:{branch[:1]}',
+            seed=lambda: max_number(Transfer.objects.all(), 'transfer_ref', f'{branch[:1]}:')
+        )
+        return f"{branch[:1]}:{destination_branch[:1]}-{new__reference_number:04d}"  
     
     
     def __str__(self):
@@ -245,6 +270,11 @@ class TransferItems(models.Model):
     received_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True)
     description = models.TextField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['to_branch', 'received', 'date']),
+        ]
+
     def __str__(self):
         return f'{self.product.name} to {self.to_branch}'
 
@@ -298,13 +328,53 @@ class ActivityLog(models.Model):
     
     class Meta:
         get_latest_by = 'timestamp'
+        indexes = [
+            models.Index(fields=['inventory', 'timestamp']),
+            # the product activity log pages newest first by id
+            models.Index(fields=['inventory', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.user} ({self.timestamp})"
     
+class StockSnapshot(models.Model):
+    """
+    The stock of a branch as it stood when the daily snapshot was taken, see ``inventory.snapshots``.
+    ``last_log_id`` is the newest ``ActivityLog`` row at that moment, later rows are the movements since.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='stock_snapshots')
+    date = models.DateField()
+    last_log_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'date'], name='stock_snapshot_branch_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.branch.name}: {self.date}'
+
+class StockSnapshotItem(models.Model):
+    snapshot = models.ForeignKey(StockSnapshot, on_delete=models.CASCADE, related_name='items')
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    cost = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot', 'inventory'], name='stock_snapshot_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.snapshot}: {self.inventory_id} ({self.quantity})'
+    
 class StockNotifications(models.Model):
     inventory = models.ForeignKey(Inventory, null=True, blank=True, on_delete=models.SET_NULL)
     transfer = models.ForeignKey(Transfer, null=True, blank=True, on_delete=models.SET_NULL)
+    # the branch that sees it, kept on the row for the notification feed
+    branch = models.ForeignKey(Branch, null=True, blank=True, on_delete=models.CASCADE, related_name='stock_notifications')
+    created_at = models.DateTimeField(auto_now_add=True)
     notification = models.CharField(max_length=255)
     status = models.BooleanField(default=False)
     type = models.CharField(max_length=30, choices=[
@@ -313,6 +383,22 @@ class StockNotifications(models.Model):
         ('stock transfer', 'stock transfer')
     ])
     quantity = models.IntegerField(blank=True, null=True, default=0)
+    emailed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # cleared notifications pile up, the lookups only ever want the active ones
+            models.Index(fields=['inventory', 'type'], condition=models.Q(status=True), name='stock_notifications_active'),
+            models.Index(fields=['branch', 'id'], condition=models.Q(status=True), name='stock_notifications_feed'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if self.branch_id is None:
+            if self.inventory_id:
+                self.branch_id = self.inventory.branch_id
+            elif self.transfer_id:
+                self.branch_id = self.transfer.transfer_to_id
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f'{self.inventory}: {self.notification}'
@@ -0,0 +1,58 @@
+"""
+Inventory spreadsheets.
+
+Each report is one ordered query whose leading columns are the groups of the sheet, written in a single
+pass by ``utils.exports.grouped_xlsx``. A report with more rows than ``REPORT_BACKGROUND_ROWS`` is built
+by the ``inventory.tasks.build_report`` task instead, and the user gets a page that links to the file once
+it is ready.
+"""
+import tempfile
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import render
+
+from utils import exports, jobs
+from .models import Inventory, ReorderList
+
+
+def stock():
+    """ Every branch's stock, in sections per branch and then per category. """
+    queryset = Inventory.objects.order_by('branch__name', 'product__category__name', 'product__name').values_list(
+        'branch__name', 'product__category__name', 'product__name', 'cost', 'price', 'quantity'
+    )
+    return queryset, {'header': ['Name', 'Cost', 'Price', 'Quantity'], 'levels': 2}
+
+
+def reorder_list(branch_id):
+    """ The branch's order list, in sections per category. """
+    queryset = ReorderList.objects.filter(branch_id=branch_id).order_by(
+        'product__product__category__name', 'product__product__name'
+    ).values_list('product__product__category__name', 'product__product__name', 'quantity')
+    return queryset, {'header': ['Name', 'Quantity'], 'levels': 1, 'title': 'Order List'}
+
+
+REPORTS = {
+    'stock': stock,
+    'reorder_list': reorder_list,
+}
+
+
+def build(report, output, **params):
+    queryset, options = REPORTS[report](**params)
+    return exports.grouped_xlsx(output, rows=exports.iterate(queryset), **options)
+
+
+def download(request, report, filename, **params):
+    """ The report as an attachment, or a page that waits on a background build when it is large. """
+    queryset, options = REPORTS[report](**params)
+
+    if queryset.count() > settings.REPORT_BACKGROUND_ROWS:
+        from .tasks import build_report
+
+        job_id = jobs.create(request.user.id, filename)
+        transaction.on_commit(lambda: build_report.delay(job_id, report, params))
+        return render(request, 'job.html', {'job_id': job_id, 'filename': filename})
+
+    output = tempfile.TemporaryFile()
+    exports.grouped_xlsx(output, rows=exports.iterate(queryset), **options)
+    return exports.xlsx_file_response(output, filename)
@@ -0,0 +1,148 @@
+"""
+Product search for the POS and inventory screens.
+
+On PostgreSQL names are ranked by pg_trgm word similarity using the GiST index on product name, which
+returns the top N straight from the index (KNN), and the list is topped up with substring matches on
+name, batch and description from the GIN indexes (migration 0032). Other databases (SQLite in tests)
+use an in-memory prefix/trigram index per branch, rebuilt whenever the branch catalog version changes.
+"""
+import re
+import bisect
+import threading
+from collections import Counter
+from django.db import connection
+from django.db.models import Q, Case, When, Value
+from django.contrib.postgres.search import TrigramWordDistance
+
+from .models import Inventory, CatalogVersion
+
+SEARCH_LIMIT = 50
+SIMILARITY_THRESHOLD = 0.3
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def search_inventory(queryset, query, branch_id, limit=SEARCH_LIMIT):
+    """ Filters ``queryset`` down to the ``limit`` best matches for ``query``, best match first. """
+    query = query.strip()
+    if not query:
+        return queryset
+
+    if connection.vendor == 'postgresql':
+        ids = trigram_search(queryset, query, limit)
+    else:
+        ids = memory_index(branch_id).search(query, limit, candidates=set(queryset.values_list('id', flat=True)))
+
+    return queryset.filter(id__in=ids).order_by(
+        Case(*[When(id=pk, then=Value(position)) for position, pk in enumerate(ids)], default=Value(len(ids)))
+    )
+
+
+def trigram_search(queryset, query, limit=SEARCH_LIMIT):
+    if len(query) < 3:
+        # too short for a trigram, match the start of the name or batch instead
+        return list(
+            queryset.filter(Q(product__name__istartswith=query) | Q(product__batch__istartswith=query))
+            .order_by('product__name').values_list('id', flat=True)[:limit]
+        )
+
+    ids = list(
+        queryset.filter(product__name__trigram_word_similar=query)
+        .order_by(TrigramWordDistance(query, 'product__name'), 'product__name')
+        .values_list('id', flat=True)[:limit]
+    )
+
+    if len(ids) < limit:
+        ids += queryset.filter(
+            Q(product__name__icontains=query) |
+            Q(product__batch__icontains=query) |
+            Q(product__description__icontains=query)
+        ).exclude(id__in=ids).values_list('id', flat=True)[:limit - len(ids)]
+    return ids
+
+
+def memory_index(branch_id):
+    version = CatalogVersion.objects.filter(branch_id=branch_id).values_list('version', flat=True).first() or 0
+
+    with _lock:
+        cached = _indexes.get(branch_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        rows = Inventory.objects.filter(branch_id=branch_id, product__isnull=False).values_list(
+            'id', 'product__name', 'product__description', 'product__batch'
+        )
+        index = TrigramIndex(rows.iterator())
+        _indexes[branch_id] = (version, index)
+        return index
+
+
+def trigrams(text):
+    """ Trigrams the way pg_trgm builds them, each word padded with two spaces in front and one behind. """
+    grams = set()
+    for word in re.findall(r'\w+', (text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """ In-memory search index, a sorted word list for prefix matches plus trigram postings for fuzzy matches. """
+
+    def __init__(self, rows):
+        self.names = {}
+        self.words = []
+        self.postings = {}
+
+        for pk, name, description, batch in rows:
+            name = (name or '').lower()
+            self.names[pk] = name
+
+            # description matches count for half, like the database ranking
+            fields = ((1.0, name), (1.0, batch), (0.5, (description or '')[:200]))
+            for weight, text in fields:
+                for gram in trigrams(text):
+                    self.postings.setdefault(gram, set()).add((pk, weight))
+
+            for word in set(re.findall(r'\w+', name)):
+                self.words.append((word, pk))
+
+        self.words.sort()
+
+    def prefix_matches(self, prefix):
+        matches = set()
+        position = bisect.bisect_left(self.words, (prefix,))
+        while position < len(self.words) and self.words[position][0].startswith(prefix):
+            matches.add(self.words[position][1])
+            position += 1
+        return matches
+
+    def search(self, query, limit=SEARCH_LIMIT, candidates=None):
+        """ Best ``limit`` matches for ``query``, only among the ``candidates`` ids when given. """
+        query = query.lower().strip()
+        scores = {}
+
+        words = re.findall(r'\w+', query)
+        if words:
+            # every word of the query has to prefix a word of the name
+            prefixed = set.intersection(*[self.prefix_matches(word) for word in words])
+            for pk in prefixed:
+                scores[pk] = 2.0 if self.names[pk].startswith(query) else 1.5
+
+        query_grams = trigrams(query)
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self.postings.get(gram, ()))
+
+        for (pk, weight), shared in overlap.items():
+            # word similarity, the share of the query trigrams found in the field
+            similarity = shared / len(query_grams) * weight
+            if similarity >= SIMILARITY_THRESHOLD and similarity > scores.get(pk, 0):
+                scores[pk] = similarity
+
+        if candidates is not None:
+            scores = {pk: score for pk, score in scores.items() if pk in candidates}
+
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], self.names[pk]))
+        return ranked[:limit]
@@ -1,9 +1,10 @@
 import datetime
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from inventory.middleware import _request
 from .models import (
     Inventory, 
+    Product,
     StockNotifications, 
     Transfer, 
     TransferItems,
@@ -13,53 +14,74 @@ from .models import (
 import logging
 logger = logging.getLogger(__name__)
 
-from .tasks import send_low_stock_email
+from . import stock_alerts, stock_push, activity
+from .utils import catalog_changed
+from utils.context_cache import invalidate
 from techcity.settings import INVENTORY_EMAIL_NOTIFICATIONS_STATUS
 
 
 @receiver(post_save, sender=Inventory)
-def low_stock_notification(sender, instance, **kwargs):
-    request = _request.request if hasattr(_request, 'request') else None
-    
-    try:
-        most_recent_stock_quantity = ActivityLog.objects.filter(inventory=instance).latest('timestamp')
-        recent_quantity = most_recent_stock_quantity.total_quantity
-    except ActivityLog.DoesNotExist:
-        logger.warning(f"No ActivityLog entry found for Inventory ID {instance.id}")
-        recent_quantity = 0
-
-    logger.info(f'{instance.product.name}: Most recent quantity -> {recent_quantity}')
-    
-    if int(instance.quantity) < int(instance.stock_level_threshold):
-       
-        if StockNotifications.objects.filter(inventory=instance, type='stock level').exists():
-            if INVENTORY_EMAIL_NOTIFICATIONS_STATUS:
-                send_low_stock_email(instance.id)
-        else:
-            StockNotifications.objects.create(
-                inventory=instance,
-                notification=f'{instance.product.name} stock level is now below stock threshold',
-                status=True,
-                type='stock level',
-                quantity=recent_quantity,
-            )
-            logger.info(f'notification created')
-            if INVENTORY_EMAIL_NOTIFICATIONS_STATUS:
-                send_low_stock_email(instance.id)
-    else:
-        
-        notifications = StockNotifications.objects.filter(
-            inventory=instance, 
-            type='stock level', 
-            status=True,
-        )
-        for notification in notifications:
-            notification.status = False
-            notification.save()
+def low_stock_notification(sender, instance, created, **kwargs):
+    if not created and not hasattr(instance, '_loaded_quantity'):
+        return
+    old_quantity = None if created else instance._loaded_quantity
+    stock_alerts.stock_changed(instance, old_quantity, instance.quantity)
+    if old_quantity != instance.quantity:
+        stock_push.stock_moved(instance.branch_id, {instance.id: (instance.quantity, (instance.quantity or 0) - (old_quantity or 0))})
+    instance._loaded_quantity = instance.quantity
+
+
+@receiver(post_save, sender=Inventory)
+def inventory_catalog_changed(sender, instance, **kwargs):
+    catalog_changed(instance.branch_id, [instance.id])
+
+
+@receiver(post_delete, sender=Inventory)
+def inventory_catalog_removed(sender, instance, **kwargs):
+    # deleted rows leave nothing to put in a delta, terminals resync the whole catalog
+    catalog_changed(instance.branch_id, [], reset=True)
+
+
+@receiver(post_save, sender=Product)
+def product_catalog_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    branches = {}
+    for branch_id, inventory_id in Inventory.objects.filter(product=instance).values_list('branch_id', 'id'):
+        branches.setdefault(branch_id, []).append(inventory_id)
+    for branch_id, inventory_ids in branches.items():
+        catalog_changed(branch_id, inventory_ids)
+
+
+@receiver(pre_delete, sender=Product)
+def product_catalog_removed(sender, instance, **kwargs):
+    product_catalog_changed(sender, instance, created=False)
+
+
+@receiver(post_save, sender=StockNotifications)
+@receiver(post_delete, sender=StockNotifications)
+def stock_notifications_changed(sender, instance, **kwargs):
+    if instance.branch_id:
+        invalidate('notis_count', 'inv_notifications_count', 'stock_notifications', 'unread_notifications', branch_id=instance.branch_id)
+
+
+@receiver(post_save, sender=ActivityLog)
+@receiver(post_delete, sender=ActivityLog)
+def activity_log_changed(sender, instance, **kwargs):
+    activity.movements_changed([instance.inventory_id])
+
+
+@receiver(post_save, sender=TransferItems)
+@receiver(post_delete, sender=TransferItems)
+def transfer_items_changed(sender, instance, **kwargs):
+    invalidate('transfers_count', branch_id=instance.to_branch_id)
 
 
 @receiver(post_save, sender=Transfer)
-def stock_transfer_notification(sender, instance, **kwargs):
+def stock_transfer_notification(sender, instance, created, **kwargs):
+    # the transfer is saved again for every item it receives
+    if not created:
+        return
     StockNotifications.objects.create(
         transfer = instance,
         notification = f'Stock Transfer created yet to be received from {instance.transfer_to}',
@@ -0,0 +1,100 @@
+"""
+Stock movements.
+
+Every change to an inventory quantity goes through ``adjust``: one conditional ``UPDATE`` that adds the
+deltas in the database and returns the new quantities, so two tills selling the same product never read,
+change and write back the same row and neither waits on the other. A decrement that would take a row
+below zero matches no row and the whole movement is rejected with ``InsufficientStock``.
+
+``queryset.update()`` skips ``post_save``, so the POS catalog bump and live stock push and the low stock
+alerts of the rows are scheduled here, and ``stock_adjusted`` is sent for each branch in its place.
+"""
+from collections import defaultdict
+from django.db import connection
+from django.dispatch import Signal
+
+from .models import Inventory
+from . import stock_alerts, stock_push
+from .utils import catalog_changed
+
+# sent with branch_id and deltas, {inventory id: quantity change} of the active rows of the branch
+stock_adjusted = Signal()
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        # {inventory id: (quantity in stock, quantity asked for)}
+        self.shortages = shortages
+        super().__init__(', '.join(
+            f'only {available} in stock for inventory {pk}, {requested} needed'
+            for pk, (available, requested) in sorted(shortages.items())
+        ))
+
+
+def _add(deltas, refuse_oversell=True):
+    """ Runs the update, returns the (id, quantity, branch_id, stock_level_threshold, status) of the changed rows. """
+    table = connection.ops.quote_name(Inventory._meta.db_table)
+    ids = sorted(deltas)
+    delta = 'CASE id ' + ' '.join('WHEN %s THEN %s' for _ in ids) + ' END'
+    delta_params = [value for pk in ids for value in (pk, deltas[pk])]
+
+    sql = f'UPDATE {table} SET quantity = COALESCE(quantity, 0) + {delta} WHERE id IN ({", ".join(["%s"] * len(ids))})'
+    params = delta_params + ids
+    if refuse_oversell:
+        # stock may already be negative from before, additions are never refused
+        sql += f' AND ({delta} >= 0 OR COALESCE(quantity, 0) + {delta} >= 0)'
+        params += delta_params + delta_params
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql + ' RETURNING id, quantity, branch_id, stock_level_threshold, status', params)
+        return cursor.fetchall()
+
+
+def adjust(deltas):
+    """
+    Adds ``deltas``, {inventory id: quantity change}, to the stock of the rows. Returns the new quantities
+    by inventory id. Raises ``InsufficientStock`` when a decrement is more than a row holds and
+    ``Inventory.DoesNotExist`` for an unknown row, in both cases nothing is changed.
+    """
+    deltas = {int(pk): int(delta) for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+
+    rows = _add(deltas)
+    if len(rows) < len(deltas):
+        updated = {row[0] for row in rows}
+        # the rows that did have the stock are put back, they stay locked by this transaction until it ends
+        if updated:
+            _add({pk: -deltas[pk] for pk in updated}, refuse_oversell=False)
+
+        stock = dict(Inventory.objects.filter(id__in=set(deltas) - updated).values_list('id', 'quantity'))
+        missing = set(deltas) - updated - set(stock)
+        if missing:
+            raise Inventory.DoesNotExist(f'Inventory matching query does not exist: {sorted(missing)}')
+        raise InsufficientStock({pk: (quantity or 0, -deltas[pk]) for pk, quantity in stock.items()})
+
+    quantities = {}
+    branches = defaultdict(list)
+    active = set()
+    for pk, quantity, branch_id, threshold, status in rows:
+        quantities[pk] = quantity
+        branches[branch_id].append(pk)
+        if status:
+            active.add(pk)
+        item = Inventory(id=pk, branch_id=branch_id, stock_level_threshold=threshold)
+        stock_alerts.stock_changed(item, quantity - deltas[pk], quantity)
+
+    for branch_id, inventory_ids in branches.items():
+        catalog_changed(branch_id, inventory_ids)
+        stock_push.stock_moved(branch_id, {pk: (quantities[pk], deltas[pk]) for pk in inventory_ids})
+        stock_adjusted.send(Inventory, branch_id=branch_id, deltas={pk: deltas[pk] for pk in inventory_ids if pk in active})
+    return quantities
+
+
+def move(item, delta):
+    """ Adds ``delta`` to the stock of the ``item`` inventory row, sets and returns its new quantity. """
+    if not delta:
+        return item.quantity
+    quantity = adjust({item.id: delta})[item.id]
+    item.quantity = item._loaded_quantity = quantity
+    return quantity
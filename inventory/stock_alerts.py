@@ -0,0 +1,68 @@
+"""
+Low stock alerts.
+
+An alert is raised when the quantity of an inventory row crosses its stock level threshold, not on every
+save. Crossings are collected for the current transaction and evaluated once, after it commits, against
+the committed quantities. The emails go out as one digest per branch from the periodic
+``inventory.tasks.send_low_stock_digest`` task.
+"""
+from django.db import transaction
+
+from utils.context_cache import invalidate
+from utils.transactions import batch_on_commit
+from .models import Inventory, StockNotifications
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def stock_changed(item, old_quantity, new_quantity):
+    """
+    Records a quantity change of ``item``, ``old_quantity`` is None for a new row. Only a change that
+    takes the quantity across the threshold is kept, so a plain sale costs nothing here.
+    """
+    threshold = item.stock_level_threshold or 0
+    was_low = old_quantity is not None and old_quantity < threshold
+    is_low = (new_quantity or 0) < threshold
+    if was_low == is_low:
+        return
+
+    batch_on_commit('stock_alerts', item.id, evaluate)
+
+
+def evaluate(inventory_ids):
+    """ Raises or clears the stock level notifications of the rows, from their committed quantities. """
+    try:
+        with transaction.atomic():
+            items = Inventory.objects.filter(id__in=inventory_ids).select_related('product')
+            low = {item.id: item for item in items if (item.quantity or 0) < (item.stock_level_threshold or 0)}
+            recovered = [item.id for item in items if item.id not in low]
+
+            notifications = StockNotifications.objects.filter(type='stock level')
+            existing = set(notifications.filter(inventory_id__in=low).values_list('inventory_id', flat=True))
+
+            # raised again after being cleared: a new row, so the feed and the digest pick it up once more
+            if existing:
+                notifications.filter(inventory_id__in=existing, status=False).delete()
+                existing = set(notifications.filter(inventory_id__in=existing).values_list('inventory_id', flat=True))
+
+            StockNotifications.objects.bulk_create([
+                StockNotifications(
+                    inventory=item,
+                    branch_id=item.branch_id,
+                    notification=f'{item.product.name} stock level is now below stock threshold',
+                    status=True,
+                    type='stock level',
+                    quantity=item.quantity,
+                )
+                for pk, item in low.items() if pk not in existing
+            ])
+
+            if recovered:
+                notifications.filter(inventory_id__in=recovered, status=True).update(status=False)
+
+            # bulk writes skip the StockNotifications signals
+            for branch_id in {item.branch_id for item in items}:
+                invalidate('notis_count', 'inv_notifications_count', 'stock_notifications', 'unread_notifications', branch_id=branch_id)
+    except Exception as e:
+        logger.error(f'Low stock alerts for {sorted(inventory_ids)}: {e}', exc_info=True)
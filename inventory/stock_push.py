@@ -0,0 +1,84 @@
+"""
+Live stock for the POS.
+
+Committed stock movements are pushed to the ``branch_<id>`` channel group that ``InventoryConsumer``
+joins, so terminals update their catalog instead of polling it. ``stock_moved`` runs once the movement
+commits and adds its rows to the pending push of their branch. The first one starts a ``WINDOW`` timer,
+and everything that commits before it fires goes out in the same message. That is one message per branch
+per window, however busy the tills are. A row moved more than once in a window is sent once, with its
+latest quantity and the sum of its deltas.
+"""
+import threading
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+import logging
+logger = logging.getLogger(__name__)
+
+WINDOW = 0.25  # seconds
+
+_lock = threading.Lock()
+# {branch id: {inventory id: [quantity, delta]}}
+_pending = {}
+_timers = {}
+
+
+def group_name(branch_id):
+    return f'branch_{branch_id}'
+
+
+def stock_moved(branch_id, changes):
+    """ Pushes ``changes``, {inventory id: (new quantity, delta)}, to the branch after the current transaction commits. """
+    changes = dict(changes)
+    if branch_id and changes:
+        transaction.on_commit(lambda: _add(branch_id, changes))
+
+
+def _add(branch_id, changes):
+    with _lock:
+        pending = _pending.setdefault(branch_id, {})
+        for inventory_id, (quantity, delta) in changes.items():
+            if inventory_id in pending:
+                delta += pending[inventory_id][1]
+            pending[inventory_id] = [quantity, delta]
+
+        if branch_id not in _timers:
+            timer = _timers[branch_id] = threading.Timer(WINDOW, flush, args=(branch_id,))
+            timer.daemon = True
+            timer.start()
+
+
+def reset():
+    """ Drops every pending push and cancels its timer. """
+    with _lock:
+        for timer in _timers.values():
+            timer.cancel()
+        _timers.clear()
+        _pending.clear()
+
+
+def flush(branch_id):
+    """ Sends the pending push of the branch now. """
+    with _lock:
+        timer = _timers.pop(branch_id, None)
+        pending = _pending.pop(branch_id, None)
+    if timer is not None:
+        timer.cancel()
+    if not pending:
+        return
+
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(group_name(branch_id), {
+            'type': 'stock.delta',
+            'items': [
+                {'inventory_id': inventory_id, 'quantity': quantity, 'delta': delta}
+                for inventory_id, (quantity, delta) in sorted(pending.items())
+            ],
+        })
+    except Exception as e:
+        # terminals resync from product_list when they reconnect
+        logger.warning(f'[Stock push] branch {branch_id}: {e}')
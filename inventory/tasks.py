@@ -1,13 +1,18 @@
-import threading
+import tempfile
 from . models import *
-from utils.utils import send_mail_func
+from celery import shared_task
 from django.core.mail import EmailMessage
+from django.db import transaction
 from django.template.loader import render_to_string
-from techcity.settings import SYSTEM_EMAIL
+from utils import jobs
+from settings.outbox import queue_email
+from techcity.settings import SYSTEM_EMAIL, INVENTORY_EMAIL_NOTIFICATIONS_STATUS
 
 import logging
 logger = logging.getLogger(__name__)
 
+STOCK_ALERT_EMAILS = ['admin@techcity.co.zw', 'cassymyo@gmail.com'] #'pcpasels@gmail.com'
+
 def send_stock_transfer_email(notification_id):
     notification = StockNotifications.objects.get(pk=notification_id)
     subject = 'Stock Transfer Notification'
@@ -17,39 +22,44 @@ def send_stock_transfer_email(notification_id):
     email = EmailMessage(subject, message, from_email, [to_email])
     email.send()
 
-def send_low_stock_email(notification_id):
-    # Validate inputs
-    if not notification_id:
-        logger.error("Invalid notification_id provided.")
+@shared_task
+def send_low_stock_digest():
+    """ Queues an email of the stock level alerts raised since the last run for every branch. """
+    if not INVENTORY_EMAIL_NOTIFICATIONS_STATUS:
         return
-    
-    try:
-        notification = StockNotifications.objects.get(inventory__id=notification_id)
-        
-        branch = notification.inventory.branch.name
-        product = notification.inventory.product.name
-        threshold = notification.inventory.stock_level_threshold
-        quantity = notification.inventory.quantity
-        
-        subject = 'Low stock notification'
-        message = f'''Hi, please take note {product} have reached low stock threshold level of {threshold} and the currenct product quantity is {quantity}. {branch} branch'''
-        from_email = SYSTEM_EMAIL
-        to_email = ['admin@techcity.co.zw', 'cassymyo@gmail.com'] #'pcpasels@gmail.com'
-        sender_name = 'Admin'
-        
-        html_content = render_to_string('emails/email_template.html', {
+
+    notifications = StockNotifications.objects.filter(
+        type='stock level',
+        status=True,
+        emailed=False,
+        inventory__isnull=False,
+    ).select_related('inventory__product', 'inventory__branch').order_by('inventory__branch', 'inventory__product__name')
+
+    branches = {}
+    for notification in notifications:
+        branches.setdefault(notification.inventory.branch, []).append(notification)
+
+    for branch, branch_notifications in branches.items():
+        subject = f'Low stock notification: {branch.name}'
+        lines = [
+            f'{n.inventory.product.name}: {n.inventory.quantity} left (threshold {n.inventory.stock_level_threshold})'
+            for n in branch_notifications
+        ]
+        message = f'Hi, please take note the following products have reached their low stock threshold level at {branch.name} branch.\n\n' + '\n'.join(lines)
+
+        html_content = render_to_string('emails/low_stock_digest.html', {
             'subject': subject,
-            'message': message,
-            'sender_name': sender_name,
+            'branch': branch,
+            'notifications': branch_notifications,
+            'sender_name': 'Admin',
         })
-        
-        send_mail_func(subject, message, html_content, from_email, to_email)
-        
-        logger.info(f'{product} low stock email to {to_email} succefully sent')
 
-    except Exception as e:
-        logger.error(f"Error sending account statement email: {e}", exc_info=True)
-    
+        # the alerts are marked emailed exactly when their email is queued
+        with transaction.atomic():
+            queue_email('low stock', subject, message, STOCK_ALERT_EMAILS, SYSTEM_EMAIL, html=html_content)
+            StockNotifications.objects.filter(id__in=[n.id for n in branch_notifications]).update(emailed=True)
+        logger.info(f'{branch.name} low stock digest with {len(branch_notifications)} products queued')
+
 def send_transfer_email(user_email, transfer_id, branch_id):
     # Validate inputs
     if not transfer_id or not branch_id or not user_email:
@@ -79,11 +89,32 @@ def send_transfer_email(user_email, transfer_id, branch_id):
             'sender_name': sender_name,
         })
         
-        send_mail_func(subject, message, html_content, from_email, to_email)
+        queue_email('transfer', subject, message, to_email, from_email, html=html_content, dedupe_key=f'transfer:{transfer.id}')
         
-        logger.info(f'Product transfer email to {branch.name} succefully sent')
+        logger.info(f'Product transfer email to {branch.name} queued')
 
-    except Exception as e:
-        logger.error(f"Error sending account statement email: {e}", exc_info=True)
+    except Transfer.DoesNotExist:
+        logger.error(f"Transfer with id {transfer_id} does not exist.")
+
+@shared_task
+def take_stock_snapshots():
+    """ Snapshots the stock of every branch for today, see ``inventory.snapshots``. """
+    from .snapshots import take
 
+    taken = take()
+    logger.info(f'Stock snapshots taken for {taken} branches')
+    return taken
 
+@shared_task
+def build_report(job_id, report, params):
+    """ Builds an ``inventory.reports`` spreadsheet for a background job and attaches it to the job. """
+    from .reports import build
+
+    try:
+        with tempfile.TemporaryFile() as output:
+            build(report, output, **params)
+            output.seek(0)
+            jobs.finish(job_id, output)
+    except Exception as e:
+        logger.error(f'Report {report} for job {job_id}: {e}', exc_info=True)
+        jobs.fail(job_id, e)
@@ -1,9 +1,11 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from users.models import User
 from inventory.models import Supplier, Product, PurchaseOrder, PurchaseOrderItem, otherExpenses
 from finance.models import *
 from inventory.views import if_purchase_order_is_received
+from django.db import connection
+from unittest import skipUnless
 from decimal import Decimal
 import json
 
@@ -145,3 +147,649 @@ class IfPurchaseOrderIsReceivedTest(TestCase):
         # Assert VAT transaction was created
         vat_transaction = VATTransaction.objects.get(purchase_order=self.purchase_order)
         self.assertEqual(vat_transaction.tax_amount, Decimal('10.00'))
+
+
+class ProductListCatalogTest(TestCase):
+    def setUp(self):
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+        from inventory import stock_push
+
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='pos@techcity.co.zw', password='12345', username='pos', branch=self.branch)
+        self.client.force_login(self.user)
+        self.url = reverse('inventory:product_list')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.items = [
+                Inventory.objects.create(
+                    branch=self.branch,
+                    product=Product.objects.create(name=f'Charger {i}', price=Decimal('10.00'), description='-'),
+                    cost=Decimal('5.00'),
+                    price=Decimal('10.00'),
+                    quantity=10,
+                )
+                for i in range(3)
+            ]
+
+    def test_etag_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_since_returns_changed_and_removed_rows(self):
+        version = int(self.client.get(self.url)['X-Catalog-Version'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.items[0].quantity = 4
+            self.items[0].save()
+            self.items[1].status = False
+            self.items[1].save()
+
+        data = self.client.get(self.url, {'since': version}).json()
+        self.assertFalse(data['full'])
+        self.assertGreater(data['version'], version)
+        self.assertEqual([row['inventory_id'] for row in data['changed']], [self.items[0].id])
+        self.assertEqual(data['changed'][0]['quantity'], 4)
+        self.assertEqual(data['removed'], [self.items[1].id])
+
+        data = self.client.get(self.url, {'since': data['version']}).json()
+        self.assertEqual((data['changed'], data['removed']), ([], []))
+
+    def test_one_version_per_transaction(self):
+        from inventory import stock
+        from inventory.models import CatalogVersion, Inventory
+
+        version = CatalogVersion.objects.get(branch=self.branch).version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.items[0].price = Decimal('12.00')
+            self.items[0].save()
+            stock.adjust({self.items[0].id: -1, self.items[1].id: -2})
+            stock.move(self.items[2], 5)
+
+        self.assertEqual(CatalogVersion.objects.get(branch=self.branch).version, version + 1)
+        self.assertEqual(
+            set(Inventory.objects.filter(branch=self.branch).values_list('catalog_version', flat=True)), {version + 1}
+        )
+
+
+class SearchInventoryTest(TestCase):
+    def setUp(self):
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        for name, batch in [('Samsung fast charger', 'B001'), ('iPhone lightning cable', 'B002'), ('Laptop bag', 'X777')]:
+            Inventory.objects.create(
+                branch=self.branch,
+                product=Product.objects.create(name=name, batch=batch, price=Decimal('10.00'), description=f'{name} accessory'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=10,
+            )
+
+    def search(self, query):
+        from inventory.models import Inventory
+        from inventory.search import search_inventory
+
+        queryset = Inventory.objects.filter(branch=self.branch, status=True)
+        return [item.product.name for item in search_inventory(queryset, query, self.branch.id)]
+
+    def test_prefix_typo_and_batch_matches(self):
+        self.assertEqual(self.search('charg')[0], 'Samsung fast charger')
+        self.assertIn('Samsung fast charger', self.search('chargr'))
+        self.assertEqual(self.search('X777'), ['Laptop bag'])
+        self.assertEqual(self.search('zzzz'), [])
+
+    def test_caller_filters_apply_before_the_limit(self):
+        from inventory.models import Inventory
+        from inventory.search import search_inventory
+
+        for i in range(3):
+            Inventory.objects.create(
+                branch=self.branch,
+                product=Product.objects.create(name=f'Charger {i}', price=Decimal('10.00'), description='-'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=10,
+                status=False,
+            )
+
+        # the inactive chargers outrank the active one
+        queryset = Inventory.objects.filter(branch=self.branch, status=True)
+        results = search_inventory(queryset, 'charger', self.branch.id, limit=2)
+        self.assertEqual([item.product.name for item in results], ['Samsung fast charger'])
+
+    def test_short_queries_match_the_batch(self):
+        self.assertEqual(self.search('X7'), ['Laptop bag'])
+
+    def test_memory_index_ranks_name_prefix_first(self):
+        from inventory.search import TrigramIndex
+
+        index = TrigramIndex([
+            (1, 'Cable organiser', 'keeps a charger cable tidy', ''),
+            (2, 'Charger 20W', '', ''),
+            (3, 'Car charger', '', ''),
+        ])
+        self.assertEqual(index.search('charger'), [2, 3, 1])
+        self.assertEqual(index.search('chrger')[:2], [3, 2])
+
+
+class ContextProcessorCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import RequestFactory
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+        from inventory import stock_push
+
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+
+        cache.clear()
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='pos@techcity.co.zw', password='12345', username='pos', branch=self.branch)
+        self.request = RequestFactory().get('/')
+        self.request.user = User.objects.get(id=self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = Inventory.objects.create(
+                branch=self.branch,
+                product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=10,
+            )
+
+    def render(self):
+        from django.template import engines
+
+        template = engines['django'].from_string(
+            '{% for i in inventory %}{{ i.product.name }} {{ i.quantity }};{% endfor %}'
+            '{{ transfers_count }} {{ notis_count }} {{ inv_notifications_count }};'
+            '{% for c in clients %}{{ c.name }};{% endfor %}'
+            '{% for b in branches %}{{ b.name }};{% endfor %}'
+            '{{ currencies|length }} {{ expense_categories|length }}'
+        )
+        return template.render({}, self.request)
+
+    def test_warm_cache_render_runs_no_queries(self):
+        self.render()
+        with self.assertNumQueries(0):
+            self.assertIn('Charger 10;', self.render())
+
+    def test_values_are_only_read_when_used(self):
+        from django.template import engines
+
+        with self.assertNumQueries(0):
+            engines['django'].from_string('plain page').render({}, self.request)
+
+    def test_signals_invalidate_cached_values(self):
+        self.render()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(name='Tendai', email='tendai@techcity.co.zw', phone_number='0771000000', branch=self.branch)
+            self.item.quantity = 4
+            self.item.save()
+
+        content = self.render()
+        self.assertIn('Charger 4;', content)
+        self.assertIn('Tendai;', content)
+
+
+class StockAlertsTest(TestCase):
+    def setUp(self):
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+        from inventory import stock_push
+
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = Inventory.objects.create(
+                branch=self.branch,
+                product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=10,
+                stock_level_threshold=5,
+            )
+
+    def alerts(self):
+        from inventory.models import StockNotifications
+        return StockNotifications.objects.filter(inventory=self.item, type='stock level')
+
+    def sell(self, quantity):
+        from inventory.models import Inventory
+
+        item = Inventory.objects.get(id=self.item.id)
+        item.quantity -= quantity
+        item.save()
+
+    def test_alert_only_on_crossing_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(2)
+            self.sell(2)
+            self.assertFalse(self.alerts().exists())
+        self.assertFalse(self.alerts().exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(3)
+            self.sell(1)
+            self.assertFalse(self.alerts().exists())
+
+        alert = self.alerts().get()
+        self.assertTrue(alert.status)
+        self.assertEqual(alert.quantity, 2)
+
+    def test_recovery_clears_and_reopens_the_alert(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(8)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(-10)
+        self.assertFalse(self.alerts().get().status)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(9)
+        alert = self.alerts().get()
+        self.assertTrue(alert.status)
+        self.assertFalse(alert.emailed)
+
+    def test_digest_sends_one_email_per_branch(self):
+        from django.core import mail
+        from inventory.models import Inventory
+        from inventory.tasks import send_low_stock_digest, STOCK_ALERT_EMAILS
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.create(
+                branch=self.branch,
+                product=Product.objects.create(name='Cable', price=Decimal('3.00'), description='-'),
+                cost=Decimal('1.00'),
+                price=Decimal('3.00'),
+                quantity=1,
+                stock_level_threshold=5,
+            )
+            self.sell(7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_low_stock_digest()
+        # one email per branch, to each of the alert addresses
+        self.assertEqual(len(mail.outbox), len(STOCK_ALERT_EMAILS))
+        self.assertEqual({message.subject for message in mail.outbox}, {f'Low stock notification: {self.branch.name}'})
+        self.assertIn('Charger', mail.outbox[0].body)
+        self.assertIn('Cable', mail.outbox[0].body)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_low_stock_digest()
+        self.assertEqual(len(mail.outbox), len(STOCK_ALERT_EMAILS))
+
+
+
+class StockMovementTest(TestCase):
+    def setUp(self):
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+        from inventory import stock_push
+
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+
+        company = Company.objects.create(name='Techcity')
+        branch = Branch.objects.create(company=company, name='Harare')
+        self.charger, self.cable = [
+            Inventory.objects.create(
+                branch=branch,
+                product=Product.objects.create(name=name, price=Decimal('10.00'), description='-'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=quantity,
+            )
+            for name, quantity in [('Charger', 3), ('Cable', 10)]
+        ]
+
+    def quantities(self):
+        from inventory.models import Inventory
+        return dict(Inventory.objects.values_list('id', 'quantity'))
+
+    def test_adjust_returns_the_new_quantities(self):
+        from inventory import stock
+
+        self.assertEqual(stock.adjust({self.charger.id: -2, self.cable.id: 5}), {self.charger.id: 1, self.cable.id: 15})
+        self.assertEqual(stock.move(self.charger, 4), 5)
+        self.assertEqual(self.charger.quantity, 5)
+
+    def test_oversell_changes_nothing(self):
+        from inventory import stock
+
+        with self.assertRaises(stock.InsufficientStock) as raised:
+            stock.adjust({self.charger.id: -4, self.cable.id: -1})
+
+        self.assertEqual(raised.exception.shortages, {self.charger.id: (3, 4)})
+        self.assertEqual(self.quantities(), {self.charger.id: 3, self.cable.id: 10})
+
+
+
+class StockPushTest(TestCase):
+    def setUp(self):
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+        from inventory import stock_push
+
+        # pushes left behind by other tests would be merged into this one
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='cashier@techcity.co.zw', password='12345', username='cashier', branch=self.branch)
+        self.charger = Inventory.objects.create(
+            branch=self.branch,
+            product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+            cost=Decimal('5.00'),
+            price=Decimal('10.00'),
+            quantity=10,
+        )
+
+    def test_movements_in_a_window_are_sent_as_one_delta(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from inventory import stock, stock_push
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(stock_push.group_name(self.branch.id), channel)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.adjust({self.charger.id: -2})
+            stock.adjust({self.charger.id: -1})
+        stock_push.flush(self.branch.id)
+
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['items'], [{'inventory_id': self.charger.id, 'quantity': 7, 'delta': -3}])
+
+    async def test_consumer_serves_the_users_branch_only(self):
+        from channels.layers import get_channel_layer
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from inventory import stock_push
+        from inventory.routing import websocket_urlpatterns
+
+        application = URLRouter(websocket_urlpatterns)
+
+        other = WebsocketCommunicator(application, f'/ws/inventory/{self.branch.id + 1}/')
+        other.scope['user'] = self.user
+        connected, _ = await other.connect()
+        self.assertFalse(connected)
+
+        communicator = WebsocketCommunicator(application, f'/ws/inventory/{self.branch.id}/')
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        items = [{'inventory_id': self.charger.id, 'quantity': 7, 'delta': -3}]
+        await get_channel_layer().group_send(stock_push.group_name(self.branch.id), {'type': 'stock.delta', 'items': items})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'stock', 'items': items})
+        await communicator.disconnect()
+
+
+class StockSnapshotTest(TestCase):
+    def setUp(self):
+        import datetime
+        from django.utils import timezone
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(username='admin', password='12345', email='admin@techcity.co.zw', branch=self.branch)
+        self.item = Inventory.objects.create(
+            branch=self.branch,
+            product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+            cost=Decimal('5.00'),
+            price=Decimal('10.00'),
+            quantity=10,
+        )
+        self.today = timezone.localdate()
+        self.day = lambda days_ago: self.today - datetime.timedelta(days=days_ago)
+
+    def sell(self, quantity, days_ago):
+        from inventory.models import ActivityLog
+        from inventory import stock
+
+        stock.move(self.item, -quantity)
+        log = ActivityLog.objects.create(
+            branch=self.branch, inventory=self.item, user=self.user, action='Sale', quantity=quantity, total_quantity=self.item.quantity,
+        )
+        # timestamp is auto_now_add
+        ActivityLog.objects.filter(id=log.id).update(timestamp=self.day(days_ago))
+
+    def test_stock_at_the_end_of_a_day(self):
+        from inventory import snapshots
+
+        self.sell(1, days_ago=4)
+        self.assertEqual(snapshots.take(self.day(3)), 1)
+        self.assertEqual(snapshots.take(self.day(3)), 0)
+        self.sell(2, days_ago=3)
+        self.sell(3, days_ago=1)
+
+        on_hand = lambda days_ago: snapshots.on_hand(self.branch.id, self.day(days_ago))[self.item.id]
+        self.assertEqual(on_hand(4), 9)
+        self.assertEqual(on_hand(3), 7)
+        self.assertEqual(on_hand(2), 7)
+        self.assertEqual(on_hand(1), 4)
+        self.assertEqual(on_hand(0), 4)
+
+    def test_on_hand_endpoint(self):
+        from inventory import snapshots
+
+        snapshots.take(self.day(3))
+        self.sell(2, days_ago=2)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('inventory:stock_on_hand'), {'date': self.day(3).isoformat()})
+
+        row, = response.json()['inventory']
+        self.assertEqual(row['quantity'], 10)
+        self.assertEqual(self.client.get(reverse('inventory:stock_on_hand'), {'date': 'yesterday'}).status_code, 400)
+        response = self.client.get(reverse('inventory:stock_on_hand'), {'date': self.day(3).isoformat(), 'inventory': f'{self.item.id},x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_on_hand_endpoint_is_limited_to_the_users_branch(self):
+        from django.contrib.auth.models import Permission
+        from company.models import Branch
+
+        other = Branch.objects.create(company=self.branch.company, name='Bulawayo')
+        clerk = User.objects.create_user(username='clerk', password='12345', email='clerk@techcity.co.zw', branch=other)
+        self.client.force_login(clerk)
+        query = {'date': self.today.isoformat(), 'branch': self.branch.id}
+        self.assertEqual(self.client.get(reverse('inventory:stock_on_hand'), query).status_code, 403)
+        self.assertEqual(self.client.get(reverse('inventory:stock_on_hand'), {**query, 'branch': other.id}).json()['inventory'], [])
+
+        clerk.user_permissions.add(Permission.objects.get(codename='view_inventory', content_type__app_label='inventory'))
+        self.client.force_login(User.objects.get(id=clerk.id))
+        self.assertEqual(len(self.client.get(reverse('inventory:stock_on_hand'), query).json()['inventory']), 1)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class InventoryDetailTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+        from inventory import stock_push
+
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+
+        cache.clear()
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(username='admin', password='12345', email='admin@techcity.co.zw', branch=self.branch)
+        self.item = Inventory.objects.create(
+            branch=self.branch,
+            product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+            cost=Decimal('5.00'),
+            price=Decimal('10.00'),
+            quantity=100,
+        )
+        self.client.force_login(self.user)
+
+    def log(self, action, quantity, timestamp=None):
+        from inventory.models import ActivityLog
+
+        with self.captureOnCommitCallbacks(execute=True):
+            log = ActivityLog.objects.create(
+                branch=self.branch, inventory=self.item, user=self.user, action=action, quantity=quantity, total_quantity=0,
+            )
+            if timestamp:
+                ActivityLog.objects.filter(id=log.id).update(timestamp=timestamp)
+        return log
+
+    def test_monthly_series_is_summed_and_refreshed(self):
+        import datetime
+
+        self.log('Sale', 2, datetime.date(2024, 1, 10))
+        self.log('Sale', 3, datetime.date(2024, 1, 20))
+        self.log('Transfer', 4, datetime.date(2024, 3, 1))
+
+        response = self.client.get(reverse('inventory:inventory_detail', args=[self.item.id]))
+        self.assertEqual(response.context['labels'], ['January 2024', 'March 2024'])
+        self.assertEqual(response.context['sales_data'], [5, 0])
+        self.assertEqual(response.context['transfer_data'], [0, 4])
+
+        self.log('stock in', 6, datetime.date(2024, 3, 5))
+        response = self.client.get(reverse('inventory:inventory_detail', args=[self.item.id]))
+        self.assertEqual(response.context['stock_in_data'], [0, 6])
+
+    def test_logs_are_paged_by_id(self):
+        from inventory import activity
+
+        logs = [self.log('Sale', 1) for _ in range(activity.PAGE_SIZE + 5)]
+
+        response = self.client.get(reverse('inventory:inventory_detail', args=[self.item.id]))
+        self.assertEqual([log.id for log in response.context['logs']], [log.id for log in reversed(logs[5:])])
+
+        response = self.client.get(reverse('inventory:inventory_detail', args=[self.item.id]), {'before': response.context['next_before']})
+        self.assertEqual([log.id for log in response.context['logs']], [log.id for log in reversed(logs[:5])])
+        self.assertIsNone(response.context['next_before'])
+
+class StockMovementConcurrencyTest(TransactionTestCase):
+    @skipUnless(connection.vendor == 'postgresql', 'row locks are taken on PostgreSQL only')
+    def test_parallel_sales_never_oversell(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from threading import Barrier
+        from django.db import transaction
+        from company.models import Company, Branch
+        from inventory.models import Inventory
+        from inventory import stock, stock_push
+
+        self.addCleanup(stock_push.reset)
+        branch = Branch.objects.create(company=Company.objects.create(name='Techcity'), name='Harare')
+        item = Inventory.objects.create(
+            branch=branch,
+            product=Product.objects.create(name='Charger', price=Decimal('10.00'), description='-'),
+            cost=Decimal('5.00'),
+            price=Decimal('10.00'),
+            quantity=15,
+        )
+        workers = 20
+        barrier = Barrier(workers)
+
+        def sell(_):
+            barrier.wait()
+            try:
+                with transaction.atomic():
+                    return stock.adjust({item.id: -1})[item.id]
+            except stock.InsufficientStock:
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            left = list(executor.map(sell, range(workers)))
+
+        self.assertEqual(sorted(quantity for quantity in left if quantity is not None), list(range(15)))
+        self.assertEqual(Inventory.objects.get(id=item.id).quantity, 0)
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class InventoryReportTest(TestCase):
+    def setUp(self):
+        from company.models import Company, Branch
+        from inventory.models import Inventory, ProductCategory
+        from inventory import stock_push
+
+        stock_push.reset()
+        self.addCleanup(stock_push.reset)
+
+        company = Company.objects.create(name='Techcity')
+        self.harare = Branch.objects.create(company=company, name='Harare')
+        bulawayo = Branch.objects.create(company=company, name='Bulawayo')
+        self.user = User.objects.create_user(email='pos@techcity.co.zw', password='12345', username='pos', branch=self.harare)
+
+        chargers = ProductCategory.objects.create(name='Chargers')
+        cables = ProductCategory.objects.create(name='Cables')
+        for branch in (self.harare, bulawayo):
+            for name, category in (('Charger', chargers), ('Type C', cables), ('Lightning', cables)):
+                Inventory.objects.create(
+                    branch=branch,
+                    product=Product.objects.create(name=name, price=Decimal('10.00'), description='-', category=category),
+                    cost=Decimal('5.00'),
+                    price=Decimal('10.00'),
+                    quantity=3,
+                )
+        self.client.force_login(self.user)
+
+    def rows(self, content):
+        import io
+        import openpyxl
+
+        return [row for row in openpyxl.load_workbook(io.BytesIO(content)).active.values]
+
+    def test_stock_sheet_is_grouped_by_branch_and_category(self):
+        response = self.client.get(reverse('inventory:inventory'), {'download': 1, 'excel': 1})
+        rows = self.rows(b''.join(response.streaming_content))
+
+        self.assertEqual([row[0] for row in rows], [
+            'Bulawayo', 'Name', 'Cables', 'Lightning', 'Type C', 'Chargers', 'Charger',
+            'Harare', 'Name', 'Cables', 'Lightning', 'Type C', 'Chargers', 'Charger',
+        ])
+        self.assertEqual(rows[3], ('Lightning', 5, 10, 3))
+
+    @override_settings(REPORT_BACKGROUND_ROWS=2)
+    def test_large_sheet_is_built_in_the_background(self):
+        import tempfile
+        from unittest import mock
+        from django.core.files.storage import FileSystemStorage
+        from utils import jobs
+        from inventory.tasks import build_report
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(reverse('inventory:reorder_list'), {'download': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(reverse('inventory:inventory'), {'download': 1, 'excel': 1})
+        job_id = response.context['job_id']
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.client.get(reverse('job_status', args=[job_id])).json()['status'], jobs.PENDING)
+
+        with tempfile.TemporaryDirectory() as media_root, mock.patch('utils.jobs.default_storage', FileSystemStorage(media_root)):
+            build_report(job_id, 'stock', {})
+            job = self.client.get(reverse('job_status', args=[job_id])).json()
+            self.assertEqual(job['status'], jobs.DONE)
+            with open(f'{media_root}/jobs/{job_id}/Harare stock.xlsx', 'rb') as output:
+                self.assertEqual(len(self.rows(output.read())), 14)
+
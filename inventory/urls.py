@@ -14,6 +14,7 @@ urlpatterns = [
     path('add_category/', add_product_category, name='add_product_category'),
     path('inventory/branches/', branches_inventory, name='branches_inventory'),
     path('product/json/', inventory_index_json, name='inventory_index_json'),
+    path('stock/on-hand/', stock_on_hand_json, name='stock_on_hand'),
     path('edit/<str:product_name>/', edit_inventory, name='edit_inventory'),
     path('activate/product/<int:product_id>/', activate_inventory, name='activate_inventory'),
     path('defective_product_list/', defective_product_list, name='defective_product_list'),
@@ -1,6 +1,9 @@
-from . models import Inventory, Product
-from django.db import models
+from . models import Inventory, Product, CatalogVersion
+from django.db import models, transaction
+from django.db.models import F
 from loguru import logger
+from utils.context_cache import invalidate
+from utils.transactions import batch_on_commit
 
 def calculate_inventory_totals(inventory_queryset):
     total_cost = 0
@@ -35,7 +38,69 @@ def average_inventory_cost(product_id, new_cost, new_units, branch_id):
     return average_cost
 
 
+def bump_catalog_version(branch_id, inventory_ids=None, reset=False):
+    """
+    Moves the branch POS catalog to a new version, stamps the changed inventory rows with it and drops
+    the cached template values of the branch.
+    Run after commit so that terminals never see a version before the rows it covers.
+    """
+    with transaction.atomic():
+        catalog, _ = CatalogVersion.objects.select_for_update().get_or_create(branch_id=branch_id)
+        catalog.version += 1
+        if reset:
+            catalog.reset_version = catalog.version
+        catalog.save()
 
+        if inventory_ids:
+            Inventory.objects.filter(branch_id=branch_id, id__in=inventory_ids).update(catalog_version=catalog.version)
 
+    invalidate('inventory', 'notis_count', 'inv_notifications_count', 'stock_notifications', branch_id=branch_id)
+    return catalog.version
 
 
+def catalog_changed(branch_id, inventory_ids, reset=False):
+    """
+    Schedules a catalog version bump for the branch once the current transaction commits. All the changes
+    of a transaction make one bump per branch, a ``None`` id stands for a reset.
+    """
+    for inventory_id in [None] if reset else inventory_ids:
+        batch_on_commit('catalog_versions', (branch_id, inventory_id), bump_catalog_versions)
+
+
+def bump_catalog_versions(changes):
+    branches = {}
+    for branch_id, inventory_id in changes:
+        branches.setdefault(branch_id, set()).add(inventory_id)
+
+    for branch_id, inventory_ids in sorted(branches.items()):
+        reset = None in inventory_ids
+        inventory_ids.discard(None)
+        bump_catalog_version(branch_id, sorted(inventory_ids), reset=reset)
+
+
+def catalog_row(item):
+    return {
+        'inventory_id': item['id'],
+        'product_id': item['product__id'],
+        'product_name':item['product__name'],
+        'description': item['product__description'],
+        'category': item['product__category__id'],
+        'category_name': item['product__category__name'],
+        'end_of_day':item['product__end_of_day'],
+        'price': item['price'],
+        'quantity': item['quantity'],
+    }
+
+
+CATALOG_FIELDS = [
+    'id', 
+    'product__id', 
+    'product__name', 
+    'product__description', 
+    'product__category__id', 
+    'product__category__name',  
+    'product__end_of_day',
+    'price', 
+    'quantity'
+]
+
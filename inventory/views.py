@@ -1,9 +1,8 @@
 
-import json, datetime, openpyxl 
-import csv
+import json, datetime
+import csv, hashlib
 from django.http import HttpResponse
 from datetime import timedelta
-from openpyxl.styles import Alignment, Font, PatternFill
 from . models import *
 from . tasks import send_transfer_email
 from decimal import Decimal
@@ -13,6 +12,7 @@ from django.db.models import Sum
 from django.db import transaction
 from django.contrib import messages
 from utils.utils import generate_pdf
+from utils import pdf
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse, HttpResponse
 from finance.models import (
@@ -29,9 +29,13 @@ from finance.models import (
     AccountBalance,
     AccountTransaction
 )
+from . search import search_inventory
+from . import reports, stock, snapshots, activity
 from . utils import (
     calculate_inventory_totals, 
-    average_inventory_cost
+    average_inventory_cost,
+    catalog_row,
+    CATALOG_FIELDS
 )
 from . forms import (
     BatchForm,
@@ -59,13 +63,11 @@ from permissions.permissions import (
 )
 from utils.account_name_identifier import account_identifier
 from loguru import logger
-from xhtml2pdf import pisa
-from django.template.loader import get_template
 
 
 @login_required
 def notifications_json(request):
-    notifications = StockNotifications.objects.filter(inventory__branch=request.user.branch).values(
+    notifications = StockNotifications.objects.filter(branch=request.user.branch, status=True).values(
         'inventory__product__name', 'type', 'notification', 'inventory__id'
     )
     return JsonResponse(list(notifications), safe=False)
@@ -109,49 +111,66 @@ def batch_code(request):
 
 @login_required
 def product_list(request): 
-    """ for the pos """
+    """ 
+        for the pos 
+
+        The branch catalog is versioned, responses carry an ETag and X-Catalog-Version so terminals can
+        revalidate with If-None-Match (304). ?since=<version> returns only the rows changed after that
+        version: {"version": 12, "full": false, "changed": [...], "removed": [inventory ids]}
+    """
+    catalog = CatalogVersion.objects.filter(branch=request.user.branch).values('version', 'reset_version').first()
+    catalog = catalog or {'version': 0, 'reset_version': 0}
+    version = catalog['version']
+
+    etag = '"catalog-{}-{}-{}"'.format(
+        request.user.branch_id, 
+        version, 
+        hashlib.md5(request.GET.urlencode().encode()).hexdigest()[:12]
+    )
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
     queryset = Inventory.objects.filter(branch=request.user.branch, status=True)
-    services = Service.objects.all().order_by('-name')
 
     search_query = request.GET.get('q', '') 
     product_id = request.GET.get('product', '')
     category_id = request.GET.get('category', '')
+    since = request.GET.get('since', '')
+
+    if since.isdigit():
+        since = int(since)
+        full = since < catalog['reset_version'] or since > version
+        
+        changed = Inventory.objects.filter(branch=request.user.branch)
+        if not full:
+            changed = changed.filter(catalog_version__gt=since)
+        
+        rows = list(changed.values(*CATALOG_FIELDS, 'status'))
+        response = JsonResponse({
+            'version': version,
+            'full': full,
+            'changed': [catalog_row(item) for item in rows if item['status'] and item['product__id']],
+            'removed': [item['id'] for item in rows if not (item['status'] and item['product__id'])],
+        })
+        response['ETag'] = etag
+        response['X-Catalog-Version'] = version
+        return response
 
     if category_id:
         queryset = queryset.filter(product__category__id=category_id)
-    if search_query:
-        queryset = queryset.filter(
-            Q(product__name__icontains=search_query) | 
-            Q(product__description__icontains=search_query) 
-        )
     if product_id:
         queryset = queryset.filter(id=product_id)
+    if search_query:
+        queryset = search_inventory(queryset, search_query, request.user.branch_id)
 
-    inventory_data = list(queryset.values(
-        'id', 
-        'product__id', 
-        'product__name', 
-        'product__description', 
-        'product__category__id', 
-        'product__category__name',  
-        'product__end_of_day',
-        'price', 
-        'quantity'
-    ))
-    
-    merged_data = [{
-        'inventory_id': item['id'],
-        'product_id': item['product__id'],
-        'product_name':item['product__name'],
-        'description': item['product__description'],
-        'category': item['product__category__id'],
-        'category_name': item['product__category__name'],
-        'end_of_day':item['product__end_of_day'],
-        'price': item['price'],
-        'quantity': item['quantity'],
-    } for item in inventory_data]
-
-    return JsonResponse(merged_data, safe=False)
+    merged_data = [catalog_row(item) for item in queryset.values(*CATALOG_FIELDS)]
+
+    response = JsonResponse(merged_data, safe=False)
+    response['ETag'] = etag
+    response['X-Catalog-Version'] = version
+    return response
 
 @login_required
 def branches_inventory(request):
@@ -261,8 +280,8 @@ class ProcessTransferCartView(LoginRequiredMixin, View):
                     self.deduct_inventory(transfer_item)
                     self.transfer_update_quantity(transfer_item, transfer)  
                     
-                # send email for transfer alert
-                transaction.on_commit(lambda: send_transfer_email(request.user.email, transfer.id, transfer.transfer_to.id))
+                # the transfer alert is queued with the transfer, it goes out once both commit
+                send_transfer_email(request.user.email, transfer.id, transfer.transfer_to.id)
                 
             return JsonResponse({'success': True})
         except Exception as e:
@@ -272,8 +291,7 @@ class ProcessTransferCartView(LoginRequiredMixin, View):
         logger.info(f'from branch -> {transfer_item.from_branch}')
         branch_inventory = Inventory.objects.get(product__name=transfer_item.product, branch__name=transfer_item.from_branch)
         
-        branch_inventory.quantity -= int(transfer_item.quantity)
-        branch_inventory.save()
+        stock.move(branch_inventory, -int(transfer_item.quantity))
         self.activity_log('Transfer', branch_inventory, transfer_item)
         
     def transfer_update_quantity(self, transfer_item, transfer):
@@ -330,52 +348,12 @@ def inventory_index(request):
             inventory = Inventory.objects.filter(branch=request.user.branch, status=False)
         else:
             inventory = inventory.filter(product__category__name=category)
+    
+    if q:
+        inventory = search_inventory(inventory, q, request.user.branch_id)
                 
     if 'download' and 'excel' in request.GET:
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename={request.user.branch.name} stock.xlsx'
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-        
-        # Add products data
-        products = Inventory.objects.all()
-        branches = Branch.objects.all().values_list('name', flat=True).distinct()
-        row_offset = 0
-        for branch in branches:
-            worksheet['A' + str(row_offset + 1)] = f'{branch} Products'
-            worksheet.merge_cells('A' + str(row_offset + 1) + ':D' + str(row_offset + 1))
-            cell = worksheet['A' + str(row_offset + 1)]
-            cell.alignment = Alignment(horizontal='center')
-            cell.font = Font(size=16, bold=True)
-            cell.fill = PatternFill(fgColor='AAAAAA', fill_type='solid')
-
-            row_offset += 1 
-            
-            category_headers = ['Name', 'Cost', 'Price', 'Quantity']
-            for col_num, header_title in enumerate(category_headers, start=1):
-                cell = worksheet.cell(row=3, column=col_num)
-                cell.value = header_title
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-
-            categories = Inventory.objects.filter(branch=request.user.branch).values_list('product__category__name', flat=True).distinct()
-            for category in categories:
-                products_in_category = products.filter(branch__name=branch, product__category__name=category)
-                if products_in_category.exists():
-                    worksheet['A' + str(row_offset + 1)] = category
-                    cell = worksheet['A' + str(row_offset + 1)]
-                    cell.font = Font(color='FFFFFF')
-                    cell.fill = PatternFill(fgColor='0066CC', fill_type='solid')
-                    worksheet.merge_cells('A' + str(row_offset + 1) + ':D' + str(row_offset + 1))
-                    row_offset += 2
-
-                for product in products.filter(branch__name=branch):
-                    if category == product.product.category.name:
-                        worksheet.append([product.product.name, product.cost, product.price, product.quantity])
-                        row_offset += 1
-
-        workbook.save(response)
-        return response
+        return reports.download(request, 'stock', f'{request.user.branch.name} stock.xlsx')
     
     all_branches_inventory = Inventory.objects.filter(branch=request.user.branch)
     
@@ -420,6 +398,45 @@ def inventory_index_json(request):
     ).order_by('product__name')
     return JsonResponse(list(inventory), safe=False)
 
+@login_required
+def stock_on_hand_json(request):
+    """
+    Stock of the user's branch at the end of ``date`` (YYYY-MM-DD). Users with the ``view_inventory``
+    permission may ask for another ``branch``.
+    """
+    try:
+        date = datetime.date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'date must be YYYY-MM-DD'}, status=400)
+
+    try:
+        branch_id = int(request.GET.get('branch') or request.user.branch_id)
+        inventory_ids = [int(inventory_id) for inventory_id in request.GET.get('inventory', '').split(',') if inventory_id]
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'message': 'branch and inventory must be ids'}, status=400)
+
+    if branch_id != request.user.branch_id and not request.user.has_perm('inventory.view_inventory'):
+        return JsonResponse({'success': False, 'message': 'You can only see the stock of your branch'}, status=403)
+
+    rows = snapshots.on_hand_queryset(branch_id, date)
+    if inventory_ids:
+        rows = rows.filter(id__in=inventory_ids)
+
+    rows = rows.values('id', 'product__name', 'cost', 'on_hand').order_by('product__name')
+    return JsonResponse({
+        'date': date,
+        'branch': branch_id,
+        'inventory': [
+            {
+                'inventory_id': row['id'],
+                'product_name': row['product__name'],
+                'quantity': row['on_hand'],
+                'value': row['on_hand'] * row['cost'],
+            }
+            for row in rows
+        ],
+    })
+
 @login_required 
 @transaction.atomic
 def activate_inventory(request, product_id):
@@ -489,45 +506,18 @@ def edit_inventory(request, product_name):
 @login_required
 def inventory_detail(request, id):
 
-    inventory = Inventory.objects.get(id=id, branch=request.user.branch)
-    logs = ActivityLog.objects.filter(inventory=inventory, branch=request.user.branch)
-
-    sales_data = {}
-    stock_in_data = {}
-    transfer_data = {}
-    labels = []
-
-    for log in logs:
-        month_name = log.timestamp.strftime('%B')  
-        year = log.timestamp.strftime('%Y')
-        month_year = f"{month_name} {year}"  
-
-        if log.action == 'Sale':
-            if month_year in sales_data:
-                sales_data[month_year] += log.quantity
-            else:
-                sales_data[month_year] = log.quantity
-        elif log.action in ('stock in', 'Update'):
-            if month_year in stock_in_data:
-                stock_in_data[month_year] += log.quantity
-            else:
-                stock_in_data[month_year] = log.quantity
-        elif log.action == 'Transfer':
-            if month_year in transfer_data:
-                transfer_data[month_year] += log.quantity
-            else:
-                transfer_data[month_year] = log.quantity
-
-        if month_year not in labels:
-            labels.append(month_year)
+    inventory = Inventory.objects.select_related('product').get(id=id, branch=request.user.branch)
+
+    # ?before=<log id> pages back through the history
+    before = request.GET.get('before')
+    logs, next_before = activity.log_page(inventory, int(before) if before and before.isdigit() else None)
 
     return render(request, 'inventory/inventory_detail.html', {
         'inventory': inventory,
         'logs': logs,
-        'sales_data': list(sales_data.values()), 
-        'stock_in_data': list(stock_in_data.values()),
-        'transfer_data': list(transfer_data.values()),
-        'labels': labels
+        'next_before': next_before,
+        'paged': bool(before),
+        **activity.monthly_series(inventory),
     })
 
 
@@ -606,10 +596,10 @@ def receive_inventory(request):
                     
                 if Inventory.objects.filter(product=branch_transfer.product, branch=request.user.branch).exists():
                     existing_inventory = Inventory.objects.get(product=branch_transfer.product, branch=request.user.branch)
-                    existing_inventory.quantity += int(request.POST['quantity'])
                     existing_inventory.price = branch_transfer.price
                     existing_inventory.dealer_price = Product.objects.get(id=branch_transfer.product.id).dealer_price
-                    existing_inventory.save()
+                    existing_inventory.save(update_fields=['price', 'dealer_price'])
+                    stock.move(existing_inventory, int(request.POST['quantity']))
                     
                     ActivityLog.objects.create(
                         branch = request.user.branch,
@@ -812,9 +802,9 @@ def defective_product_list(request):
         except:
             return JsonResponse({'success': False, 'message':'Product doesnt exists'}, status=400)
     
-        product.quantity += quantity
         product.status = True if product.status == False else product.status
-        product.save()
+        product.save(update_fields=['status'])
+        stock.move(product, int(quantity))
         
         d_product.quantity -= quantity
         d_product.save()
@@ -861,8 +851,11 @@ def create_defective_product(request):
                 messages.warning(request, 'Defective quantity cannot be less than zero')
                 return redirect('inventory:create_defective_product')
             
-            product.quantity -= quantity
-            product.save()
+            try:
+                stock.move(product, -quantity)
+            except stock.InsufficientStock:
+                messages.warning(request, 'Defective quantity cannot more than the products quantity')
+                return redirect('inventory:create_defective_product')
         
             d_obj = form.save(commit=False)
             d_obj.branch = branch
@@ -940,47 +933,7 @@ def reorder_list(request):
         
     if request.method == 'GET':
         if 'download' in request.GET:
-            response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename={request.user.branch.name} order.xlsx'
-            workbook = openpyxl.Workbook()
-            worksheet = workbook.active
-
-            row_offset = 0
-            
-            worksheet['A' + str(row_offset + 1)] = f'Order List'
-            worksheet.merge_cells('A' + str(row_offset + 1) + ':D' + str(row_offset + 1))
-            cell = worksheet['A' + str(row_offset + 1)]
-            cell.alignment = Alignment(horizontal='center')
-            cell.font = Font(size=14, bold=True)
-            cell.fill = PatternFill(fgColor='AAAAAA', fill_type='solid')
-
-            row_offset += 1 
-                
-            category_headers = ['Name', 'Quantity']
-            for col_num, header_title in enumerate(category_headers, start=1):
-                cell = worksheet.cell(row=3, column=col_num)
-                cell.value = header_title
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-
-            categories = reorder_list.values_list('product__product__category__name', flat=True).distinct()
-            for category in categories:
-                products_in_category = reorder_list.filter(product__product__category__name=category)
-                if products_in_category.exists():
-                    worksheet['A' + str(row_offset + 1)] = category
-                    cell = worksheet['A' + str(row_offset + 1)]
-                    cell.font = Font(color='FFFFFF')
-                    cell.fill = PatternFill(fgColor='0066CC', fill_type='solid')
-                    worksheet.merge_cells('A' + str(row_offset + 1) + ':D' + str(row_offset + 1))
-                    row_offset += 2
-
-                for product in reorder_list:
-                    if category == product.product.product.category.name:
-                        worksheet.append([product.product.product.name])
-                        row_offset += 1
-
-            workbook.save(response)
-            return response
+            return reports.download(request, 'reorder_list', f'{request.user.branch.name} order.xlsx', branch_id=request.user.branch_id)
         return render(request, 'inventory/reorder_list.html', {'form':ReorderSettingsForm()})
         
 @login_required
@@ -1074,7 +1027,9 @@ def inventory_pdf(request):
             'total_cost':totals[0],
             'total_price':totals[1],
             'pdf_name':'Inventory'
-        }
+        },
+        request=request,
+        filename='inventory.pdf',
     )
 
 @login_required
@@ -1164,6 +1119,8 @@ def transfers_report(request):
             'report_date': datetime.date.today(),
             'transfers':transfers
         },
+        request=request,
+        filename='transfers.pdf',
     )
 
 
@@ -1430,7 +1387,7 @@ def create_purchase_order(request):
         try:
             with transaction.atomic():
                 purchase_order = PurchaseOrder(
-                    order_number=PurchaseOrder.generate_order_number(),
+                    order_number=PurchaseOrder.generate_order_number(request.user.branch.name),
                     batch=batch,
                     supplier=supplier,
                     delivery_date=delivery_date,
@@ -1870,17 +1827,7 @@ def sales_price_list_pdf(request, order_id):
 
     context = {'items': items}
 
-    template = get_template('inventory/pdf_templates/price_list.html')
-    html = template.render(context)
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="price_list.pdf"'
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-
-    if pisa_status.err:
-        return HttpResponse('Error generating PDF', status=400)
-    return response
+    return pdf.pdf_response(request, 'inventory/pdf_templates/price_list.html', context, 'price_list.pdf', as_attachment=True)
 
 @login_required
 def delete_purchase_order(request, purchase_order_id):
@@ -2008,9 +1955,9 @@ def process_received_order(request):
             inventory.cost = cost
             inventory.price = selling_price
             inventory.dealer_price = dealer_price
-            inventory.quantity += quantity
-            inventory.batch += f'{order.batch}, '
-            inventory.save()
+            inventory.batch = f'{inventory.batch or ""}{order.batch}, '
+            inventory.save(update_fields=['cost', 'price', 'dealer_price', 'batch'])
+            stock.move(inventory, int(quantity))
         except Inventory.DoesNotExist:
             # Create a new inventory object if it does not exist
             inventory = Inventory(
@@ -2177,7 +2124,7 @@ def edit_purchase_order(request, po_id):
             with transaction.atomic():
                 purchase_order = PurchaseOrder(
                     batch = batch,
-                    order_number=PurchaseOrder.generate_order_number(),
+                    order_number=PurchaseOrder.generate_order_number(request.user.branch.name),
                     supplier=supplier,
                     delivery_date=delivery_date,
                     status=status,
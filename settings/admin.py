@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from .models import NotificationsSettings
+from .models import NotificationsSettings, Printer, PrintJob
 
 admin.site.register(NotificationsSettings)
+admin.site.register(Printer)
+admin.site.register(PrintJob)
 
@@ -0,0 +1,132 @@
+"""
+ESC/POS receipts.
+
+A receipt goes to a thermal printer as ESC/POS bytes, no HTML or PDF in between. The fixed parts of a
+receipt (printer reset, alignment and emphasis switches, rules, the cut) and the row formats are compiled
+once per paper width into a ``Layout``. Printing an invoice is then two queries and a few string formats
+into those layouts. ``settings.spool`` sends the bytes to the printer.
+"""
+from functools import lru_cache
+from django.utils import timezone
+
+from finance.models import Invoice, InvoiceItem
+
+ENCODING = 'cp437'
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+INIT = ESC + b'@'
+CODEPAGE = ESC + b't\x00'  # PC437, matches ENCODING
+ALIGN_LEFT = ESC + b'a\x00'
+ALIGN_CENTER = ESC + b'a\x01'
+BOLD_ON = ESC + b'E\x01'
+BOLD_OFF = ESC + b'E\x00'
+SIZE_NORMAL = GS + b'!\x00'
+SIZE_DOUBLE = GS + b'!\x11'
+FEED_CUT = GS + b'V\x41\x04'  # feed four lines and partial cut
+
+
+def encode(text):
+    return text.encode(ENCODING, errors='replace')
+
+
+class Layout:
+    """ The byte and format pieces of a receipt for a paper ``width`` in characters. """
+
+    QUANTITY_WIDTH = 5
+    AMOUNT_WIDTH = 12
+
+    def __init__(self, width):
+        self.width = width
+        name_width = width - self.QUANTITY_WIDTH - self.AMOUNT_WIDTH
+
+        self.start = INIT + CODEPAGE + ALIGN_CENTER
+        self.title = BOLD_ON + SIZE_DOUBLE + b'%s\n' + SIZE_NORMAL + BOLD_OFF
+        self.body = ALIGN_LEFT
+        self.rule = encode('-' * width + '\n')
+        self.items_header = BOLD_ON + encode(
+            f'{"Item":<{name_width}}{"Qty":>{self.QUANTITY_WIDTH}}{"Amount":>{self.AMOUNT_WIDTH}}\n'
+        ) + BOLD_OFF
+        self.end = ALIGN_CENTER
+        self.cut = FEED_CUT
+
+        # wrapped names continue on their own lines under the first one
+        self.name_width = name_width
+        self.item_line = f'{{name:<{name_width}}}{{quantity:>{self.QUANTITY_WIDTH}}}{{amount:>{self.AMOUNT_WIDTH}}}\n'
+        self.name_line = '{name}\n'
+        self.field_line = f'{{label:<{width - 20}}}{{value:>20}}\n'
+        self.total_line = BOLD_ON + b'%s' + BOLD_OFF
+
+    def item(self, name, quantity, amount):
+        name = name or ''
+        lines = [self.item_line.format(name=name[:self.name_width], quantity=quantity, amount=amount)]
+        for start in range(self.name_width, len(name), self.name_width):
+            lines.append(self.name_line.format(name=name[start:start + self.name_width]))
+        return encode(''.join(lines))
+
+    def field(self, label, value):
+        return encode(self.field_line.format(label=label, value=value)[-self.width - 1:])
+
+    def centered(self, text):
+        return encode(f'{text}\n') if text else b''
+
+
+@lru_cache(maxsize=None)
+def layout(width):
+    return Layout(width)
+
+
+def money(symbol, amount):
+    return f'{symbol}{amount or 0:,.2f}'
+
+
+def render_receipt(invoice, items, width=48):
+    """ ESC/POS bytes of the receipt of ``invoice``, ``items`` are (name, quantity, total) rows. """
+    lines = layout(width)
+    branch = invoice.branch
+    symbol = invoice.currency.symbol if invoice.currency else ''
+
+    parts = [
+        lines.start,
+        lines.title % encode(branch.company.name),
+        lines.centered(branch.name),
+        lines.centered(branch.address),
+        lines.centered(branch.phonenumber),
+        lines.centered(branch.email),
+        lines.body,
+        lines.rule,
+        lines.field('Invoice', invoice.invoice_number),
+        lines.field('Date', timezone.localtime(invoice.issue_date).strftime('%d/%m/%Y %H:%M')),
+        lines.field('Customer', invoice.customer.name[:20]),
+        lines.field('Cashier', invoice.user.username[:20] if invoice.user else ''),
+        lines.rule,
+        lines.items_header,
+    ]
+    parts.extend(lines.item(name, quantity, money(symbol, total)) for name, quantity, total in items)
+    parts.append(lines.rule)
+
+    parts.append(lines.field('Sub Total', money(symbol, invoice.subtotal)))
+    if invoice.discount_amount:
+        parts.append(lines.field('Discount', money(symbol, invoice.discount_amount)))
+    parts.append(lines.field('VAT', money(symbol, invoice.vat)))
+    if invoice.delivery_charge:
+        parts.append(lines.field('Delivery', money(symbol, invoice.delivery_charge)))
+    parts.append(lines.total_line % lines.field('Total', money(symbol, invoice.amount)))
+    parts.append(lines.field('Paid', money(symbol, invoice.amount_paid)))
+    if invoice.amount_due:
+        parts.append(lines.field('Due', money(symbol, invoice.amount_due)))
+
+    parts.extend([lines.rule, lines.end, lines.centered('Thank you for your business'), lines.cut])
+    return b''.join(parts)
+
+
+def invoice_receipt(invoice_id, width=48, branch_id=None):
+    invoices = Invoice.objects.select_related('branch__company', 'currency', 'customer', 'user')
+    if branch_id is not None:
+        invoices = invoices.filter(branch_id=branch_id)
+    invoice = invoices.get(id=invoice_id)
+    items = InvoiceItem.objects.filter(invoice_id=invoice_id).order_by('id').values_list(
+        'item__product__name', 'quantity', 'total_amount'
+    )
+    return render_receipt(invoice, items, width)
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("settings", "0008_notificationssettings_recurring_invoices"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="printer",
+            name="connection",
+            field=models.CharField(
+                choices=[
+                    ("system", "System driver"),
+                    ("tcp", "Network (raw TCP)"),
+                    ("serial", "Serial"),
+                    ("file", "File"),
+                ],
+                default="system",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="printer",
+            name="line_width",
+            field=models.PositiveSmallIntegerField(default=48),
+        ),
+    ]
@@ -80,6 +80,12 @@ class NotificationsSettings(models.Model):
 
 # system printer settings
 class Printer(models.Model):
+    class Connection(models.TextChoices):
+        SYSTEM = 'system', 'System driver'
+        TCP = 'tcp', 'Network (raw TCP)'
+        SERIAL = 'serial', 'Serial'
+        FILE = 'file', 'File'
+
     name = models.CharField(max_length=100)
     address = models.CharField(max_length=100)
     printer_type = models.CharField(max_length=255, choices=(('bluetooth', 'Bluetooth'), ('system', 'System')))
@@ -92,6 +98,108 @@ class Printer(models.Model):
     system_uuid = models.CharField(max_length=255, blank=True, null=True)
     is_default = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    # raw ESC/POS receipts: the address is the host, serial device or sink directory and the port the
+    # TCP port or baud rate
+    connection = models.CharField(max_length=10, choices=Connection.choices, default=Connection.SYSTEM)
+    line_width = models.PositiveSmallIntegerField(default=48)
+    # raw printers print for the users of their branch only
+    branch = models.ForeignKey('company.Branch', on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return self.name
+
+
+# Raw receipt print jobs
+class PrintJob(models.Model):
+    """
+    ESC/POS bytes for one printer, written when the receipt is asked for and sent by the
+    ``settings.tasks.print_jobs`` task, see ``settings.spool``.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        PRINTING = 'printing', 'Printing'
+        PRINTED = 'printed', 'Printed'
+        FAILED = 'failed', 'Failed'
+
+    printer = models.ForeignKey(Printer, on_delete=models.CASCADE, related_name='jobs')
+    invoice = models.ForeignKey('finance.Invoice', on_delete=models.SET_NULL, null=True, blank=True)
+    user = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True)
+    data = models.BinaryField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    printed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['printer', 'status', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.printer} job {self.id} ({self.status})'
+
+
+# Email outbox
+class OutboxEmail(models.Model):
+    """
+    An email to one recipient, written in the transaction of the event it is about and sent by the
+    ``settings.tasks.drain_outbox`` task, see ``settings.outbox``.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    kind = models.CharField(max_length=50)
+    to_email = models.CharField(max_length=254)
+    from_email = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html = models.TextField(blank=True)
+    # [filename, template name, html] of each PDF, rendered when the email is sent
+    pdf_attachments = models.JSONField(default=list, blank=True)
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key', 'to_email'],
+                condition=models.Q(dedupe_key__isnull=False),
+                name='outbox_email_dedupe',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} to {self.to_email} ({self.status})'
+
+
+# Background file jobs
+class FileJob(models.Model):
+    """ A file built by a Celery task for the user who asked for it, see ``utils.jobs``. """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    id = models.CharField(max_length=32, primary_key=True)
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    # in the default storage, once the file is built
+    path = models.CharField(max_length=500, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.status})'
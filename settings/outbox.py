@@ -0,0 +1,220 @@
+"""
+Email outbox.
+
+``queue_email`` writes one ``OutboxEmail`` row per recipient in the current transaction, so an email
+exists exactly when the event it is about was committed, and a restart cannot lose it. Once the
+transaction commits the ``drain_outbox`` task is asked to run (the beat schedule runs it every minute as
+well). ``drain`` sends the due emails in batches over one SMTP connection. A batch is claimed in a short
+transaction that moves its emails ``CLAIM_LEASE`` into the future, so other drains pass over them; the
+PDFs are rendered and the emails sent after it has committed. A failed email is retried with exponential
+backoff and marked failed after ``MAX_ATTEMPTS``. When the SMTP connection itself fails the email is not
+to blame: the rest of the batch is released without using an attempt and the connection is opened again,
+once per drain. A ``dedupe_key`` makes a repeated event a no-op for a recipient that already has the email.
+"""
+import time
+import smtplib
+import datetime
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Avg, Count, F, Q
+from django.utils import timezone
+
+from utils import pdf
+from utils.transactions import batch_on_commit
+from .models import OutboxEmail
+
+import logging
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+BACKOFF = 60  # seconds, doubled on every attempt
+MAX_BACKOFF = 6 * 60 * 60
+TIME_BUDGET = 50  # seconds per drain, the beat runs it again in a minute
+RETENTION_DAYS = 30
+# a drain that died with a claimed batch leaves it to the next one after this
+CLAIM_LEASE = datetime.timedelta(minutes=10)
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+MAX_RECONNECTS = 1
+
+
+def queue_email(kind, subject, body, to, from_email=None, html='', pdf_attachments=(), dedupe_key=None):
+    """
+    Queues the email for every address in ``to``. ``pdf_attachments`` are (filename, template name, html)
+    triples, rendered through ``utils.pdf`` when the email goes out. Returns the number of rows written,
+    recipients that already have the ``dedupe_key`` are skipped. The unique constraint still drops a
+    duplicate queued by a concurrent transaction, the only case in which a skipped row is counted.
+    """
+    recipients = {address.strip() for address in to if address and address.strip()}
+    if not recipients:
+        logger.warning(f'[Outbox] {kind} email "{subject}" has no recipients')
+        return 0
+    if dedupe_key is not None:
+        recipients -= set(
+            OutboxEmail.objects.filter(dedupe_key=dedupe_key, to_email__in=recipients).values_list('to_email', flat=True)
+        )
+        if not recipients:
+            return 0
+
+    now = timezone.now()
+    rows = OutboxEmail.objects.bulk_create([
+        OutboxEmail(
+            kind=kind,
+            to_email=address,
+            from_email=from_email or settings.SYSTEM_EMAIL,
+            subject=subject,
+            body=body,
+            html=html or '',
+            pdf_attachments=[list(attachment) for attachment in pdf_attachments],
+            dedupe_key=dedupe_key,
+            next_attempt_at=now,
+        )
+        for address in sorted(recipients)
+    ], ignore_conflicts=dedupe_key is not None)
+
+    batch_on_commit('outbox', kind, request_drain)
+    return len(rows)
+
+
+def request_drain(kinds):
+    from .tasks import drain_outbox
+
+    try:
+        drain_outbox.delay()
+    except Exception as e:
+        # the beat schedule drains the outbox within a minute anyway
+        logger.warning(f'[Outbox] could not queue a drain: {e}')
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email, [email.to_email], connection=connection
+    )
+    if email.html:
+        message.attach_alternative(email.html, 'text/html')
+    for filename, template_name, html in email.pdf_attachments:
+        path = pdf.store(pdf.document_key(template_name, html), filename, html)
+        with default_storage.open(path) as stored:
+            message.attach(filename, stored.read(), 'application/pdf')
+    return message
+
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF))
+
+
+def claim(batch_size=BATCH_SIZE):
+    """ The next due emails, moved ``CLAIM_LEASE`` ahead so that other drains pass over them. """
+    now = timezone.now()
+    with transaction.atomic():
+        # rows another drain is claiming are skipped rather than waited on
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.Status.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(next_attempt_at=now + CLAIM_LEASE)
+    return emails
+
+
+def send_batch(connection, batch_size=BATCH_SIZE):
+    """
+    Sends one batch of due emails outside of any transaction, returns the (sent, failed) counts and whether
+    the SMTP connection was lost. The emails left when it is lost are due again at once, attempts unused.
+    """
+    sent = failed = 0
+    emails = claim(batch_size)
+    for index, email in enumerate(emails):
+        try:
+            build_message(email, connection).send()
+        except CONNECTION_ERRORS as e:
+            logger.warning(f'[Outbox] SMTP connection lost: {e}')
+            OutboxEmail.objects.filter(id__in=[email.id for email in emails[index:]]).update(next_attempt_at=timezone.now())
+            return sent, failed, True
+        except Exception as e:
+            failed += 1
+            email.attempts += 1
+            email.last_error = str(e)[:1000]
+            if email.attempts >= MAX_ATTEMPTS:
+                email.status = OutboxEmail.Status.FAILED
+                logger.error(f'[Outbox] {email.kind} email {email.id} to {email.to_email} failed for good: {e}')
+            else:
+                email.next_attempt_at = timezone.now() + backoff(email.attempts)
+        else:
+            sent += 1
+            email.attempts += 1
+            email.status = OutboxEmail.Status.SENT
+            email.sent_at = timezone.now()
+            email.last_error = ''
+        email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed, False
+
+
+def drain(batch_size=BATCH_SIZE, time_budget=TIME_BUDGET):
+    """ Sends due emails until none are left or the time budget is spent, over one SMTP connection. """
+    started = time.monotonic()
+    sent = failed = reconnects = 0
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.error(f'[Outbox] SMTP connection failed, emails stay queued: {e}')
+        return {'sent': 0, 'failed': 0, 'seconds': 0}
+
+    try:
+        while time.monotonic() - started < time_budget:
+            batch_sent, batch_failed, lost = send_batch(connection, batch_size)
+            sent += batch_sent
+            failed += batch_failed
+            if lost:
+                if reconnects == MAX_RECONNECTS:
+                    logger.error('[Outbox] SMTP connection lost again, emails stay queued')
+                    break
+                reconnects += 1
+                close_quietly(connection)
+                try:
+                    connection.open()
+                except Exception as e:
+                    logger.error(f'[Outbox] SMTP connection failed, emails stay queued: {e}')
+                    break
+                continue
+            if batch_sent + batch_failed < batch_size:
+                break
+    finally:
+        close_quietly(connection)
+
+    OutboxEmail.objects.filter(
+        status=OutboxEmail.Status.SENT,
+        sent_at__lt=timezone.now() - datetime.timedelta(days=RETENTION_DAYS),
+    ).delete()
+
+    seconds = time.monotonic() - started
+    if sent or failed:
+        logger.info(f'[Outbox] {sent} sent, {failed} failed in {seconds:.2f}s ({sent / seconds if seconds else 0:.1f}/s)')
+    return {'sent': sent, 'failed': failed, 'seconds': seconds}
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        # the connection is already gone
+        pass
+
+
+def stats(hours=24):
+    """ Outbox health: the backlog, failures and the send rate and delay over the last ``hours``. """
+    since = timezone.now() - datetime.timedelta(hours=hours)
+    totals = OutboxEmail.objects.aggregate(
+        pending=Count('id', filter=Q(status=OutboxEmail.Status.PENDING)),
+        retrying=Count('id', filter=Q(status=OutboxEmail.Status.PENDING, attempts__gt=0)),
+        failed=Count('id', filter=Q(status=OutboxEmail.Status.FAILED)),
+        sent=Count('id', filter=Q(status=OutboxEmail.Status.SENT, sent_at__gte=since)),
+        delay=Avg(F('sent_at') - F('created_at'), filter=Q(status=OutboxEmail.Status.SENT, sent_at__gte=since)),
+    )
+    totals['sent_per_hour'] = totals['sent'] / hours
+    totals['delay'] = totals['delay'].total_seconds() if totals['delay'] else None
+    return totals
@@ -0,0 +1,201 @@
+"""
+Raw ESC/POS receipt printing.
+
+``submit`` writes the receipt as a ``PrintJob`` row in the current transaction, so a job survives a
+restart, and once it commits the ``print_jobs`` task is asked to print it (the beat schedule runs it every
+minute as well, for jobs a restart or a lost task left behind). Any worker of any process can print, but a
+printer prints one job at a time, oldest first: a job is claimed under a short lock on its printer row,
+and while one is printing, under its ``LEASE``, no other job of the printer can be claimed. The bytes are
+sent after the claim has committed, no transaction stays open on the printer. A failed job is retried
+``RETRIES`` times before the next one, then marked failed, and the receipt page that polls it falls back
+to the browser print dialog.
+
+The backend follows ``Printer.connection``: raw TCP (port 9100 by default), serial (needs pyserial) or a
+file sink that writes every job to a directory. ``RECEIPT_PRINTER_SINK`` sends every printer to a file
+sink, for development and tests.
+"""
+import os
+import socket
+import time
+import uuid
+import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from utils.transactions import batch_on_commit
+from .models import Printer, PrintJob
+
+import logging
+logger = logging.getLogger(__name__)
+
+RETRIES = 2
+RETRY_DELAY = 0.5
+# a job printing for longer was left by a worker that died, it is claimed again
+LEASE = datetime.timedelta(minutes=1)
+RETENTION_DAYS = 7
+
+
+class PrinterError(Exception):
+    pass
+
+
+class TCPBackend:
+    def __init__(self, host, port=9100, timeout=3):
+        self.host = host
+        self.port = int(port or 9100)
+        self.timeout = timeout
+
+    def send(self, data):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as connection:
+            connection.sendall(data)
+
+
+class SerialBackend:
+    def __init__(self, device, baudrate=9600, timeout=3):
+        self.device = device
+        self.baudrate = int(baudrate or 9600)
+        self.timeout = timeout
+
+    def send(self, data):
+        try:
+            import serial
+        except ImportError:
+            raise PrinterError('Serial printers need the pyserial package')
+
+        with serial.Serial(self.device, self.baudrate, timeout=self.timeout, write_timeout=self.timeout) as connection:
+            connection.write(data)
+            connection.flush()
+
+
+class FileBackend:
+    def __init__(self, directory, name='printer'):
+        self.directory = directory
+        self.name = name
+
+    def send(self, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{self.name}-{time.time_ns()}-{uuid.uuid4().hex[:6]}.bin')
+        with open(path, 'wb') as sink:
+            sink.write(data)
+
+
+def backend_for(printer):
+    sink = getattr(settings, 'RECEIPT_PRINTER_SINK', None)
+    if sink:
+        return FileBackend(sink, f'printer{printer.id}')
+    if printer.connection == printer.Connection.TCP:
+        return TCPBackend(printer.address, printer.port)
+    if printer.connection == printer.Connection.SERIAL:
+        return SerialBackend(printer.address, printer.port)
+    if printer.connection == printer.Connection.FILE:
+        return FileBackend(printer.address, f'printer{printer.id}')
+    raise PrinterError(f'{printer.name} is printed to through the system driver, not raw ESC/POS')
+
+
+def submit(printer, data, invoice_id=None, user=None):
+    """ Queues ``data`` for the printer in the current transaction, it is printed once that commits. """
+    job = PrintJob.objects.create(printer=printer, data=data, invoice_id=invoice_id, user=user)
+    batch_on_commit('print_jobs', printer.id, request_print)
+    return job
+
+
+def request_print(printer_ids):
+    from .tasks import print_jobs
+
+    for printer_id in printer_ids:
+        try:
+            print_jobs.delay(printer_id)
+        except Exception as e:
+            # the beat schedule prints the queued jobs within a minute anyway
+            logger.warning(f'[Spool] could not queue printer {printer_id}: {e}')
+
+
+def claim(printer_id):
+    """ The next job of the printer marked as printing, None when it has none or another worker prints to it. """
+    now = timezone.now()
+    with transaction.atomic():
+        # the printer row orders the claims of every worker
+        if Printer.objects.select_for_update(no_key=True).filter(id=printer_id).values_list('id', flat=True).first() is None:
+            return None
+
+        jobs = PrintJob.objects.filter(printer_id=printer_id)
+        if jobs.filter(status=PrintJob.Status.PRINTING, claimed_at__gt=now - LEASE).exists():
+            return None
+
+        job = (
+            jobs.filter(Q(status=PrintJob.Status.QUEUED) | Q(status=PrintJob.Status.PRINTING))
+            .select_related('printer')
+            .order_by('id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = PrintJob.Status.PRINTING
+        job.claimed_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'claimed_at', 'attempts'])
+    return job
+
+
+def send(job):
+    """ Sends a claimed job to its printer, outside of any transaction. Returns the new status of the job. """
+    started = time.monotonic()
+    try:
+        backend_for(job.printer).send(bytes(job.data))
+    except Exception as e:
+        job.last_error = str(e)[:1000]
+        job.status = PrintJob.Status.FAILED if job.attempts > RETRIES else PrintJob.Status.QUEUED
+        if job.status == PrintJob.Status.FAILED:
+            logger.error(f'[Spool] {job.printer.name}: job {job.id} failed after {job.attempts} attempts: {e}')
+    else:
+        job.status = PrintJob.Status.PRINTED
+        job.printed_at = timezone.now()
+        job.last_error = ''
+        logger.info(f'[Spool] {job.printer.name}: {len(job.data)} bytes in {(time.monotonic() - started) * 1000:.0f} ms')
+
+    job.save(update_fields=['status', 'printed_at', 'last_error'])
+    return job.status
+
+
+def drain(printer_id):
+    """ Prints the queued jobs of the printer in order, until none are left or another worker has the printer. """
+    printed = failed = 0
+    while True:
+        job = claim(printer_id)
+        if job is None:
+            break
+
+        status = send(job)
+        if status == PrintJob.Status.PRINTED:
+            printed += 1
+        elif status == PrintJob.Status.FAILED:
+            failed += 1
+        else:
+            # back in the queue ahead of the others
+            time.sleep(RETRY_DELAY * job.attempts)
+    return {'printed': printed, 'failed': failed}
+
+
+def drain_all():
+    """ Prints the queued jobs of every printer and deletes the old printed ones. """
+    printed = failed = 0
+    now = timezone.now()
+    printer_ids = (
+        PrintJob.objects
+        .filter(Q(status=PrintJob.Status.QUEUED) | Q(status=PrintJob.Status.PRINTING, claimed_at__lte=now - LEASE))
+        .values_list('printer_id', flat=True)
+        .distinct()
+    )
+    for printer_id in list(printer_ids):
+        result = drain(printer_id)
+        printed += result['printed']
+        failed += result['failed']
+
+    PrintJob.objects.filter(
+        status=PrintJob.Status.PRINTED,
+        printed_at__lt=now - datetime.timedelta(days=RETENTION_DAYS),
+    ).delete()
+    return {'printed': printed, 'failed': failed}
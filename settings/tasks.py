@@ -0,0 +1,19 @@
+from celery import shared_task
+from . import outbox, spool
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def drain_outbox():
+    """ Sends the queued emails, see ``settings.outbox``. """
+    return outbox.drain()
+
+
+@shared_task
+def print_jobs(printer_id=None):
+    """ Prints the queued receipts of the printer, of every printer by default, see ``settings.spool``. """
+    if printer_id is None:
+        return spool.drain_all()
+    return spool.drain(printer_id)
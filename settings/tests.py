@@ -1,3 +1,229 @@
 from django.test import TestCase
 
 # Create your tests here.
+from django.db import connection
+from django.urls import reverse
+from django.test import override_settings
+from company.models import Company, Branch
+from users.models import User
+from utils import profiling
+from settings.models import Printer
+import os
+import re
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ProfilingTest(TestCase):
+    def setUp(self):
+        profiling.clear()
+        company = Company.objects.create(name='Techcity')
+        self.branch = Branch.objects.create(company=company, name='Harare')
+        self.user = User.objects.create_user(email='admin@techcity.co.zw', password='12345', username='admin', branch=self.branch)
+
+    def test_fingerprint_folds_values(self):
+        self.assertEqual(
+            profiling.fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'  LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?'
+        )
+
+    def test_repeated_queries_are_reported_with_a_stack(self):
+        recorder = profiling.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for branch in Branch.objects.all():
+                list(User.objects.filter(branch=branch))
+                list(User.objects.filter(branch=branch))
+                list(User.objects.filter(branch=branch))
+
+        self.assertEqual(recorder.count, 4)
+        duplicate, = recorder.duplicates()
+        self.assertEqual(duplicate['count'], 3)
+        self.assertTrue(any('settings/tests.py' in frame for frame in duplicate['stack']))
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_middleware_aggregates_per_url_name(self):
+        self.user.role = 'admin'
+        self.user.save()
+        self.client.force_login(self.user)
+
+        for i in range(2):
+            response = self.client.get(reverse('settings:profiling'))
+            self.assertEqual(response.status_code, 200)
+
+        endpoint, = profiling.worst_endpoints()
+        self.assertEqual(endpoint['endpoint'], 'settings:profiling')
+        self.assertEqual(endpoint['hits'], 2)
+        self.assertGreater(endpoint['avg_queries'], 0)
+        self.assertGreater(endpoint['avg_size'], 0)
+
+    def test_page_is_admin_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('settings:profiling'))
+        self.assertEqual(response.status_code, 403)
+
+
+class ReceiptPrintingTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from decimal import Decimal
+        from django.utils import timezone
+        from finance.models import Customer, Currency, Invoice, InvoiceItem, VATRate
+        from inventory.models import Product, Inventory
+
+        sink = tempfile.TemporaryDirectory()
+        self.addCleanup(sink.cleanup)
+        self.sink = sink.name
+
+        company = Company.objects.create(name='Techcity')
+        branch = Branch.objects.create(company=company, name='Harare', phonenumber='0242 000000')
+        self.user = User.objects.create_user(email='pos@techcity.co.zw', password='12345', username='pos', branch=branch)
+        self.invoice = Invoice.objects.create(
+            invoice_number='INV-0042',
+            customer=Customer.objects.create(name='Walk in', address='-', id_number='-', branch=branch),
+            issue_date=timezone.now(),
+            branch=branch,
+            user=self.user,
+            currency=Currency.objects.create(code='USD', name='US Dollar', symbol='$'),
+            amount=Decimal('23.00'),
+            subtotal=Decimal('20.00'),
+            vat=Decimal('3.00'),
+            amount_paid=Decimal('23.00'),
+            products_purchased='-',
+            payment_terms='cash',
+        )
+        InvoiceItem.objects.create(
+            invoice=self.invoice,
+            item=Inventory.objects.create(
+                branch=branch,
+                product=Product.objects.create(name='USB C fast charger with a very long product name', price=Decimal('10.00'), description='-'),
+                cost=Decimal('5.00'),
+                price=Decimal('10.00'),
+                quantity=10,
+            ),
+            quantity=2,
+            unit_price=Decimal('10.00'),
+            vat_rate=VATRate.objects.create(rate=Decimal('15.00'), status=True),
+        )
+        self.printer = Printer.objects.create(
+            name='Till 1', address=self.sink, port='', pc_identifier='till-1', connection=Printer.Connection.FILE, line_width=32, branch=branch
+        )
+        self.client.force_login(self.user)
+        self.client.cookies['pc_identifier'] = 'till-1'
+
+    def print_receipt(self, invoice_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('settings:print_receipt'), {'invoice_id': invoice_id}, content_type='application/json')
+        return response
+
+    def test_receipt_is_rendered_from_two_queries(self):
+        from settings import escpos
+
+        with self.assertNumQueries(2):
+            data = escpos.invoice_receipt(self.invoice.id, 32)
+
+        self.assertTrue(data.startswith(escpos.INIT))
+        self.assertTrue(data.endswith(escpos.FEED_CUT))
+        self.assertIn(b'INV-0042', data)
+        self.assertIn(b'$23.00', data)
+        text = re.sub(rb'\x1b@|\x1b[taE].|\x1d!.|\x1dV..', b'', data).decode(escpos.ENCODING)
+        self.assertEqual(max(len(line) for line in text.split('\n')), 32)
+
+    def test_print_is_a_job_the_page_can_follow(self):
+        response = self.print_receipt(self.invoice.id)
+        self.assertTrue(response.json()['success'])
+
+        receipt, = os.listdir(self.sink)
+        with open(os.path.join(self.sink, receipt), 'rb') as printed:
+            self.assertIn(b'INV-0042', printed.read())
+        self.assertEqual(self.client.get(response.json()['status_url']).json()['status'], 'printed')
+
+    def test_failed_job_is_reported_and_the_next_one_prints(self):
+        from unittest import mock
+        from settings import spool
+        from .models import PrintJob
+
+        with mock.patch.object(spool.FileBackend, 'send', side_effect=OSError('paper out')), mock.patch.object(spool, 'RETRY_DELAY', 0):
+            failed = self.print_receipt(self.invoice.id).json()
+        job = self.client.get(failed['status_url']).json()
+        self.assertEqual((job['success'], job['status'], job['error']), (False, 'failed', 'paper out'))
+        self.assertEqual(PrintJob.objects.get(id=failed['job_id']).attempts, spool.RETRIES + 1)
+
+        self.assertTrue(self.print_receipt(self.invoice.id).json()['success'])
+        self.assertEqual(len(os.listdir(self.sink)), 1)
+
+    def test_other_branches_cannot_print(self):
+        other = Branch.objects.create(company=self.invoice.branch.company, name='Bulawayo')
+        self.invoice.branch = other
+        self.invoice.save()
+        self.assertEqual(self.print_receipt(self.invoice.id).status_code, 404)
+
+        self.printer.branch = other
+        self.printer.save()
+        self.assertEqual(self.print_receipt(self.invoice.id).status_code, 404)
+
+    def test_no_raw_printer_falls_back(self):
+        self.printer.connection = Printer.Connection.SYSTEM
+        self.printer.save()
+
+        response = self.print_receipt(self.invoice.id)
+        self.assertEqual(response.status_code, 404)
+
+
+
+class OutboxTest(TestCase):
+    def queue(self, **kwargs):
+        from settings import outbox
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return outbox.queue_email('test', 'Transfer', 'Stock is on its way', ['a@techcity.co.zw', 'b@techcity.co.zw'], **kwargs)
+
+    def test_queued_emails_are_sent_once_per_recipient(self):
+        from django.core import mail
+        from settings.models import OutboxEmail
+
+        self.assertEqual(self.queue(dedupe_key='transfer:1'), 2)
+        self.assertEqual(self.queue(dedupe_key='transfer:1'), 0)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['a@techcity.co.zw', 'b@techcity.co.zw'])
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.Status.SENT).count(), 2)
+
+    def test_failed_email_is_retried_with_backoff(self):
+        from unittest import mock
+        from django.core import mail
+        from django.utils import timezone
+        from settings import outbox
+        from settings.models import OutboxEmail
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('refused')):
+            self.queue()
+        email = OutboxEmail.objects.first()
+        self.assertEqual(email.status, OutboxEmail.Status.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(outbox.stats()['retrying'], 2)
+
+        # not due yet
+        self.assertEqual(outbox.drain()['sent'], 0)
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.drain()['sent'], 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_lost_connection_is_reopened_without_using_attempts(self):
+        import smtplib
+        from unittest import mock
+        from settings import outbox
+        from settings.models import OutboxEmail
+
+        lost = smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=[lost, 1, 1]), \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+            self.queue()
+        self.assertEqual(open_connection.call_count, 2)
+        self.assertEqual(list(OutboxEmail.objects.values_list('status', 'attempts')), [(OutboxEmail.Status.SENT, 1)] * 2)
+
+        # lost again after the reconnect: the drain stops, the emails stay due
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=lost):
+            self.queue(dedupe_key='transfer:2')
+            self.assertEqual(outbox.drain(), {'sent': 0, 'failed': 0, 'seconds': mock.ANY})
+        pending = OutboxEmail.objects.filter(status=OutboxEmail.Status.PENDING)
+        self.assertEqual(list(pending.values_list('attempts', flat=True)), [0, 0])
+        self.assertEqual(outbox.stats()['retrying'], 0)
@@ -15,9 +15,14 @@ urlpatterns = [
     path('printer/system/add-printer/', add_printer, name='add_printer'),
     path('printer/system/get-printers/', get_printers, name='get_printers'),
     path('identify-pc-info', identify_pc, name='identify_pc'),
+    path('printer/receipt/', print_receipt, name='print_receipt'),
+    path('printer/receipt/<int:job_id>/', print_job_status, name='print_job_status'),
 
     # email
     path('email/config/save/',  save_email_config, name='save_email_config'),
     path('email/notification/status/', email_notification_status, name='email_notification_status'),
+
+    # profiling
+    path('profiling/', profiling_report, name='profiling'),
     
 ]
\ No newline at end of file
@@ -3,17 +3,22 @@ import environ
 import asyncio, settings
 from pathlib import Path
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.http import JsonResponse
 
 from utils.identify_pc import get_mac_address, get_system_uuid, get_hostname
 from .forms import EmailSettingsForm
-from techcity.settings import INVENTORY_EMAIL_NOTIFICATIONS_STATUS
+from techcity.settings import INVENTORY_EMAIL_NOTIFICATIONS_STATUS, PROFILING_ENABLED
+from utils import profiling
+from finance.models import Invoice
+from . import escpos, spool
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from permissions.permissions import admin_required
 
 import logging
 
-from .models import NotificationsSettings, Printer
+from .models import NotificationsSettings, Printer, PrintJob
 
 logger = logging.getLogger(__name__)
 
@@ -337,6 +342,77 @@ def get_printers(request):
 
     return JsonResponse({"success": True, "printers": printer_list}, status=200)
 
+# >>>>>>>>>>>>>>>>>>>>>>>>>>>>>> Receipt printing >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+
+@require_http_methods(["POST"])
+@login_required
+def print_receipt(request):
+    """
+    Prints the receipt of an invoice as raw ESC/POS, on the given printer or the default receipt printer
+    of the PC.
+
+        payload: {"invoice_id": 1, "printer_id": 2}
+    """
+    try:
+        payload = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    printers = Printer.objects.filter(is_active=True, branch_id=request.user.branch_id).exclude(connection=Printer.Connection.SYSTEM)
+    if payload.get('printer_id'):
+        printer = printers.filter(id=payload['printer_id']).first()
+    else:
+        printer = printers.filter(pc_identifier=request.COOKIES.get('pc_identifier')).order_by('-is_default', 'id').first()
+
+    # the receipt page falls back to the browser print dialog
+    if printer is None:
+        return JsonResponse({'success': False, 'error': 'No receipt printer configured'}, status=404)
+
+    try:
+        data = escpos.invoice_receipt(payload.get('invoice_id'), printer.line_width, branch_id=request.user.branch_id)
+    except (Invoice.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invoice not found'}, status=404)
+
+    job = spool.submit(printer, data, invoice_id=payload.get('invoice_id'), user=request.user)
+    return JsonResponse({
+        'success': True,
+        'printer': printer.name,
+        'bytes': len(data),
+        'job_id': job.id,
+        'status_url': reverse('settings:print_job_status', args=[job.id]),
+    })
+
+
+@login_required
+def print_job_status(request, job_id):
+    """ Where a receipt print job is at, the receipt page falls back to the print dialog when it failed. """
+    job = PrintJob.objects.filter(id=job_id, printer__branch_id=request.user.branch_id).values('status', 'last_error').first()
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Print job not found'}, status=404)
+    return JsonResponse({
+        'success': job['status'] != PrintJob.Status.FAILED,
+        'status': job['status'],
+        'error': job['last_error'],
+    })
+
+
+# >>>>>>>>>>>>>>>>>>>>>>>>>>>>>> Profiling >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+
+@login_required
+@admin_required
+def profiling_report(request):
+    if request.method == 'POST':
+        profiling.clear()
+        return redirect('settings:profiling')
+
+    order_by = request.GET.get('order_by', 'time')
+    return render(request, 'settings/profiling.html', {
+        'enabled': PROFILING_ENABLED,
+        'order_by': order_by,
+        'endpoints': profiling.worst_endpoints(order_by),
+        'recent': profiling.recent(50),
+    })
+
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>> DONE >>>>>>>>>>>>>>>>>>>>>>>>...
 
 async def get_bluetooth_device(address):
@@ -1,18 +1,25 @@
 import os
-from channels.auth import AuthMiddlewareStack 
-from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
-import inventory.routing
-import finance.routing
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "techcity.settings")
 
+# the apps are loaded before the routing imports the consumers and their models
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+import inventory.routing
+import finance.routing
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),  
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            inventory.routing.websocket_urlpatterns, 
-            finance.routing.websocket_urlpatterns, 
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        AuthMiddlewareStack(
+            URLRouter(
+                inventory.routing.websocket_urlpatterns
+                + finance.routing.websocket_urlpatterns
+            )
         )
     ),
 })
@@ -32,12 +32,15 @@ ALLOWED_HOSTS = ['*', 'web-production-86a7.up.railway.app']
 # Application definition
 
 DJANGO_APPS = [
+    # ASGI runserver, ahead of staticfiles
+    "daphne",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 ]
 
 THIRD_PARTY_APPS = [
@@ -80,6 +83,7 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     
     # custom middlewares
+    'inventory.middleware.ProfilingMiddleware',
     'inventory.middleware.RequestMiddleware',
     'company.middleware.CompanySetupMiddleware'
     
@@ -121,7 +125,16 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 
 WSGI_APPLICATION = "techcity.wsgi.application"
-ASGI_APPLICATION = 'techcity.wsgi.application'
+ASGI_APPLICATION = 'techcity.asgi.application'
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            'hosts': [os.getenv('REDIS_CHANNEL_URL', 'redis://localhost:6379/2')],
+        },
+    },
+}
 AUTH_USER_MODEL = 'users.User'
 
 SESSION_AUTH = True
@@ -156,6 +169,32 @@ if 'test' in sys.argv:
     }
 
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
+
+# cache, shared by all the workers so that signal invalidation reaches every process
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('REDIS_CACHE_URL', 'redis://localhost:6379/1'),
+        'OPTIONS': {
+            'SOCKET_CONNECT_TIMEOUT': 1,
+            'IGNORE_EXCEPTIONS': True,
+        },
+    }
+}
+
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    # tasks queued on commit, the email outbox drain for one, run in the test
+    CELERY_TASK_ALWAYS_EAGER = True
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
 # https://docs.djangoproject.com/en/stable/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -258,12 +297,44 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# task modules outside the apps
+CELERY_IMPORTS = ('utils.pdf',)
 
 CELERY_BEAT_SCHEDULE = {
     'run-all-invoices-recurring': {
         'task': 'finance.tasks.generate_recurring_invoices',
         'schedule': 60.0, 
     },
+    'send-low-stock-digest': {
+        'task': 'inventory.tasks.send_low_stock_digest',
+        'schedule': 15 * 60.0,
+    },
+    # at most reminders.MAX_PER_RUN customers an hour
+    'send-invoice-reminders': {
+        'task': 'finance.tasks.check_and_send_invoice_reminders',
+        'schedule': 60 * 60.0,
+    },
+    'rebuild-daily-rollups': {
+        'task': 'finance.tasks.rebuild_daily_rollups',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'take-stock-snapshots': {
+        'task': 'inventory.tasks.take_stock_snapshots',
+        'schedule': 24 * 60 * 60.0,
+    },
+    # picks up the emails whose on commit drain was missed and the retries
+    'drain-email-outbox': {
+        'task': 'settings.tasks.drain_outbox',
+        'schedule': 60.0,
+    },
+    'print-queued-receipts': {
+        'task': 'settings.tasks.print_jobs',
+        'schedule': 60.0,
+    },
+    'compact-notifications': {
+        'task': 'Dashboard.tasks.compact_notifications',
+        'schedule': 24 * 60 * 60.0,
+    },
 }
 
 
@@ -297,7 +368,18 @@ DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 LOW_STOCK_THRESHHOLD =  6
 INVENTORY_EMAIL_NOTIFICATIONS_STATUS = True
 
+# spreadsheets with more rows than this are built in the background, see inventory.reports
+REPORT_BACKGROUND_ROWS = env.int('REPORT_BACKGROUND_ROWS', 5000)
+
 # system email 
 SYSTEM_EMAIL = 'system@techcity.co.zw'
 
+# document numbers reserved per worker at a time (invoices, transfers, quotations, purchase orders)
+DOCUMENT_SEQUENCE_BLOCK_SIZE = 20
+
+# request profiling (query count, db time, repeated queries), see settings:profiling
+PROFILING_ENABLED = env.bool('PROFILING_ENABLED', False)
+PROFILING_SAMPLE_SIZE = 500
 
+# raw ESC/POS receipts of every printer are written to this directory instead, see settings.spool
+RECEIPT_PRINTER_SINK = env('RECEIPT_PRINTER_SINK', default=None)
@@ -4,6 +4,7 @@ from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import include, path
 from django.views import defaults as default_views
+from utils.jobs import job_status
 
 urlpatterns = [
     path('pos/', include('pos.urls', namespace='pos')),
@@ -15,6 +16,7 @@ urlpatterns = [
     # path('analytics/', include('Analytics.urls', namespace='analytics')),
     path('inventory/', include('inventory.urls', namespace='inventory')),
     path('dashboard/', include('Dashboard.urls', namespace='dashboard')),
+    path('jobs/<str:job_id>/', job_status, name='job_status'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG:
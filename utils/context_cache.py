@@ -0,0 +1,36 @@
+"""
+Cached values for the template context processors.
+
+Every page runs all the context processors, so their values are handed to the template as lazy objects:
+nothing is read until a template uses the value, and then it comes from the cache, falling back to the
+database on a miss. Values are kept per branch and dropped by the model signals once the change commits.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+TIMEOUT = 60 * 60
+
+
+def cache_key(name, branch_id=None):
+    return f'context:{name}:{branch_id or "all"}'
+
+
+def cached_value(name, compute, branch_id=None, timeout=TIMEOUT):
+    key = cache_key(name, branch_id)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def lazy_value(name, compute, branch_id=None, timeout=TIMEOUT):
+    """ Lazy template value for ``name``, ``compute`` is only called on a cache miss. """
+    return SimpleLazyObject(lambda: cached_value(name, compute, branch_id, timeout))
+
+
+def invalidate(*names, branch_id=None):
+    """ Drops the cached values once the current transaction commits. """
+    keys = [cache_key(name, branch_id) for name in names]
+    transaction.on_commit(lambda: cache.delete_many(keys))
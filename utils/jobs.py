@@ -0,0 +1,72 @@
+"""
+Background file jobs.
+
+A file too big to build within a request is built by a Celery task instead. The job is a ``FileJob`` row
+with the user who asked for it, its status and, once the file is saved to the default storage, its path.
+It is written in the request transaction and the task is queued on commit, so the worker always finds it.
+The ``job.html`` page polls ``job_status`` until the download link is ready.
+"""
+import uuid
+from datetime import timedelta
+from django.contrib.auth.decorators import login_required
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.utils import timezone
+
+from settings.models import FileJob
+
+PENDING = FileJob.Status.PENDING
+DONE = FileJob.Status.DONE
+FAILED = FileJob.Status.FAILED
+
+TIMEOUT = timedelta(days=1)
+
+
+def create(user_id, filename):
+    # expired jobs go as new ones come in, their files stay in the storage
+    FileJob.objects.filter(created_at__lt=timezone.now() - TIMEOUT).delete()
+    return FileJob.objects.create(id=uuid.uuid4().hex, user_id=user_id, filename=filename).id
+
+
+def get(job_id, user_id=None):
+    """ The job, None when it is unknown, expired or, given ``user_id``, belongs to someone else. """
+    jobs = FileJob.objects.filter(id=job_id, created_at__gte=timezone.now() - TIMEOUT)
+    if user_id is not None:
+        jobs = jobs.filter(user_id=user_id)
+    return jobs.values('id', 'user_id', 'filename', 'status', 'path', 'error').first()
+
+
+def update(job_id, **values):
+    FileJob.objects.filter(id=job_id).update(**values)
+    return get(job_id)
+
+
+def done(job_id, path):
+    return update(job_id, status=DONE, path=path)
+
+
+def finish(job_id, output):
+    """ Saves the ``output`` file under the job and marks the job done. """
+    job = get(job_id)
+    filename = job['filename'] if job else f'{job_id}'
+    return done(job_id, default_storage.save(f'jobs/{job_id}/{filename}', File(output, name=filename)))
+
+
+def fail(job_id, error):
+    return update(job_id, status=FAILED, error=str(error))
+
+
+@login_required
+def job_status(request, job_id):
+    job = get(job_id, request.user.id)
+    if job is None:
+        return JsonResponse({'success': False, 'message': 'Job not found'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'status': job['status'],
+        'filename': job['filename'],
+        # built on every poll, storage URLs can be signed and short lived
+        'url': default_storage.url(job['path']) if job['path'] else None,
+    })
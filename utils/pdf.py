@@ -0,0 +1,123 @@
+"""
+PDF documents rendered off the request.
+
+xhtml2pdf takes seconds on a long document, so a view only renders the template to HTML and the
+``render_pdf`` Celery task turns it into a PDF. The PDF is stored in the default storage under a hash of
+the template name and the rendered HTML, that is of the context data as it is printed. A reprint of the
+same invoice or transfer note finds the stored file and is served straight away, a new document gets a
+job (see ``utils.jobs``) that the browser polls.
+"""
+import hashlib
+from io import BytesIO
+from celery import shared_task
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, JsonResponse
+from django.shortcuts import render
+from django.template.loader import get_template
+from django.urls import reverse
+from xhtml2pdf import pisa
+
+from . import jobs
+
+import logging
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 7 * 24 * 60 * 60
+
+
+class PDFError(Exception):
+    pass
+
+
+def render_html(template_name, context, request=None):
+    return get_template(template_name).render(context, request)
+
+
+def document_key(template_name, html):
+    return hashlib.sha256(f'{template_name}\0{html}'.encode()).hexdigest()
+
+
+def cache_key(key):
+    return f'pdf:{key}'
+
+
+def stored_path(key, filename):
+    """ Storage path of the PDF of the document, None when it has not been rendered yet. """
+    path = cache.get(cache_key(key))
+    if path is None and default_storage.exists(f'documents/{key}/{filename}'):
+        path = f'documents/{key}/{filename}'
+        cache.set(cache_key(key), path, TIMEOUT)
+    return path
+
+
+def render_bytes(html):
+    buffer = BytesIO()
+    status = pisa.CreatePDF(html, dest=buffer)
+    if status.err:
+        raise PDFError(f'{status.err} errors rendering the PDF')
+    return buffer.getvalue()
+
+
+def store(key, filename, html):
+    """ Renders and stores the PDF of the document unless it is stored already, returns its path. """
+    path = stored_path(key, filename)
+    if path is None:
+        path = default_storage.save(f'documents/{key}/{filename}', ContentFile(render_bytes(html)))
+        cache.set(cache_key(key), path, TIMEOUT)
+    return path
+
+
+@shared_task
+def render_pdf(job_id, key, filename, html):
+    try:
+        jobs.done(job_id, store(key, filename, html))
+    except Exception as e:
+        logger.error(f'PDF {filename} for job {job_id}: {e}', exc_info=True)
+        jobs.fail(job_id, e)
+
+
+def queue(user_id, key, filename, html):
+    job_id = jobs.create(user_id, filename)
+    transaction.on_commit(lambda: render_pdf.delay(job_id, key, filename, html))
+    return job_id
+
+
+def queue_document(request, template_name, context, filename):
+    """ Job id of the rendering of the document, a stored copy makes it a job that is done already. """
+    html = render_html(template_name, context, request)
+    key = document_key(template_name, html)
+
+    path = stored_path(key, filename)
+    if path is not None:
+        job_id = jobs.create(request.user.id, filename)
+        jobs.done(job_id, path)
+        return job_id
+    return queue(request.user.id, key, filename, html)
+
+
+def document(template_name, context, filename):
+    """ Bytes of the PDF, rendered here unless a copy is stored. For tasks, email attachments for instance. """
+    html = render_html(template_name, context)
+    with default_storage.open(store(document_key(template_name, html), filename, html)) as stored:
+        return stored.read()
+
+
+def pdf_response(request, template_name, context, filename, as_attachment=False):
+    """
+    The stored PDF of the document when there is one. Otherwise a job renders it and the response is the
+    job id for a ``fetch`` that accepts JSON, or a page that waits on the job for a browser.
+    """
+    html = render_html(template_name, context)
+    key = document_key(template_name, html)
+
+    path = stored_path(key, filename)
+    if path is not None:
+        return FileResponse(default_storage.open(path), as_attachment=as_attachment, filename=filename, content_type='application/pdf')
+
+    job_id = queue(request.user.id, key, filename, html)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'success': True, 'job_id': job_id, 'status_url': reverse('job_status', args=[job_id])}, status=202)
+    return render(request, 'job.html', {'job_id': job_id, 'filename': filename})
@@ -0,0 +1,151 @@
+"""
+Request profiling samples.
+
+``inventory.middleware.ProfilingMiddleware`` records one sample per request: query count, database time,
+Python time, response size and the SQL fingerprints that ran more than once (the usual N+1 pattern),
+with a stack trace of where the repeated query came from. Samples go into a ring buffer and are
+aggregated per URL name. Everything is kept in the memory of the worker process.
+"""
+import re
+import time
+import threading
+import traceback
+from collections import deque, Counter
+from django.conf import settings
+
+SAMPLE_SIZE = getattr(settings, 'PROFILING_SAMPLE_SIZE', 500)
+DUPLICATE_THRESHOLD = getattr(settings, 'PROFILING_DUPLICATE_THRESHOLD', 3)
+STACK_LIMIT = 8
+
+_lock = threading.Lock()
+samples = deque(maxlen=SAMPLE_SIZE)
+endpoints = {}
+
+_strings = re.compile(r"'(?:[^']|'')*'")
+_numbers = re.compile(r'\b\d+(?:\.\d+)?\b')
+_in_lists = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_spaces = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """ The SQL with literals and IN lists folded, so the same query with other values matches. """
+    sql = _strings.sub('?', sql)
+    sql = _numbers.sub('?', sql)
+    sql = _in_lists.sub('IN (...)', sql)
+    return _spaces.sub(' ', sql).strip()
+
+
+def app_stack():
+    """ Stack of the current query without the Django and library frames. """
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if 'site-packages' not in frame.filename and 'utils/profiling' not in frame.filename.replace('\\', '/')
+    ]
+    return [f'{frame.filename}:{frame.lineno} in {frame.name}' for frame in frames[-STACK_LIMIT:]]
+
+
+class QueryRecorder:
+    """ Database execute wrapper collecting the queries of one request. """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            # only repeated queries need a stack, and one example is enough
+            if self.fingerprints[key] == 2:
+                self.stacks[key] = app_stack()
+
+    def duplicates(self):
+        return [
+            {'sql': sql, 'count': count, 'stack': self.stacks.get(sql, [])}
+            for sql, count in self.fingerprints.most_common()
+            if count >= DUPLICATE_THRESHOLD
+        ]
+
+
+def record(endpoint, method, path, status, total, recorder, size):
+    sample = {
+        'endpoint': endpoint,
+        'method': method,
+        'path': path,
+        'status': status,
+        'time': total,
+        'db_time': recorder.duration,
+        'python_time': max(total - recorder.duration, 0),
+        'queries': recorder.count,
+        'duplicates': recorder.duplicates(),
+        'size': size,
+        'timestamp': time.time(),
+    }
+
+    with _lock:
+        samples.append(sample)
+
+        stats = endpoints.setdefault(endpoint, {
+            'endpoint': endpoint,
+            'hits': 0,
+            'time': 0.0,
+            'max_time': 0.0,
+            'db_time': 0.0,
+            'queries': 0,
+            'max_queries': 0,
+            'size': 0,
+            'worst': None,
+        })
+        stats['hits'] += 1
+        stats['time'] += sample['time']
+        stats['db_time'] += sample['db_time']
+        stats['queries'] += sample['queries']
+        stats['size'] += size
+        stats['max_queries'] = max(stats['max_queries'], sample['queries'])
+        if sample['time'] >= stats['max_time']:
+            stats['max_time'] = sample['time']
+            stats['worst'] = sample
+    return sample
+
+
+def worst_endpoints(order_by='time', limit=50):
+    """ Per endpoint averages, slowest (or ``order_by``) first. """
+    with _lock:
+        rows = [dict(stats) for stats in endpoints.values()]
+
+    for row in rows:
+        hits = row['hits']
+        row['avg_time'] = row['time'] / hits
+        row['avg_db_time'] = row['db_time'] / hits
+        row['avg_python_time'] = max(row['avg_time'] - row['avg_db_time'], 0)
+        row['avg_queries'] = row['queries'] / hits
+        row['avg_size'] = row['size'] / hits
+        row['duplicates'] = row['worst']['duplicates'] if row['worst'] else []
+
+    key = {
+        'time': 'avg_time',
+        'db_time': 'avg_db_time',
+        'queries': 'avg_queries',
+        'hits': 'hits',
+        'size': 'avg_size',
+    }.get(order_by, 'avg_time')
+    return sorted(rows, key=lambda row: row[key], reverse=True)[:limit]
+
+
+def recent(limit=100):
+    with _lock:
+        return list(samples)[-limit:][::-1]
+
+
+def clear():
+    with _lock:
+        samples.clear()
+        endpoints.clear()
@@ -0,0 +1,142 @@
+"""
+Document number allocation.
+
+Numbers are kept in ``company.DocumentSequence`` rows, one row per document type and printed prefix.
+On PostgreSQL a worker reserves a block of numbers at a time on its own autocommit connection, so the
+reservation is never rolled back with the business transaction and the numbers in the block are handed
+out from memory. Each key has its own lock, held only while a number is taken from memory: threads that
+find the block of their key empty reserve blocks in parallel, each on its thread's connection, and the
+row lock in the database orders them. On other databases (SQLite in tests) numbers are allocated one at
+a time in the current transaction, one thread per key at a time.
+"""
+import threading
+from django.conf import settings
+from django.db import connection, connections, transaction, DatabaseError
+from django.db.models import F
+
+import logging
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = getattr(settings, 'DOCUMENT_SEQUENCE_BLOCK_SIZE', 20)
+
+# guards _key_locks and reset()
+_lock = threading.Lock()
+_key_locks = {}
+# {key: [[next, last], ...]} reserved numbers not handed out yet, oldest block first
+_blocks = {}
+_local = threading.local()
+
+
+def next_number(key, seed=None, block_size=None):
+    """
+    Returns the next number for ``key``.
+
+    ``seed`` is called once, when the counter row does not exist yet, and should return the highest
+    number already in use so that numbering carries on from existing documents.
+    """
+    block_size = block_size or BLOCK_SIZE
+    lock = _key_lock(key)
+
+    if connection.vendor != 'postgresql':
+        with lock:
+            return _allocate_in_transaction(key, seed)
+
+    with lock:
+        value = _take(key)
+    if value is not None:
+        return value
+
+    last_value = _reserve_block(key, seed, block_size)
+    with lock:
+        if block_size > 1:
+            _blocks.setdefault(key, []).append([last_value - block_size + 2, last_value])
+    return last_value - block_size + 1
+
+
+def reset():
+    """ Drops the numbers reserved by this process, mainly for tests. """
+    with _lock:
+        _blocks.clear()
+
+
+def _key_lock(key):
+    with _lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def _take(key):
+    """ The next reserved number of ``key`` from memory, None when its blocks are used up. """
+    blocks = _blocks.get(key)
+    while blocks:
+        block = blocks[0]
+        if block[0] <= block[1]:
+            block[0] += 1
+            return block[0] - 1
+        blocks.pop(0)
+    return None
+
+
+def release():
+    """ Closes the sequence connection of the current thread. """
+    conn = getattr(_local, 'connection', None)
+    if conn is not None:
+        conn.close()
+        _local.connection = None
+
+
+def _allocate_in_transaction(key, seed):
+    from company.models import DocumentSequence
+
+    with transaction.atomic():
+        sequence = DocumentSequence.objects.select_for_update().filter(key=key).first()
+        if sequence is None:
+            sequence = DocumentSequence.objects.create(key=key, last_value=seed() if seed else 0)
+        DocumentSequence.objects.filter(pk=sequence.pk).update(last_value=F('last_value') + 1)
+        sequence.refresh_from_db(fields=['last_value'])
+    return sequence.last_value
+
+
+def _sequence_connection():
+    conn = getattr(_local, 'connection', None)
+    if conn is None:
+        conn = connections.create_connection('default')
+        _local.connection = conn
+    return conn
+
+
+def _reserve_block(key, seed, block_size):
+    from company.models import DocumentSequence
+
+    table = connection.ops.quote_name(DocumentSequence._meta.db_table)
+    update = f'UPDATE {table} SET last_value = last_value + %s WHERE key = %s RETURNING last_value'
+    insert = f'INSERT INTO {table} (key, last_value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING'
+
+    for attempt in range(2):
+        conn = _sequence_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(update, [block_size, key])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute(insert, [key, seed() if seed else 0])
+                    cursor.execute(update, [block_size, key])
+                    row = cursor.fetchone()
+            return row[0]
+        except DatabaseError as e:
+            # stale connection, open a new one and try again
+            logger.warning(f'Document sequence {key}: {e}')
+            release()
+            if attempt:
+                raise
+
+
+def max_number(queryset, field, prefix, separator='-'):
+    """ Highest number used by documents whose ``field`` starts with ``prefix``, used as a seed. """
+    highest = 0
+    values = queryset.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+    for value in values.iterator():
+        try:
+            highest = max(highest, int(value.rsplit(separator, 1)[1]))
+        except (IndexError, ValueError):
+            continue
+    return highest
@@ -0,0 +1,42 @@
+"""
+Work batched per database transaction.
+
+``batch_on_commit`` collects items under a name for the current transaction and calls the handler once,
+with all of them, after the transaction commits. Outside a transaction the handler runs straight away.
+"""
+import threading
+from django.db import connection, transaction
+
+_local = threading.local()
+
+
+class Batch:
+    def __init__(self, handler):
+        self.handler = handler
+        self.items = set()
+        self.flushed = False
+
+    def flush(self):
+        self.flushed = True
+        if self.items:
+            self.handler(self.items)
+
+
+def batch_on_commit(name, item, handler):
+    """ Adds ``item`` to the ``name`` batch of the current transaction, ``handler(items)`` runs on commit. """
+    if not connection.in_atomic_block:
+        handler({item})
+        return
+
+    batches = getattr(_local, 'batches', None)
+    if batches is None:
+        batches = _local.batches = {}
+
+    batch = batches.get(name)
+    # a batch whose hook is gone belongs to a transaction that was rolled back
+    pending = [hook[1] for hook in connection.run_on_commit]
+    if batch is None or batch.flushed or batch.flush not in pending:
+        batch = batches[name] = Batch(handler)
+        transaction.on_commit(batch.flush)
+
+    batch.items.add(item)
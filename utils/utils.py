@@ -1,13 +1,16 @@
 from django.http import HttpResponse
 from django.template.loader import get_template
 from xhtml2pdf import pisa
-import threading
-from django.core.mail import send_mail
+from . import pdf
 
 import logging
 logger = logging.getLogger(__name__)
 
-def generate_pdf(template_src, context_dict={}):
+def generate_pdf(template_src, context_dict={}, request=None, filename='document.pdf'):
+    """ Renders the template as a PDF, off the request and through the stored copies when given the request. """
+    if request is not None:
+        return pdf.pdf_response(request, template_src, context_dict, filename)
+
     template = get_template(template_src)
     html = template.render(context_dict)
     response = HttpResponse(content_type="application/pdf")
@@ -17,30 +20,3 @@ def generate_pdf(template_src, context_dict={}):
         return HttpResponse("Some errors were encountered <pre>" + html + "</pre>")
 
     return response
-
-def send_mail_func(subject, message, html_content, from_email, to_email):
-    
-    def send_email_thread(subject, html_content, from_email, to_email):
-        try:
-            send_mail(
-                subject,
-                message,
-                from_email,
-                to_email,
-                html_message=html_content,  
-                fail_silently=False,
-            )
-            logger.info(f"[Email] -> Email sent successfully to {to_email} from {from_email}")
-        except Exception as e:
-            logger.info(f"[Email] -> Failed to send email: {e}")
-
-    email_thread = threading.Thread(
-        target=send_email_thread,
-        args=(subject, html_content, from_email, to_email),
-    )
-    email_thread.start()
-
-
-
-
-